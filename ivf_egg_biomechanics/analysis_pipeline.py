@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from measurement import PatientKeys
+from measurement_analyzer import MeasurementAnalyzer
+from instrumentation import StageRecorder
+
+
+class AnalysisJob(object):
+    """
+    A measurement together with the files it is analyzed from.
+
+    A video may contain several measurements, e.g. several aspirations of
+    an oocyte or several oocytes. Each is a job with the same video path and
+    its own frame before the movement and region of interest. The
+    aspirations of an oocyte are told apart by the ASPIRATION number of
+    their measurements.
+    """
+
+    def __init__(self, measurement, video_path, pressure_path, time_valve_opened=None,
+                 roi_center=None):
+        """
+        Initialize an analysis job.
+
+        Args:
+            measurement (Measurement):  the measurement to analyze
+            video_path (str):           full path to the video file
+            pressure_path (str):        full path to the pressure log file
+            time_valve_opened (int):    frame number before the first movement,
+                                        selected by the user if None
+            roi_center (tuple):         center (x, y) of the region of interest,
+                                        selected by the user if None
+        """
+        self.measurement = measurement
+        self.video_path = video_path
+        self.pressure_path = pressure_path
+        self.time_valve_opened = time_valve_opened
+        self.roi_center = roi_center
+
+
+class AnalysisPipeline(object):
+    """
+    Analyze a queue of measurements as a pipeline.
+
+    While the user annotates measurement N on the main thread, the video and
+    pressure files of the next measurements are decoded and parsed and the
+    tracking and fitting of the already annotated measurements runs on
+    background threads. Consecutive jobs of the same video are loaded
+    together: the video is decoded once and each job cuts its own frames
+    out of the shared decoded frames.
+    """
+
+    def __init__(self, prefetch=1, workers=2, recorder=None, analyzer_options=None):
+        """
+        Initialize an instance of the pipeline.
+
+        Args:
+            prefetch (int): number of measurements loaded ahead of the one
+                            being annotated
+            workers (int):  number of background threads
+            recorder (StageRecorder): recorder shared by the analyzers of
+                            all jobs, a new one if None
+            analyzer_options (dict): keyword arguments of the
+                            MeasurementAnalyzer of each job, e.g.
+                            {'trace_archive': archive}
+        """
+        if not isinstance(prefetch, int) or prefetch < 0:
+            raise ValueError('Expected a non-negative int for prefetch, '
+                             'but got {} instead.'.format(prefetch))
+        if not isinstance(workers, int) or workers < 1:
+            raise ValueError('Expected a positive int for workers, '
+                             'but got {} instead.'.format(workers))
+        self.prefetch = prefetch
+        self.workers = workers
+        self.recorder = StageRecorder() if recorder is None else recorder
+        self.analyzer_options = {} if analyzer_options is None else dict(analyzer_options)
+
+    def _load(self, jobs):
+        """ Load the jobs of one video, which is decoded only once """
+        analyzers = [MeasurementAnalyzer(job.measurement, recorder=self.recorder,
+                                         **self.analyzer_options)
+                     for job in jobs]
+        if len(jobs) == 1:
+            return [analyzers[0].load(jobs[0].video_path, jobs[0].pressure_path)]
+        frames, frame_rate = analyzers[0].decode(jobs[0].video_path)
+        return [analyzer.load_decoded(frames, frame_rate, job.pressure_path)
+                for analyzer, job in zip(analyzers, jobs)]
+
+    def run(self, jobs, manual=False, annotated=None):
+        """
+        Analyze all jobs. The annotation of the measurements happens in the
+        order of the jobs on the calling thread.
+
+        Args:
+            jobs (list):            list of AnalysisJob, prefetch counts the
+                                    consecutive jobs of a video as one
+            manual (bool):          True to track the aspiration depth manually
+            annotated (callable):   optional function called with the index of
+                                    a job after its annotation
+        Returns:
+            measurements (list):    the analyzed measurements in the order of jobs
+        """
+        _check_keys(jobs)
+        videos = [list(group) for path, group in
+                  itertools.groupby(jobs, key=lambda job: job.video_path)]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            loading = deque(executor.submit(self._load, video)
+                            for video in videos[:self.prefetch + 1])
+            fitting = []
+            for i, video in enumerate(videos):
+                analyzers = loading.popleft().result()
+                next_video = i + self.prefetch + 1
+                if next_video < len(videos):
+                    loading.append(executor.submit(self._load, videos[next_video]))
+                for job, analyzer in zip(video, analyzers):
+                    analyzer.annotate(manual, job.time_valve_opened, job.roi_center)
+                    fitting.append(executor.submit(analyzer.track_and_fit))
+                    if annotated is not None:
+                        annotated(len(fitting) - 1)
+            return [future.result() for future in fitting]
+
+
+def _check_keys(jobs):
+    """ Reject jobs whose results would overwrite each other """
+    keys = [(job.measurement.data[PatientKeys.PATIENT_NUMBER.value],
+             job.measurement.data[PatientKeys.OOCYTE_NUMBER.value],
+             job.measurement.aspiration_number) for job in jobs]
+    duplicates = sorted(key for key, count in Counter(keys).items() if count > 1)
+    if duplicates:
+        raise ValueError('Expected one job per (patient, oocyte, aspiration), but got several '
+                         'for {} instead; set the ASPIRATION of each measurement.'.format(
+                             duplicates))
+
+
+if __name__ == '__main__':
+    print('Pipeline')
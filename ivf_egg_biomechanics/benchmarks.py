@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the hot paths of the analysis, without any user interaction.
+
+Every benchmark is run on generated data at several sizes and the results
+are saved as JSON named by the git commit, so runs of different commits can
+be compared:
+
+    python benchmarks.py                    # run and save all benchmarks
+    python benchmarks.py --quick            # smaller sizes and fewer repeats
+    python benchmarks.py --only fit track   # run some of the benchmarks
+    python benchmarks.py --compare a1b2c3d e4f5a6b
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+BENCHMARK_DIRECTORY = os.path.join(os.path.expanduser('~'), '.ivf_egg_biomechanics',
+                                   'benchmarks')
+
+
+def _measure(function, repeats):
+    """ Wall time of each call of a function [s] """
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _result(name, times, **params):
+    return {'name': name, 'params': params, 'repeats': len(times),
+            'min': min(times), 'median': float(np.median(times)),
+            'mean': float(np.mean(times))}
+
+
+def _aspiration_frames(num_frames, height=200, width=300, seed=0):
+    """ Frames with a dark zona edge moving into the pipette and noise """
+    rng = np.random.default_rng(seed)
+    time = np.linspace(0.0, 0.5, num_frames)
+    position = 120 + 30 * (1 - np.exp(-time / 0.05)) + 40 * time
+    columns = np.arange(width)
+    frames = []
+    for x in position:
+        row = np.where(columns < x, 90.0, 170.0)
+        frame = np.tile(row, (height, 1)) + rng.normal(0, 4, (height, width))
+        frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+    return frames, time
+
+
+def benchmark_track(sizes, repeats):
+    """ Automatic tracking of the zona in N-frame stacks """
+    from properties import AspirationDepth
+    results = []
+    for num_frames in sizes:
+        frames, time = _aspiration_frames(num_frames)
+        tracker = AspirationDepth(frames, 4.0, 10.0, 1.55, time)
+        tracker.offset = 110
+        tracker.roi_center = (150, 100)
+        results.append(_result('track', _measure(tracker.track, repeats), frames=num_frames))
+    return results
+
+
+def _zener_curves(num_curves, num_points, seed=0):
+    from oocyte_models import ModifiedZener
+    rng = np.random.default_rng(seed)
+    time = np.linspace(0.0, 0.5, num_points, endpoint=False)
+    force = 1.0e-8
+    params = np.column_stack([rng.uniform(0.05, 0.2, num_curves), rng.uniform(0.1, 0.4, num_curves),
+                              rng.uniform(0.05, 0.2, num_curves), rng.uniform(0.02, 0.2, num_curves)])
+    depth = np.array([ModifiedZener._calculate_model_output([time, force], *p) for p in params])
+    depth += rng.normal(0, 2e-8, depth.shape)
+    return time, force, depth
+
+
+def benchmark_fit(sizes, repeats):
+    """ Fit of the modified Zener model to single curves and to batches of curves """
+    from oocyte_models import Model, ModifiedZener, select_model
+    results = []
+    time, force, depth = _zener_curves(1, 35)
+    model = ModifiedZener(time, depth[0], force)
+    results.append(_result('fit_step', _measure(lambda: model.fit(plot=False), repeats),
+                           points=len(time)))
+    model = ModifiedZener(time, depth[0], force, np.full(len(time), force))
+    results.append(_result('fit_trace', _measure(lambda: model.fit(plot=False), repeats),
+                           points=len(time)))
+    for starts in (16, 64, 256):
+        model = ModifiedZener(time, depth[0], force)
+        results.append(_result(
+            'fit_multi_start', _measure(lambda: model.fit(plot=False, starts=starts), repeats),
+            points=len(time), starts=starts))
+    results.append(_result(
+        'select_model', _measure(lambda: select_model(time, depth[0], force), repeats),
+        points=len(time), models=len(Model.registry)))
+    weights = np.ones(len(time))
+    for num_curves in sizes:
+        time, force, depth = _zener_curves(num_curves, 35)
+        evaluate = ModifiedZener._trace_evaluator(time, np.full(len(time), force))
+        params0 = np.tile([0.1, 0.2, 0.1, 0.1], (num_curves, 1))
+        results.append(_result(
+            'fit_batch', _measure(lambda: Model._levenberg_marquardt(evaluate, params0, depth,
+                                                                     weights), repeats),
+            curves=num_curves, points=len(time)))
+    return results
+
+
+def benchmark_feature_selection(sizes, repeats):
+    """
+    Forward feature selection at growing cohort and feature counts with the
+    classifier of the menu: the RBF SVM grid search of OutcomePredictor
+    (C x gamma, 20-fold cross-validation). Every candidate feature costs a
+    full grid search, so the sizes are small.
+    """
+    from sklearn.model_selection import ParameterGrid
+    from outcome_predictor import OutcomePredictor
+    results = []
+    rng = np.random.default_rng(0)
+    for num_samples, num_features in sizes:
+        X = pd.DataFrame(rng.normal(size=(num_samples, num_features)),
+                         columns=['F{}'.format(i) for i in range(num_features)])
+        y = pd.Series((X['F0'] + 0.5 * X['F1'] + rng.normal(size=num_samples) > 0).astype(int))
+
+        def select():
+            predictor = OutcomePredictor('svm', 'forward')
+            with contextlib.redirect_stdout(io.StringIO()):
+                predictor.perform_forward_feature_selection(X, y)
+        grid_search = OutcomePredictor('svm', 'forward').classifier
+        results.append(_result('feature_selection', _measure(select, repeats),
+                               samples=num_samples, features=num_features, classifier='svm',
+                               grid=len(ParameterGrid(grid_search.param_grid)),
+                               cv=grid_search.cv))
+    return results
+
+
+def _pressure_log(path, num_lines):
+    time = np.arange(num_lines) * 0.001
+    pressure = 0.5 + 0.01 * np.sin(time)
+    valve = num_lines // 10
+    with open(path, 'w') as log:
+        for i in range(num_lines):
+            if i == valve:
+                log.write('{:.3f}\tValve\n'.format(time[i]))
+            log.write('{:.3f}\t{:.5f}\n'.format(time[i], pressure[i]))
+
+
+def _patient_workbook(path, num_rows):
+    from utils.patient_table import COLUMN_TYPES
+    rng = np.random.default_rng(0)
+    data = {}
+    for name, value_type in COLUMN_TYPES.items():
+        if value_type is str:
+            data[name] = rng.choice(['A', 'B', None], num_rows)
+        elif value_type is int:
+            data[name] = rng.integers(0, 2, num_rows)
+        else:
+            data[name] = rng.random(num_rows)
+    pd.DataFrame(data).to_excel(path, index=False)
+
+
+def benchmark_loading(sizes, repeats):
+    """ Reading pressure logs and the patient workbook, without and with cache """
+    from utils import pressure_log, patient_table
+    results = []
+    directory = tempfile.mkdtemp()
+    try:
+        for num_lines in sizes['pressure']:
+            path = os.path.join(directory, 'pressure{}.txt'.format(num_lines))
+            _pressure_log(path, num_lines)
+            cache = os.path.join(directory, 'pressure_cache')
+            results.append(_result(
+                'pressure', _measure(lambda: pressure_log.read_pressure_trace(path, None), repeats),
+                lines=num_lines))
+            pressure_log.read_pressure_trace(path, cache)
+            results.append(_result(
+                'pressure_cached',
+                _measure(lambda: pressure_log.read_pressure_trace(path, cache), repeats),
+                lines=num_lines))
+        for num_rows in sizes['excel']:
+            path = os.path.join(directory, 'patients{}.xlsx'.format(num_rows))
+            _patient_workbook(path, num_rows)
+            cache = os.path.join(directory, 'excel_cache')
+            results.append(_result(
+                'excel', _measure(lambda: patient_table.read_patient_table(path, None), repeats),
+                rows=num_rows))
+            patient_table.read_patient_table(path, cache)
+            results.append(_result(
+                'excel_cached',
+                _measure(lambda: patient_table.read_patient_table(path, cache), repeats),
+                rows=num_rows))
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def benchmark_end_to_end(sizes, repeats):
+    """
+    Decoding (rotated as in the clinic, without and with the crop while
+    decoding), tracking and fitting of synthetic videos with known parameters
+    """
+    from synthetic_measurement import SyntheticMeasurement
+    from utils import ioutils
+    from utils.frame_transform import FrameTransform
+    results = []
+    directory = tempfile.mkdtemp()
+    try:
+        for frame_rate in sizes:
+            measurement = SyntheticMeasurement(frame_rate=frame_rate)
+            paths = measurement.write(directory, 'video{:g}'.format(frame_rate))
+            crop = FrameTransform(180, measurement.crop_center)
+            results.append(_result(
+                'decode', _measure(lambda: ioutils.decode_video_file(paths[0], 180), repeats),
+                frame_rate=frame_rate, frames=measurement.num_frames))
+            results.append(_result(
+                'decode_cropped',
+                _measure(lambda: ioutils.decode_video_file(paths[0], transform=crop), repeats),
+                frame_rate=frame_rate, frames=measurement.num_frames))
+            result = _result('end_to_end', _measure(lambda: measurement.analyze(*paths), repeats),
+                             frame_rate=frame_rate, frames=measurement.num_frames)
+            params, depth = measurement.analyze(*paths)
+            fitted = [params[key] for key in ('K0_ZP', 'K1_ZP', 'ETA1_ZP', 'TAU_ZP')]
+            result['max_relative_error'] = float(np.max(
+                np.abs(np.subtract(fitted, measurement.params)) / measurement.params))
+            results.append(result)
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+BENCHMARKS = {
+    'track': (benchmark_track, [100, 400], [35, 100, 400]),
+    'fit': (benchmark_fit, [10, 100], [10, 100, 1000]),
+    'feature_selection': (benchmark_feature_selection, [(60, 2)], [(60, 2), (100, 3), (200, 4)]),
+    'loading': (benchmark_loading, {'pressure': [10 ** 4], 'excel': [200]},
+                {'pressure': [10 ** 4, 10 ** 5, 10 ** 6], 'excel': [200, 2000]}),
+    'end_to_end': (benchmark_end_to_end, [50.0], [50.0, 100.0, 200.0]),
+}   # name: (function, quick sizes, full sizes)
+
+
+def _commit():
+    """ Short hash of the checked out commit, with +dirty for local changes """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=directory,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                universal_newlines=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                cwd=directory, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, universal_newlines=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('+dirty' if status.strip() else '')
+
+
+def run_benchmarks(names=None, quick=False):
+    """
+    Run benchmarks.
+
+    Args:
+        names (list):   names of the benchmarks (see BENCHMARKS), all if None
+        quick (bool):   True for smaller sizes and fewer repeats
+    Returns:
+        report (dict):  the environment and the results of the benchmarks
+    """
+    names = list(BENCHMARKS) if names is None else names
+    repeats = 2 if quick else 5
+    results = []
+    for name in names:
+        function, quick_sizes, sizes = BENCHMARKS[name]
+        results.extend(function(quick_sizes if quick else sizes, repeats))
+    return {'commit': _commit(), 'date': datetime.now().isoformat(timespec='seconds'),
+            'quick': quick, 'python': platform.python_version(),
+            'numpy': np.__version__, 'pandas': pd.__version__,
+            'machine': platform.platform(), 'cpus': os.cpu_count(), 'results': results}
+
+
+def save_report(report, directory=BENCHMARK_DIRECTORY):
+    """ Save a report as <commit>.json, returns the path """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, '{}.json'.format(report['commit']))
+    with open(path, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+    return path
+
+
+def compare_reports(old, new):
+    """ A table of the median times of two reports and their ratio """
+    def key(result):
+        return result['name'], json.dumps(result['params'], sort_keys=True)
+    old_results = {key(result): result for result in old['results']}
+    lines = ['{:<20}{:<32}{:>12}{:>12}{:>8}'.format(
+        'benchmark', 'params', old['commit'][:12], new['commit'][:12], 'ratio')]
+    for result in new['results']:
+        previous = old_results.get(key(result))
+        if previous is None:
+            continue
+        lines.append('{:<20}{:<32}{:>12.4f}{:>12.4f}{:>8.2f}'.format(
+            result['name'], key(result)[1], previous['median'], result['median'],
+            result['median'] / previous['median']))
+    return '\n'.join(lines)
+
+
+def _load_report(name, directory):
+    path = name if os.path.isfile(name) else os.path.join(directory, name + '.json')
+    with open(path) as report_file:
+        return json.load(report_file)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Benchmark the analysis of oocytes.')
+    parser.add_argument('--quick', action='store_true', help='smaller sizes and fewer repeats')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='benchmarks to run')
+    parser.add_argument('--output', default=BENCHMARK_DIRECTORY, help='directory of the reports')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two saved reports (commit or path)')
+    args = parser.parse_args(args)
+    if args.compare:
+        print(compare_reports(*(_load_report(name, args.output) for name in args.compare)))
+        return
+    report = run_benchmarks(args.only, args.quick)
+    for result in report['results']:
+        print('{:<20}{:<40}{:>10.4f} s'.format(result['name'], json.dumps(result['params']),
+                                               result['median']))
+    print('Saved to {}'.format(save_report(report, args.output)))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import tempfile
+import numpy as np
+
+BLOB_DIRECTORY = os.path.join(os.path.expanduser('~'), '.ivf_egg_biomechanics', 'blobs')
+_PREFIX = 'blob:'
+
+
+class BlobRef(object):
+    """
+    A lazy reference to an array in a BlobStore. The array is only read
+    from disk when load is called, so measurements holding references can
+    be created, copied and saved without reading any pixels.
+    """
+    __slots__ = ('store', 'digest')
+
+    def __init__(self, store, digest):
+        """
+        Initialize a reference.
+
+        Args:
+            store (BlobStore):  the store of the array
+            digest (str):       the content hash of the array
+        """
+        self.store = store
+        self.digest = digest
+
+    def load(self, mmap=True):
+        """ Read the array (see BlobStore.get) """
+        return self.store.get(self.digest, mmap)
+
+    def __str__(self):
+        return _PREFIX + self.digest
+
+    def __repr__(self):
+        return 'BlobRef({!r})'.format(str(self))
+
+    def __eq__(self, other):
+        return isinstance(other, BlobRef) and other.digest == self.digest
+
+    def __hash__(self):
+        return hash(self.digest)
+
+
+class BlobStore(object):
+    """
+    A store of large arrays (e.g. video frames) outside of the measurements.
+
+    Every array is written to its own .npy file named by the hash of its
+    content, so storing the same frames twice costs no space and a file is
+    never changed after it was written. Sequences of frames are written
+    frame by frame into the file without stacking them in memory first.
+    """
+
+    def __init__(self, directory=BLOB_DIRECTORY):
+        """
+        Initialize the store.
+
+        Args:
+            directory (str): directory of the .npy files, created when needed
+        """
+        self.directory = directory
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest + '.npy')
+
+    def __contains__(self, digest):
+        return os.path.isfile(self._path(digest))
+
+    def put(self, arrays):
+        """
+        Store an array or a sequence of arrays of the same shape and type,
+        which are stored as one array (size: NxHxW for N frames).
+
+        Args:
+            arrays (array or list): the array or the sequence of arrays
+        Returns:
+            reference (BlobRef):    the reference to the stored array
+        """
+        parts = [np.asarray(array) for array in arrays]
+        if len(parts) == 0:
+            raise ValueError('Expected at least one array, but got none.')
+        shape = parts[0].shape
+        dtype = parts[0].dtype
+        for part in parts:
+            if part.shape != shape or part.dtype != dtype:
+                raise ValueError('Expected arrays of shape {} and type {}, but got {} of '
+                                 'type {} instead.'.format(shape, dtype, part.shape, part.dtype))
+        shape = (len(parts),) + shape
+        digest = hashlib.sha1('{}{}'.format(dtype.str, shape).encode())
+        for part in parts:
+            digest.update(np.ascontiguousarray(part).data)
+        digest = digest.hexdigest()
+        if digest not in self:
+            self._write(digest, parts, shape, dtype)
+        return BlobRef(self, digest)
+
+    def _write(self, digest, parts, shape, dtype):
+        """ Write the file atomically, so parallel readers never see a partial file """
+        os.makedirs(self.directory, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(suffix='.npy', dir=self.directory)
+        os.close(handle)
+        try:
+            array = np.lib.format.open_memmap(temp_path, mode='w+', dtype=dtype, shape=shape)
+            for i, part in enumerate(parts):
+                array[i] = part
+            array.flush()
+            del array
+            os.replace(temp_path, self._path(digest))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def get(self, digest, mmap=True):
+        """
+        Read a stored array.
+
+        Args:
+            digest (str):   the content hash of the array
+            mmap (bool):    True to map the file read-only instead of reading it
+        Returns:
+            array (array):  the stored array
+        """
+        if digest not in self:
+            raise KeyError('Blob {} is not in the store {}.'.format(digest, self.directory))
+        return np.load(self._path(digest), mmap_mode='r' if mmap else None)
+
+    def ref(self, text):
+        """
+        Create the reference from its text (e.g. from a spreadsheet cell).
+
+        Args:
+            text (str):             the reference as 'blob:<digest>'
+        Returns:
+            reference (BlobRef):    the reference
+        """
+        if not isinstance(text, str) or not text.startswith(_PREFIX):
+            raise ValueError('Expected a text starting with {}, but got {} instead.'.format(
+                _PREFIX, text))
+        return BlobRef(self, text[len(_PREFIX):])
+
+
+if __name__ == '__main__':
+    store = BlobStore(tempfile.mkdtemp())
+    reference = store.put([np.zeros((4, 4), dtype=np.uint8)] * 3)
+    print(reference, reference.load().shape)
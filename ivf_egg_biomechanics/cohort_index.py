@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+from measurement import PatientKeys
+
+MEASURED = 'MEASURED'
+
+
+class CohortIndex(object):
+    """
+    An index of the patient table for the queries of the menu.
+
+    The measured oocytes are hashed by (PATIENT_NUMBER, OOCYTE), so finding
+    an oocyte takes constant time instead of scanning the table. The rows
+    of filters on a column (e.g. FERTILIZED == 1) are computed once and
+    shared until the column is changed (see invalidate).
+    """
+
+    def __init__(self, patient_data):
+        """
+        Build the index of a patient table.
+
+        Args:
+            patient_data (dataframe): the patient table with a MEASURED column
+        """
+        if not isinstance(patient_data, pd.DataFrame):
+            raise TypeError('Expected {}, but got {} instead.'.format(
+                pd.DataFrame, type(patient_data)))
+        self.patient_data = patient_data
+        self._views = {}
+        self._build()
+
+    def _build(self):
+        """ Hash the positions of the measured oocytes """
+        self._positions = {}
+        if self.patient_data.empty:
+            self._patients = frozenset()
+            return
+        positions = self.select(MEASURED, 1)
+        numbers = self.patient_data[PatientKeys.PATIENT_NUMBER.value].to_numpy(
+            dtype=np.float64)[positions]
+        oocytes = self.patient_data[PatientKeys.OOCYTE_NUMBER.value].to_numpy(
+            dtype=np.float64)[positions]
+        valid = ~(np.isnan(numbers) | np.isnan(oocytes))
+        keys = zip(numbers[valid].astype(np.int64).tolist(),
+                   oocytes[valid].astype(np.int64).tolist())
+        for position, key in zip(positions[valid].tolist(), keys):
+            self._positions.setdefault(key, []).append(position)
+        self._patients = frozenset(number for number, oocyte in self._positions)
+
+    def select(self, key, value):
+        """
+        The positions of the rows where a column equals a value. The result
+        is cached and must not be changed.
+
+        Args:
+            key (str or Enum):  the column
+            value:              the value
+        Returns:
+            positions (array):  positions of the rows (read-only)
+        """
+        key = getattr(key, 'value', key)
+        view = (key, value)
+        if view not in self._views:
+            positions = np.flatnonzero((self.patient_data[key] == value).to_numpy())
+            positions.flags.writeable = False
+            self._views[view] = positions
+        return self._views[view]
+
+    def rows(self, key, value):
+        """ The rows where a column equals a value (see select) """
+        return self.patient_data.iloc[self.select(key, value)]
+
+    def has_patient(self, patient_number):
+        """ True if the patient has a measured oocyte """
+        return patient_number in self._patients
+
+    def find(self, patient_number, oocyte_number):
+        """
+        Find a measured oocyte.
+
+        Args:
+            patient_number (int):   patient number
+            oocyte_number (int):    oocyte number
+        Returns:
+            index (list):   index labels of the oocyte in the table, empty
+                            if it does not exist
+        """
+        positions = self._positions.get((patient_number, oocyte_number), [])
+        return self.patient_data.index[positions].tolist()
+
+    def invalidate(self, columns):
+        """
+        Drop the cached filters of changed columns. The index is rebuilt if
+        the patient number, oocyte number or MEASURED column changed.
+
+        Args:
+            columns (list): names of the changed columns
+        """
+        columns = set(getattr(column, 'value', column) for column in columns)
+        self._views = {view: positions for view, positions in self._views.items()
+                       if view[0] not in columns}
+        if columns & {PatientKeys.PATIENT_NUMBER.value, PatientKeys.OOCYTE_NUMBER.value,
+                      MEASURED}:
+            self._build()
+
+
+if __name__ == '__main__':
+    data = pd.DataFrame({'NUMBER': [1, 1, 2], 'OOCYTE': [1, 2, 1], 'MEASURED': [1, 0, 1]})
+    print(CohortIndex(data).find(2, 1))
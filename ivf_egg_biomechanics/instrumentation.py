@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:     # not available on Windows
+    resource = None
+
+STAGE_LOG = os.path.join(os.path.expanduser('~'), '.ivf_egg_biomechanics', 'stages.jsonl')
+
+
+def current_rss():
+    """ Resident memory of the process [MB], None if it is unknown """
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+    except (OSError, ValueError, IndexError):     # only available on Linux
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') / 2.0 ** 20
+
+
+def process_peak_rss():
+    """
+    Peak resident memory of the process since it started [MB], None if it
+    is unknown. This is a high-water mark of the whole process, not of a stage.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / 2.0 ** 20 if sys.platform == 'darwin' else peak / 2.0 ** 10
+
+
+class StageRecorder(object):
+    """
+    Record the cost of the stages of an analysis.
+
+    A record is written for every stage with the wall time, the CPU time,
+    the resident memory at the start and the end of the stage, the peak
+    resident memory of the process so far and the number of processed
+    frames. Records are kept in memory and optionally appended as JSON lines
+    to a file. Several threads can record into one recorder.
+
+    The CPU time is measured twice: 'cpu' is the time of the thread running
+    the stage, without the threads the stage hands work to (e.g. the fits of
+    select_model), and 'process_cpu' is the time of all threads of the
+    process, including other stages running at the same time.
+
+    Example:
+        with recorder.stage('track', patient=1, oocyte=2) as record:
+            ...
+            record['frames'] = len(frames)
+    """
+
+    def __init__(self, path=None):
+        """
+        Initialize the recorder.
+
+        Args:
+            path (str): JSON lines file the records are appended to, None
+                        to keep the records only in memory
+        """
+        self.path = path
+        self.records = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, **context):
+        """
+        Record a stage. The record is also written if the stage fails.
+
+        Args:
+            name (str):     name of the stage
+            context:        values added to the record (e.g. patient=1)
+        Yields:
+            record (dict):  the record, e.g. to set the number of 'frames'
+        """
+        record = dict(context, stage=name, frames=None)
+        record['rss_start'] = current_rss()
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        process_cpu = time.process_time()
+        try:
+            yield record
+        except BaseException as error:
+            record['error'] = type(error).__name__
+            raise
+        finally:
+            record['wall'] = time.perf_counter() - wall
+            record['cpu'] = time.thread_time() - cpu
+            record['process_cpu'] = time.process_time() - process_cpu
+            record['rss_end'] = current_rss()
+            record['process_peak_rss'] = process_peak_rss()
+            self._add(record)
+
+    def _add(self, record):
+        with self._lock:
+            self.records.append(record)
+            if self.path is not None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with open(self.path, 'a') as log:
+                    log.write(json.dumps(record, default=_to_json) + '\n')
+
+    def summary(self):
+        """ The records aggregated by stage (see aggregate) """
+        with self._lock:
+            return aggregate(self.records)
+
+
+def _to_json(value):
+    """ Convert numpy numbers (e.g. patient numbers) for json """
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError('Expected a number, but got {} instead.'.format(type(value)))
+
+
+def read_records(path):
+    """
+    Read the records of a JSON lines file.
+
+    Args:
+        path (str):         path of the file
+    Returns:
+        records (list):     list of dicts
+    """
+    with open(path) as log:
+        return [json.loads(line) for line in log if line.strip()]
+
+
+def aggregate(records):
+    """
+    Aggregate records by stage.
+
+    Args:
+        records (list):     list of records
+    Returns:
+        summary (dict):     for each stage in the order of their first record:
+                            count, wall (total, mean and max), cpu and
+                            process_cpu (total), rss_growth (total of the
+                            resident memory at the end minus the start),
+                            process_peak_rss (max), frames (total) and
+                            frames per second of wall time
+    """
+    summary = {}
+    for record in records:
+        stage = summary.setdefault(record['stage'], {
+            'count': 0, 'wall': 0.0, 'wall_max': 0.0, 'cpu': 0.0, 'process_cpu': 0.0,
+            'rss_growth': None, 'process_peak_rss': None, 'frames': 0, 'errors': 0})
+        stage['count'] += 1
+        stage['wall'] += record['wall']
+        stage['wall_max'] = max(stage['wall_max'], record['wall'])
+        stage['cpu'] += record['cpu']
+        stage['process_cpu'] += record.get('process_cpu') or 0.0
+        if record.get('rss_start') is not None and record.get('rss_end') is not None:
+            stage['rss_growth'] = ((stage['rss_growth'] or 0.0)
+                                   + record['rss_end'] - record['rss_start'])
+        if record.get('process_peak_rss') is not None:
+            stage['process_peak_rss'] = max(stage['process_peak_rss'] or 0.0,
+                                            record['process_peak_rss'])
+        stage['frames'] += record.get('frames') or 0
+        stage['errors'] += 'error' in record
+    for stage in summary.values():
+        stage['wall_mean'] = stage['wall'] / stage['count']
+        stage['fps'] = stage['frames'] / stage['wall'] if stage['frames'] and stage['wall'] else None
+    return summary
+
+
+def format_summary(summary):
+    """ A table of a summary (see aggregate) """
+    lines = ['{:<20}{:>7}{:>11}{:>11}{:>11}{:>15}{:>11}{:>17}{:>10}{:>10}'.format(
+        'stage', 'count', 'wall [s]', 'mean [s]', 'cpu [s]', 'proc. cpu [s]', 'rss +[MB]',
+        'proc. peak [MB]', 'frames', 'fps')]
+    for name, stage in summary.items():
+        lines.append(('{:<20}{:>7}{:>11.3f}{:>11.3f}{:>11.3f}{:>15.3f}'
+                      '{:>11}{:>17}{:>10}{:>10}').format(
+            name, stage['count'], stage['wall'], stage['wall_mean'], stage['cpu'],
+            stage['process_cpu'],
+            '-' if stage['rss_growth'] is None else '{:.0f}'.format(stage['rss_growth']),
+            '-' if stage['process_peak_rss'] is None
+            else '{:.0f}'.format(stage['process_peak_rss']),
+            stage['frames'], '-' if stage['fps'] is None else '{:.0f}'.format(stage['fps'])))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    recorder = StageRecorder()
+    with recorder.stage('sleep', patient=1) as record:
+        time.sleep(0.1)
+        record['frames'] = 10
+    print(format_summary(recorder.summary()))
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+
+import queue
+import threading
+from time import perf_counter, sleep
+import numpy as np
+from oocyte_models import Model, ModifiedZener
+from properties import AspirationDepth
+
+
+class LiveTracker(object):
+    """
+    Track the zona and fit the modified Zener model while a measurement is
+    recorded.
+
+    Frames are passed one at a time (see process) or read from a
+    cv2.VideoCapture source (see run). Before the valve opens, the mean
+    differences between consecutive frames in the tracking region give the
+    noise level of the video. The frame before the first difference above
+    the noise is the frame before the movement (as in FrameScrubber) and
+    the background of the tracking. Every later frame is tracked on its own
+    like in AspirationDepth, so the cost per frame does not grow with the
+    measurement. The fit is updated every few frames, starting at the last
+    estimate and limited by a time budget. The first, provisional estimate
+    is emitted once the frames cover the provisional delay after the valve
+    opened, and the final one at the end of the measurement window.
+    """
+    WINDOW = 0.5            # length of the measurement after the valve opened [s]
+    MIN_NOISE_FRAMES = 5    # frames needed to estimate the noise before the valve opens
+    CROP_SIZE = 200         # [pixel], see ioutils._crop_video_frames
+
+    def __init__(self, roi_center, offset, conversion_factor, applied_force, frame_rate=None,
+                 crop_center=None, valve_frame=None, provisional_delay=0.1, update_every=5,
+                 fit_budget=0.02, sensitivity=5.0, on_estimate=None):
+        """
+        Initialize the tracker.
+
+        Args:
+            roi_center (tuple):         center of the tracking region (see
+                                        AspirationDepth.select_regions)
+            offset (int):               position of the inner zona diameter [pixel]
+            conversion_factor (float):  conversion factor [pixel/um]
+            applied_force (float):      force applied to the oocyte [N]
+            frame_rate (float):         frame rate [fps], read from the source
+                                        in run if None
+            crop_center (tuple):        center (x, y) of the 200x200 region cut
+                                        out of each frame (see
+                                        ioutils.select_measurement_frames),
+                                        None if the frames are cropped
+            valve_frame (int):          frame number before the movement, None
+                                        to detect it
+            provisional_delay (float):  time after the valve opened of the first
+                                        estimate [s]
+            update_every (int):         number of frames between updates of the fit
+            fit_budget (float):         wall-clock time of an update of the fit [s]
+            sensitivity (float):        threshold of the valve detection in
+                                        multiples of the noise spread
+            on_estimate (callable):     called with each estimate (see estimates)
+        """
+        if not isinstance(applied_force, float):
+            raise TypeError('Expected {}, but got {} instead.'.format(float, type(applied_force)))
+        if update_every < 1:
+            raise ValueError('Expected a positive number of frames, but got {} instead.'.format(
+                update_every))
+        self._tracker = AspirationDepth([], 1.0, 0.0, conversion_factor, None)
+        self._tracker.roi_center = roi_center
+        self._tracker.offset = offset
+        self.applied_force = applied_force
+        self.frame_rate = frame_rate
+        self.crop_center = crop_center
+        self.valve_frame = valve_frame
+        self.provisional_delay = provisional_delay
+        self.update_every = update_every
+        self.fit_budget = fit_budget
+        self.sensitivity = sensitivity
+        self.on_estimate = on_estimate
+        self.estimates = []     # dicts with the parameters, 'frames', 'time' and 'provisional'
+        self.latencies = []     # time from reading to processing each frame [s]
+        self.dropped = 0        # frames dropped because the processing fell behind
+        self.params = None
+        self.done = False
+        self._fitted = 0
+        self._index = -1
+        self._previous = None
+        self._differences = []
+        self._background = None
+        self._time = []
+        self._position = []
+        self._depth = []
+
+    @property
+    def time(self):
+        """ Time points of the tracked frames since the valve opened [s] """
+        return np.asarray(self._time)
+
+    @property
+    def aspiration_depth_pixel(self):
+        """ Tracked position of the zona [pixel] """
+        return np.asarray(self._position)
+
+    @property
+    def aspiration_depth(self):
+        """ Tracked aspiration depth [m] """
+        return np.asarray(self._depth)
+
+    def _frame_time(self):
+        """ Time of the current frame since the valve opened [s] """
+        return (self._index - self.valve_frame - 1) / self.frame_rate
+
+    def _window_end(self):
+        """
+        End of the measurement window [s]. The frames before it are tracked;
+        half a frame early, so a window without dropped frames has
+        int(frame_rate * WINDOW) frames like the offline analysis.
+        """
+        return LiveTracker.WINDOW - 0.5 / self.frame_rate
+
+    def _crop(self, frame):
+        if self.crop_center is None:
+            return frame
+        x, y = self.crop_center
+        half = LiveTracker.CROP_SIZE / 2
+        return frame[int(y-half):int(y+half), int(x-half):int(x+half)]
+
+    def process(self, frame, index=None):
+        """
+        Process the next grayscale frame.
+
+        Args:
+            frame (array):  the frame (uncropped if crop_center is given)
+            index (int):    frame number, the next number if None
+        Returns:
+            estimate (dict): the estimate if the fit was updated, else None
+        """
+        if self.frame_rate is None:
+            raise ValueError('Expected a frame rate, but got None instead.')
+        self._index = self._index + 1 if index is None else index
+        if self.done:
+            return None
+        return self._process_cropped(self._crop(frame))
+
+    def _process_cropped(self, frame):
+        roi = self._tracker._roi(frame)
+        if self._background is None:
+            self._wait_for_valve(roi)
+            return None
+        # The window ends in time, so frames dropped by run do not extend it
+        if self._frame_time() >= self._window_end():
+            self.done = True
+            return self._update_fit(final=True)
+        self._track(roi)
+        if self._time[-1] + 1.0 / self.frame_rate >= self._window_end():
+            self.done = True
+            return self._update_fit(final=True)
+        if self._time[-1] < self.provisional_delay:
+            return None
+        if self.params is None or (len(self._time) - self._fitted) >= self.update_every:
+            return self._update_fit(final=False)
+        return None
+
+    def _wait_for_valve(self, roi):
+        """ Keep the frame before the movement as background """
+        if self.valve_frame is not None:
+            if self._index == self.valve_frame:
+                self._background = AspirationDepth._filter(roi.astype(np.uint8))
+            return
+        roi = roi.astype(np.int16)
+        if self._previous is not None:
+            difference = float(np.mean(np.abs(roi - self._previous)))
+            if len(self._differences) >= LiveTracker.MIN_NOISE_FRAMES:
+                noise = np.median(self._differences)
+                spread = np.median(np.abs(np.asarray(self._differences) - noise))
+                if difference > noise + self.sensitivity * max(spread, 0.5):
+                    self.valve_frame = self._index - 1
+                    self._background = AspirationDepth._filter(self._previous.astype(np.uint8))
+                    self._track(roi.astype(np.uint8))
+                    return
+            self._differences.append(difference)
+        self._previous = roi
+
+    def _track(self, roi):
+        profile = AspirationDepth._difference_profile(AspirationDepth._filter(roi),
+                                                      self._background)
+        position = int(AspirationDepth._edge_index(profile)) \
+            + int(self._tracker.roi_center[0] - AspirationDepth.WIDTH_ROI / 2)
+        self._time.append(self._frame_time())
+        self._position.append(position)
+        self._depth.append((position - self._tracker.offset) * 1e-6
+                           / self._tracker.conversion_factor)
+
+    def _update_fit(self, final):
+        """ Fit the frames tracked so far, warm started at the last estimate """
+        time = self.time
+        if len(time) <= len(ModifiedZener.KEYS):
+            return None
+        evaluate = ModifiedZener._step_evaluator(time, self.applied_force)
+        weights = Model._weights(len(time))
+        with np.errstate(all='ignore'):
+            if self.params is None:
+                self.params, cost = Model._multi_start(
+                    evaluate, self.aspiration_depth, weights, ModifiedZener.START_RANGES,
+                    starts=16, refine=2, time_budget=self.fit_budget, params0=ModifiedZener.START)
+            else:
+                params, cost = Model._levenberg_marquardt(
+                    evaluate, [self.params], self.aspiration_depth, weights,
+                    deadline=perf_counter() + self.fit_budget)
+                self.params = params[0]
+        self._fitted = len(time)
+        estimate = ModifiedZener._parameter_dict(*self.params)
+        estimate.update(frames=len(time), time=float(time[-1]), provisional=not final)
+        self.estimates.append(estimate)
+        if self.on_estimate is not None:
+            self.on_estimate(estimate)
+        return estimate
+
+    def finish(self):
+        """ Emit the final estimate of a measurement that ended before the window """
+        if not self.done and self._time:
+            self.done = True
+            return self._update_fit(final=True)
+        return None
+
+    def run(self, source, rotation=0, realtime=False, max_queue=8):
+        """
+        Track a video source until the end of the measurement window.
+
+        The frames are read on a separate thread into a queue of at most
+        max_queue frames. If the processing falls behind, new frames are
+        dropped instead of queued, so the delay of a frame is bounded.
+
+        Args:
+            source (str or int):    video file or camera index of cv2.VideoCapture
+            rotation (int):         clockwise angle to rotate the frames (see
+                                    ioutils.decode_video_file)
+            realtime (bool):        True to replay a file at its frame rate,
+                                    like a camera
+            max_queue (int):        maximum number of waiting frames
+        Returns:
+            estimate (dict):        the last estimate, None if the valve
+                                    opening was not found
+        """
+        import cv2
+        from utils.frame_transform import FrameTransform
+        # Only the crop of each frame is converted and rotated
+        transform = FrameTransform(rotation, self.crop_center,
+                                   (LiveTracker.CROP_SIZE, LiveTracker.CROP_SIZE))
+        capture = cv2.VideoCapture(source)
+        if not capture.isOpened():
+            raise ValueError('Video source {} cannot be opened.'.format(source))
+        if self.frame_rate is None:
+            self.frame_rate = capture.get(cv2.CAP_PROP_FPS)
+        frames = queue.Queue(maxsize=max_queue)
+        stop = threading.Event()
+
+        def read():
+            start = perf_counter()
+            index = 0
+            try:
+                while not stop.is_set():
+                    if realtime:
+                        sleep(max(0.0, start + index / self.frame_rate - perf_counter()))
+                    ret, frame = capture.read()
+                    if not ret:
+                        break
+                    try:
+                        frames.put_nowait((index, frame, perf_counter()))
+                    except queue.Full:
+                        self.dropped += 1
+                    index += 1
+            finally:
+                capture.release()
+                frames.put(None)
+
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        try:
+            while not self.done:
+                item = frames.get()
+                if item is None:
+                    break
+                index, frame, read_time = item
+                self._index = index
+                if not self.done:
+                    self._process_cropped(transform(frame))
+                self.latencies.append(perf_counter() - read_time)
+        finally:
+            stop.set()
+            while reader.is_alive():
+                try:
+                    frames.get(timeout=0.01)
+                except queue.Empty:
+                    pass
+        self.finish()
+        return self.estimates[-1] if self.estimates else None
+
+
+if __name__ == '__main__':
+    import tempfile
+    from synthetic_measurement import SyntheticMeasurement
+    measurement = SyntheticMeasurement()
+    video_path, pressure_path = measurement.write(tempfile.mkdtemp())
+    tracker = LiveTracker(measurement.roi_center, measurement.offset,
+                          measurement.conversion_factor, float(measurement.force),
+                          crop_center=measurement.crop_center, on_estimate=print)
+    tracker.run(video_path, realtime=True)
+    print('valve frame: {}, max latency: {:.4f} s'.format(tracker.valve_frame,
+                                                         max(tracker.latencies)))
@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
 
+from collections.abc import Mapping
 from enum import Enum
+import numpy as np
+import pandas as pd
+from blob_store import BlobRef
+from trace_archive import TraceRef
 
 
 class PropertyKeys(Enum):
@@ -8,6 +13,7 @@ class PropertyKeys(Enum):
     VIDEO_FRAMES = 'VIDEO_FRAMES'
     APPLIED_PRESSURE = 'APPLIED_PRESSURE'
     APPLIED_FORCE = 'APPLIED_FORCE'
+    APPLIED_FORCE_TRACE = 'APPLIED_FORCE_TRACE'
     PIPETTE_SIZE_PIXEL = 'PIPETTE_SIZE_PIXEL'
     MANUAL_CONVERSION_FACTOR = 'MANUAL_CONVERSION_FACTOR'
     ZONA_THICKNESS = 'ZONA_THICKNESS'
@@ -15,11 +21,13 @@ class PropertyKeys(Enum):
     TIME = 'TIME'
     ASPIRATION_DEPTH_ZONA_PIXEL = 'ASPIRATION_DEPTH_ZONA_PIXEL'
     ASPIRATION_DEPTH_ZONA_MECH = 'ASPIRATION_DEPTH_ZONA_MECH'
+    ASPIRATION_DEPTH_OOLEMMA_PIXEL = 'ASPIRATION_DEPTH_OOLEMMA_PIXEL'
+    ASPIRATION_DEPTH_OOLEMMA_MECH = 'ASPIRATION_DEPTH_OOLEMMA_MECH'
     PIPETTE_TIP_POSITION = 'PIPETTE_TIP_POSITION'
     
     @classmethod
     def has_value(cls, value):
-        return any(value == item.value for item in cls)
+        return value in cls._value2member_map_
 
 
 class OutcomesKeys(Enum):
@@ -42,20 +50,63 @@ class OutcomesKeys(Enum):
     
     @classmethod
     def has_value(cls, value):
-        return any(value == item.value for item in cls)
+        return value in cls._value2member_map_
 
 
 class ParameterKeys(Enum):
-    """ A class with keywords of the modified Zener model """
+    """
+    A class with keywords of the model parameters: the modified Zener model
+    of the zona pellucida and of the oolemma, each followed by the bounds of
+    its bootstrap confidence interval, the other viscoelastic models and the
+    model selected by AIC or BIC
+    """
     K0_ZP = 'K0_ZP'
+    K0_ZP_CI_LOW = 'K0_ZP_CI_LOW'
+    K0_ZP_CI_HIGH = 'K0_ZP_CI_HIGH'
     K1_ZP = 'K1_ZP'
+    K1_ZP_CI_LOW = 'K1_ZP_CI_LOW'
+    K1_ZP_CI_HIGH = 'K1_ZP_CI_HIGH'
     TAU_ZP = 'TAU_ZP'
+    TAU_ZP_CI_LOW = 'TAU_ZP_CI_LOW'
+    TAU_ZP_CI_HIGH = 'TAU_ZP_CI_HIGH'
     ETA0_ZP = 'ETA0_ZP'
+    ETA0_ZP_CI_LOW = 'ETA0_ZP_CI_LOW'
+    ETA0_ZP_CI_HIGH = 'ETA0_ZP_CI_HIGH'
     ETA1_ZP = 'ETA1_ZP'
+    ETA1_ZP_CI_LOW = 'ETA1_ZP_CI_LOW'
+    ETA1_ZP_CI_HIGH = 'ETA1_ZP_CI_HIGH'
+    K0_OL = 'K0_OL'
+    K0_OL_CI_LOW = 'K0_OL_CI_LOW'
+    K0_OL_CI_HIGH = 'K0_OL_CI_HIGH'
+    K1_OL = 'K1_OL'
+    K1_OL_CI_LOW = 'K1_OL_CI_LOW'
+    K1_OL_CI_HIGH = 'K1_OL_CI_HIGH'
+    TAU_OL = 'TAU_OL'
+    TAU_OL_CI_LOW = 'TAU_OL_CI_LOW'
+    TAU_OL_CI_HIGH = 'TAU_OL_CI_HIGH'
+    ETA0_OL = 'ETA0_OL'
+    ETA0_OL_CI_LOW = 'ETA0_OL_CI_LOW'
+    ETA0_OL_CI_HIGH = 'ETA0_OL_CI_HIGH'
+    ETA1_OL = 'ETA1_OL'
+    ETA1_OL_CI_LOW = 'ETA1_OL_CI_LOW'
+    ETA1_OL_CI_HIGH = 'ETA1_OL_CI_HIGH'
+    KV_K = 'KV_K'
+    KV_ETA = 'KV_ETA'
+    SLS_K0 = 'SLS_K0'
+    SLS_K1 = 'SLS_K1'
+    SLS_TAU = 'SLS_TAU'
+    MAXWELL_K = 'MAXWELL_K'
+    MAXWELL_ETA = 'MAXWELL_ETA'
+    POWER_K = 'POWER_K'
+    POWER_A = 'POWER_A'
+    POWER_BETA = 'POWER_BETA'
+    MODEL = 'MODEL'
+    MODEL_AIC = 'MODEL_AIC'
+    MODEL_BIC = 'MODEL_BIC'
     
     @classmethod
     def has_value(cls, value):
-        return any(value == item.value for item in cls)
+        return value in cls._value2member_map_
     
     
 class PatientKeys(Enum):
@@ -66,14 +117,159 @@ class PatientKeys(Enum):
     CLINIC = 'CLINIC'
     OOCYTE_NUMBER = 'OOCYTE'
     POSITION = 'POSITION'
+    ASPIRATION = 'ASPIRATION'       # number of the aspiration of the oocyte, 1 if not set
     
     @classmethod
     def has_value(cls, value):
-        return any(value == item.value for item in cls)
+        return value in cls._value2member_map_
+
+
+def _field_types():
+    """ The type of the value of each key """
+    types = {}
+    for key in PatientKeys:
+        types[key] = str if key == PatientKeys.CLINIC else int
+    for key in PropertyKeys:
+        types[key] = float
+    for key in (PropertyKeys.VIDEO_FRAMES, PropertyKeys.APPLIED_FORCE_TRACE,
+                PropertyKeys.TIME, PropertyKeys.ASPIRATION_DEPTH_ZONA_PIXEL,
+                PropertyKeys.ASPIRATION_DEPTH_ZONA_MECH,
+                PropertyKeys.ASPIRATION_DEPTH_OOLEMMA_PIXEL,
+                PropertyKeys.ASPIRATION_DEPTH_OOLEMMA_MECH):
+        types[key] = list
+    types[PropertyKeys.ZONA_POSITION] = int
+    for key in ParameterKeys:
+        types[key] = float
+    types[ParameterKeys.MODEL] = str
+    for key in OutcomesKeys:
+        types[key] = int
+    types[OutcomesKeys.BLASTGRADE] = str
+    types[OutcomesKeys.D3GRADE] = str
+    return types
+
+
+FIELD_TYPES = _field_types()    # Type of the value of each key
+
+_FIELDS = tuple(key.value for key in FIELD_TYPES)                   # Order of the values
+_FIELD_INDEX = {value: i for i, value in enumerate(_FIELDS)}        # Position of each value
+_KEY_LOOKUP = {key.value: key for key in FIELD_TYPES}               # Key of each value
+_SCALAR_TYPES = {int: (int, np.integer), float: (float, np.floating)}
+_VALIDATORS = {key: _SCALAR_TYPES.get(value_type, (value_type,))
+               for key, value_type in FIELD_TYPES.items()}
+_VALIDATORS[PropertyKeys.VIDEO_FRAMES] = (list, BlobRef)   # Frames may be kept in a BlobStore
+TRACE_KEYS = (PropertyKeys.TIME, PropertyKeys.APPLIED_FORCE_TRACE,
+              PropertyKeys.ASPIRATION_DEPTH_ZONA_PIXEL,
+              PropertyKeys.ASPIRATION_DEPTH_ZONA_MECH,
+              PropertyKeys.ASPIRATION_DEPTH_OOLEMMA_PIXEL,
+              PropertyKeys.ASPIRATION_DEPTH_OOLEMMA_MECH)  # Traces that may be kept in a TraceArchive
+for _key in TRACE_KEYS:
+    _VALIDATORS[_key] = (list, TraceRef)
+_NAMES = {PatientKeys: 'Info', OutcomesKeys: 'Outcome',
+          PropertyKeys: 'Property', ParameterKeys: 'Parameter'}
+
+
+def _validate(key, value):
+    """
+    Check the type of a value for a key.
+    
+    args:
+        key (Enum): an attribute of one of the key classes
+        value:      the value to check
+    """
+    types = _VALIDATORS[key]
+    if not isinstance(value, types):
+        raise TypeError('{} is invalid. Expected {},'
+                        ' but got {} instead.'.format(_NAMES[type(key)], types[0], type(value)))
+
+
+def validate_dataframe(data):
+    """
+    Check the columns of a table of measurements against the types of the
+    keys. Every column is checked at once and all invalid cells are reported
+    together. Columns that are no key of a measurement and columns of list
+    properties (e.g. VIDEO_FRAMES) are ignored. Empty cells (NaN or None)
+    are values that are not set.
+    
+    args:
+        data (DataFrame):   one measurement per row with the key values as
+                            column names
+    returns:
+        columns (dict):     a masked array (int64, float64 or object) for
+                            each key value, masked where the cell is empty
+    """
+    if not isinstance(data, pd.DataFrame):
+        raise TypeError('Data is invalid. Expected {},'
+                        ' but got {} instead.'.format(pd.DataFrame, type(data)))
+    columns = {}
+    errors = []
+    for value in _FIELDS:
+        value_type = FIELD_TYPES[_KEY_LOOKUP[value]]
+        if value not in data.columns or value_type is list:
+            continue
+        column = data[value]
+        missing = column.isna().to_numpy()
+        if value_type is str:
+            if pd.api.types.is_numeric_dtype(column):
+                invalid = ~missing
+            else:
+                invalid = ~missing & ~column.astype(object).map(_is_str).to_numpy(dtype=bool)
+            values = column.to_numpy(dtype=object)
+        else:
+            numbers = pd.to_numeric(column, errors='coerce').to_numpy(dtype=np.float64)
+            invalid = ~missing & np.isnan(numbers)
+            if value_type is int:
+                invalid |= ~missing & ~np.isnan(numbers) & (np.mod(numbers, 1) != 0)
+            numbers = np.where(missing | invalid, -1, numbers)
+            values = numbers.astype(np.int64) if value_type is int else numbers
+        if invalid.any():
+            errors.append('{} expected {} in rows {}, but got {} instead'.format(
+                value, value_type, data.index[invalid].tolist(),
+                column[invalid].tolist()))
+        columns[value] = np.ma.masked_array(values, mask=missing)
+    if errors:
+        raise ValueError('Data is invalid. ' + '; '.join(errors) + '.')
+    return columns
+
+
+def _is_str(value):
+    return isinstance(value, str)
+
+
+class MeasurementData(Mapping):
+    """
+    A read-only dict-like view of the values of a measurement. The values
+    are set with the setters of Measurement.
+    """
+    __slots__ = ('_values',)
+    
+    def __init__(self, values):
+        self._values = values
+    
+    def __getitem__(self, key):
+        return self._values[_FIELD_INDEX[key]]
+    
+    def __iter__(self):
+        return iter(_FIELDS)
+    
+    def __len__(self):
+        return len(_FIELDS)
+    
+    def __contains__(self, key):
+        return key in _FIELD_INDEX
+    
+    def __repr__(self):
+        return repr(dict(self))
 
 
 class Measurement:
-    """ A container class to store data from aspiration depth measurements """
+    """
+    A container class to store data from aspiration depth measurements.
+    
+    The values are kept in one list in the order of FIELD_TYPES, with -1 for
+    values that are not set. Keys are looked up in precomputed tables, so
+    creating a measurement takes time linear in the number of given values.
+    """
+    __slots__ = ('_values',)
     
     _conversion_factor = 1.55       # Conversion factor for pixels to micrometers: 155 pixels per 100 microns
     _pipette_size = 50.0            # pipette diameter [um]
@@ -94,34 +290,66 @@ class Measurement:
                 raise TypeError('Input {} is invalid. Expected {},'
                                 ' but got {} instead'.format(i+1, dict, type(arg)))
         
-        self.data = {}
-
-        for key in PatientKeys:
-            self.data[key.value] = -1
-        for key, value in patient_info.items():
-            if PatientKeys.has_value(key):
-                self.set_patient_information(PatientKeys(key), value)
-                
-        for key in PropertyKeys:
-            self.data[key.value] = -1
-        if properties:
-            for key, value in properties.items():
-                if PropertyKeys.has_value(key):
-                    self.set_property(PropertyKeys(key), value)
-                    
-        for key in ParameterKeys:
-            self.data[key.value] = -1
-        if parameters:
-            for key, value in parameters.items():
-                if ParameterKeys.has_value(key):
-                    self.set_model_parameter(ParameterKeys(key), value)
-                    
-        for key in OutcomesKeys:
-            self.data[key.value] = -1
-        if outcomes:
-            for key, value in outcomes.items():
-                if OutcomesKeys.has_value(key):
-                    self.set_outcome(OutcomesKeys(key), value)
+        self._values = [-1] * len(_FIELDS)
+        for values, key_class in ((patient_info, PatientKeys), (properties, PropertyKeys),
+                                  (parameters, ParameterKeys), (outcomes, OutcomesKeys)):
+            for key, value in values.items():
+                key = _KEY_LOOKUP.get(key)
+                if type(key) is key_class:
+                    self._set(key, value)
+    
+    @classmethod
+    def from_dataframe(cls, data):
+        """
+        Create a measurement from each row of a table. The table is validated
+        column by column (see validate_dataframe), so the values are not
+        checked again one by one.
+        
+        args:
+            data (DataFrame):   one measurement per row with the key values
+                                as column names
+        returns:
+            measurements (list): list of Measurement instances
+        """
+        columns = validate_dataframe(data)
+        placeholder = [-1] * len(data)
+        values = [columns[value].filled(-1).tolist() if value in columns else placeholder
+                  for value in _FIELDS]
+        measurements = []
+        for row in zip(*values):
+            measurement = cls.__new__(cls)
+            measurement._values = list(row)
+            measurements.append(measurement)
+        return measurements
+    
+    @property
+    def data(self):
+        """ A dict-like view of all values with the key values as keys """
+        return MeasurementData(self._values)
+    
+    @property
+    def aspiration_number(self):
+        """ The number of the aspiration of the oocyte (1 if it is not set) """
+        number = self._values[_FIELD_INDEX[PatientKeys.ASPIRATION.value]]
+        return 1 if number == -1 else number
+    
+    def _set(self, key, value):
+        _validate(key, value)
+        self._values[_FIELD_INDEX[key.value]] = value
+    
+    def set_value(self, key, value):
+        """
+        Set the value of any key.
+        
+        args:
+            key (Enum): an attribute of PatientKeys, OutcomesKeys,
+                        PropertyKeys or ParameterKeys
+            value:      the value
+        """
+        if key not in _VALIDATORS:
+            raise TypeError('Key is invalid. Expected one of {},'
+                            ' but got {} instead.'.format(tuple(_NAMES), type(key)))
+        self._set(key, value)
     
     def set_patient_information(self, key, info):
         """
@@ -134,15 +362,7 @@ class Measurement:
         if not isinstance(key, PatientKeys):
             raise TypeError('Key is invalid. Expected {},' 
                             ' but got {} instead.'.format(PatientKeys, type(key)))
-        if key == PatientKeys.CLINIC:
-            if not isinstance(info, str):
-                raise TypeError('Info is invalid. Expected {},'
-                                ' but got {} instead.'.format(str, type(info)))
-        else:
-            if not isinstance(info, int):
-                raise TypeError('Info is invalid. Expected {},'
-                                ' but got {} instead.'.format(int, type(info)))
-        self.data[key.value] = info
+        self._set(key, info)
     
     def set_outcome(self, key, outcome):
         """ 
@@ -155,15 +375,7 @@ class Measurement:
         if not isinstance(key, OutcomesKeys):
             raise TypeError('Key is invalid. Expected {},'
                             ' but got {} instead.'.format(OutcomesKeys, type(key)))
-        if (key == OutcomesKeys.BLASTGRADE) | (key == OutcomesKeys.D3GRADE):
-            if not isinstance(outcome, str):
-                raise TypeError('Outcome is invalid. Expected {},'
-                                ' but got {} instead.'.format(str, type(outcome)))
-        else:
-            if not isinstance(outcome, int):
-                raise TypeError('Outcome is invalid. Expected {},'
-                                ' but got {} instead.'.format(int, type(outcome)))
-        self.data[key.value] = outcome
+        self._set(key, outcome)
     
     def set_property(self, key, measurement_property):
         """
@@ -176,24 +388,29 @@ class Measurement:
         if not isinstance(key, PropertyKeys):
             raise TypeError('Key is invalid. Expected {},'
                             ' but got {} instead.'.format(PropertyKeys, type(key)))
-        if ((key == PropertyKeys.VIDEO_FRAMES) |
-            (key == PropertyKeys.ASPIRATION_DEPTH_ZONA_MECH) |
-            (key == PropertyKeys.ASPIRATION_DEPTH_ZONA_PIXEL) |
-            (key == PropertyKeys.TIME)): 
-            if not isinstance(measurement_property, list):
-                raise TypeError('Property is invalid. Expected {},'
-                                ' but got {} instead.'.format(list, type(measurement_property)))
-        elif key==PropertyKeys.ZONA_POSITION:
-            if not isinstance(measurement_property, int):
-                raise TypeError('Property is invalid. Expected {},'
-                                ' but got {} instead.'.format(int, type(measurement_property)))
-        else:
-            if not isinstance(measurement_property, float):
-                raise TypeError('Property is invalid. Expected {},'
-                                ' but got {} instead.'.format(float, type(measurement_property)))
-        
-        self.data[key.value] = measurement_property
+        self._set(key, measurement_property)
        
+    def get_property(self, key):
+        """
+        Get a property of a measurement. Properties stored out of line (see
+        BlobStore and TraceArchive) are only read here.
+        
+        args:
+            key (PropertyKey): an attribute of the PropertyKey class
+        returns:
+            the value of the property, the array if it is a BlobRef and a
+            list with the trace if it is a TraceRef
+        """
+        if not isinstance(key, PropertyKeys):
+            raise TypeError('Key is invalid. Expected {},'
+                            ' but got {} instead.'.format(PropertyKeys, type(key)))
+        value = self._values[_FIELD_INDEX[key.value]]
+        if isinstance(value, BlobRef):
+            return value.load()
+        if isinstance(value, TraceRef):
+            return [value.load()]
+        return value
+    
     def set_model_parameter(self, key, parameter):
         """
         Set a model parameter of the modified Zener model.
@@ -205,19 +422,8 @@ class Measurement:
         if not isinstance(key, ParameterKeys):
             raise TypeError('Key is invalid. Expected {},'
                             ' but got {} instead.'.format(ParameterKeys, type(key)))
-        if not isinstance(parameter, float):
-            raise TypeError('Parameter is invalid. Expected {},'
-                            ' but got {} instead.'.format(float, type(parameter)))
-        self.data[key.value] = parameter
+        self._set(key, parameter)
      
         
 if __name__ == '__main__':
     print('Measurement')
-        
-        
-
-        
-
-        
-
-        
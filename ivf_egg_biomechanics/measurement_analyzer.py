@@ -3,47 +3,172 @@
 import numpy as np
 import utils.ioutils as ioutils
 import properties
-from measurement import PropertyKeys, PatientKeys, ParameterKeys
+from blob_store import BlobStore
+from instrumentation import StageRecorder
+import trace_archive
+from measurement import PropertyKeys, PatientKeys, ParameterKeys, TRACE_KEYS
 import oocyte_models
 
 
 class MeasurementAnalyzer(object):
     """
     A class to analyze aspiration depth measurements.
+
+    An analysis runs in three stages: loading the video and pressure files,
+    the annotation of the measurement by the user and the automated tracking
+    and fitting. Only the annotation needs the user, so loading and
+    tracking/fitting can run on a background thread (see AnalysisPipeline).
     """
     SCALE = 4.0
 
-    def __init__(self, measurement):
+    def __init__(self, measurement, use_force_trace=False, blob_store=None,
+                 trace_archive=None, recorder=None, fit_options=None,
+                 model_selection=None, model_executor=None):
+        """
+        Initialize an instance of the analyzer.
+
+        Args:
+            measurement (Measurement):  the measurement to analyze
+            use_force_trace (bool):     True to fit the models to the sampled
+                                        force instead of a step of the mean force
+            blob_store (BlobStore):     store of the video frames, the default
+                                        store if None; the measurement only
+                                        keeps a reference to the frames
+            trace_archive (TraceArchive): archive of the traces after the fit,
+                                        the default archive if None
+            recorder (StageRecorder):   recorder of the time and memory of
+                                        each stage, a new one if None
+            fit_options (dict):         keyword arguments of ModifiedZener.fit,
+                                        e.g. {'starts': 64, 'time_budget': 1.0}
+                                        for a multi-start fit or {'bootstrap':
+                                        500} to also set the confidence
+                                        intervals of the parameters
+            model_selection (str):      'aic' or 'bic' to also fit all
+                                        registered models and store the best
+                                        (see oocyte_models.select_model), None
+                                        to fit only the modified Zener model
+            model_executor (Executor):  executor of the model fits, e.g. a
+                                        ProcessPoolExecutor shared by all
+                                        analyzers, threads if None
+        """
         self.measurement = measurement
+        self.use_force_trace = use_force_trace
+        self.blob_store = BlobStore() if blob_store is None else blob_store
+        self.trace_archive = trace_archive
+        self.recorder = StageRecorder() if recorder is None else recorder
+        self.fit_options = {} if fit_options is None else dict(fit_options)
+        if model_selection not in (None, 'aic', 'bic'):
+            raise ValueError('Expected aic, bic or None, but got {} instead.'.format(
+                model_selection))
+        self.model_selection = model_selection
+        self.model_executor = model_executor
+        self._pressure_trace = None
+        self._decoded_frames = None
+        self._frame_rate = None
+        self._aspiration_depth = None
+
+    def _rotation_angle(self):
+        """ Angle by which the videos of the clinic have to be rotated """
+        if self.measurement.data[PatientKeys.CLINIC.value] == 'CHINA':
+            return 90
+        return 180
+
+    def _stage(self, name):
+        """ Record a stage of the analysis of the measurement """
+        return self.recorder.stage(
+            name, patient=self.measurement.data[PatientKeys.PATIENT_NUMBER.value],
+            oocyte=self.measurement.data[PatientKeys.OOCYTE_NUMBER.value])
 
     def _prepare_property_extraction(self):
         """ Read in a video and pressure file and store information """
-        if self.measurement.data[PatientKeys.CLINIC.value] == 'TAIWAN':
-            video_frames, time = ioutils.read_video_file(180)
-        elif self.measurement.data[PatientKeys.CLINIC.value] == 'CHINA':
-            video_frames, time = ioutils.read_video_file(90)
-        else:
-            video_frames, time = ioutils.read_video_file(180)
-        self.measurement.set_property(PropertyKeys.VIDEO_FRAMES, video_frames)
+        with self._stage('read_video') as record:
+            video_frames, time = ioutils.read_video_file(self._rotation_angle())
+            record['frames'] = len(video_frames)
+        pressure_path = ioutils.choose_file('.txt')
+        with self._stage('read_pressure'):
+            self._set_pressure(*ioutils.read_pressure_trace(pressure_path))
+        self._set_video(video_frames, time)
+        return video_frames, time
+
+    def _set_video(self, video_frames, time):
+        with self._stage('store_frames') as record:
+            self.measurement.set_property(PropertyKeys.VIDEO_FRAMES,
+                                          self.blob_store.put(video_frames))
+            record['frames'] = len(video_frames)
         self.measurement.set_property(PropertyKeys.TIME, [time])
+        if self._pressure_trace is not None:
+            # Sample the force at the time points of the video frames
+            pressure = np.interp(time, self._pressure_trace[:, 0], self._pressure_trace[:, 1])
+            self.measurement.set_property(PropertyKeys.APPLIED_FORCE_TRACE,
+                                          [self._pressure_to_force(pressure)])
 
-        pressure = ioutils.read_pressure_file()
-        self.measurement.set_property(PropertyKeys.APPLIED_PRESSURE, pressure)
+    def _pressure_to_force(self, pressure):
         # Calculate the applied force
         # Formula: Force = Pressure * Area
         # Area = (d/2)^2 * pi
         # Psi to N/m^2 := 6894.76 N/m2/psi
         # um to m := 10**-6 m/um
-        force = (pressure * 6894.76 * np.pi * (self.measurement._pipette_size / 2.0 * (10 ** -6)) ** 2)
-        self.measurement.set_property(PropertyKeys.APPLIED_FORCE, force)
-        return video_frames, time
+        return (pressure * 6894.76 * np.pi * (self.measurement._pipette_size / 2.0 * (10 ** -6)) ** 2)
+
+    def _set_pressure(self, pressure_trace, pressure):
+        self._pressure_trace = pressure_trace
+        self.measurement.set_property(PropertyKeys.APPLIED_PRESSURE, pressure)
+        self.measurement.set_property(PropertyKeys.APPLIED_FORCE,
+                                      self._pressure_to_force(pressure))
+
+    def load(self, video_path, pressure_path):
+        """
+        Decode the video and parse the pressure file of the measurement.
+        Does not interact with the user.
+
+        Args:
+            video_path (str):       full path to the video file
+            pressure_path (str):    full path to the pressure log file
+        """
+        return self.load_decoded(*self.decode(video_path), pressure_path)
+
+    def decode(self, video_path):
+        """
+        Decode the video of the measurement, rotated for the clinic.
+
+        Args:
+            video_path (str):       full path to the video file
+        Returns:
+            frames (list):          the grayscale video frames
+            frame_rate (float):     frame rate of the video [fps]
+        """
+        with self._stage('decode') as record:
+            frames, frame_rate = ioutils.decode_video_file(video_path, self._rotation_angle())
+            record['frames'] = len(frames)
+        return frames, frame_rate
+
+    def load_decoded(self, frames, frame_rate, pressure_path):
+        """
+        Use decoded video frames, which may be shared with the other
+        measurements of the video (see decode), and parse the pressure file
+        of the measurement. The frames are not copied or changed.
+        Does not interact with the user.
+
+        Args:
+            frames (list):          the grayscale video frames
+            frame_rate (float):     frame rate of the video [fps]
+            pressure_path (str):    full path to the pressure log file
+        """
+        self._decoded_frames, self._frame_rate = frames, frame_rate
+        with self._stage('read_pressure'):
+            self._set_pressure(*ioutils.read_pressure_trace(pressure_path))
+        return self
 
     def _extract_properties(self, manual=False):
         (video_frames, time) = self._prepare_property_extraction()
-        pipette_size = properties.PipetteSize(video_frames, self.SCALE)
+        self._annotate_properties(video_frames, time, manual)
+        self._track_aspiration_depth()
 
-        self.measurement.set_property(PropertyKeys.PIPETTE_SIZE_PIXEL,
-                                      pipette_size.extract_property())
+    def _annotate_properties(self, video_frames, time, manual):
+        pipette_size = properties.PipetteSize(video_frames, self.SCALE)
+        with self._stage('pipette_size'):
+            self.measurement.set_property(PropertyKeys.PIPETTE_SIZE_PIXEL,
+                                          pipette_size.extract_property())
 
         self.measurement.set_property(PropertyKeys.MANUAL_CONVERSION_FACTOR,
                                       self.measurement.data[
@@ -51,18 +176,27 @@ class MeasurementAnalyzer(object):
                                       / self.measurement._pipette_size)
 
         pipette_position = properties.PipettePosition(video_frames, self.SCALE)
-        self.measurement.set_property(PropertyKeys.PIPETTE_TIP_POSITION,
-                                      pipette_position.extract_property())
+        with self._stage('pipette_position'):
+            self.measurement.set_property(PropertyKeys.PIPETTE_TIP_POSITION,
+                                          pipette_position.extract_property())
 
         zona_thickness = properties.ZonaThickness(video_frames, self.SCALE,
                                                   self.measurement._conversion_factor)
-        self.measurement.set_property(PropertyKeys.ZONA_THICKNESS,
-                                      zona_thickness.extract_property())
+        with self._stage('zona_thickness'):
+            self.measurement.set_property(PropertyKeys.ZONA_THICKNESS,
+                                          zona_thickness.extract_property())
+
+        self._aspiration_depth = properties.AspirationDepth(
+            video_frames, self.SCALE,
+            self.measurement.data[PropertyKeys.ZONA_THICKNESS.value],
+            self.measurement._conversion_factor, time, manual)
+        with self._stage('select_regions'):
+            self._aspiration_depth.select_regions()
 
-        aspiration_depth = properties.AspirationDepth(video_frames, self.SCALE,
-                                                      self.measurement.data[PropertyKeys.ZONA_THICKNESS.value],
-                                                      self.measurement._conversion_factor, time, manual)
-        results = aspiration_depth.extract_property()
+    def _track_aspiration_depth(self):
+        with self._stage('track') as record:
+            results = self._aspiration_depth.track()
+            record['frames'] = len(self._aspiration_depth.video_frames)
         zona_position, aspiration_depth_pixel, aspiration_depth_mechanical = results
 
         self.measurement.set_property(PropertyKeys.ZONA_POSITION, zona_position)
@@ -70,22 +204,125 @@ class MeasurementAnalyzer(object):
                                       [aspiration_depth_pixel])
         self.measurement.set_property(PropertyKeys.ASPIRATION_DEPTH_ZONA_MECH,
                                       [aspiration_depth_mechanical])
+        if self._aspiration_depth.aspiration_depth_oolemma_mechanical is not None:
+            self.measurement.set_property(
+                PropertyKeys.ASPIRATION_DEPTH_OOLEMMA_PIXEL,
+                [self._aspiration_depth.aspiration_depth_oolemma_pixel])
+            self.measurement.set_property(
+                PropertyKeys.ASPIRATION_DEPTH_OOLEMMA_MECH,
+                [self._aspiration_depth.aspiration_depth_oolemma_mechanical])
+
+    def annotate(self, manual=False, time_valve_opened=None, roi_center=None):
+        """
+        Let the user annotate a loaded measurement: select the frame before
+        the first movement, the region of interest and the properties.
+        In manual mode the aspiration depth is tracked here as well.
+
+        Args:
+            manual (bool):              True to track the aspiration depth manually
+            time_valve_opened (int):    frame number before the first movement,
+                                        asks the user if None
+            roi_center (tuple):         center (x, y) of the region of interest,
+                                        asks the user if None
+        """
+        with self._stage('select_frames') as record:
+            video_frames, time = ioutils.select_measurement_frames(
+                self._decoded_frames, self._frame_rate, time_valve_opened, roi_center)
+            record['frames'] = len(video_frames)
+        self._decoded_frames = None
+        self._set_video(video_frames, time)
+        self._annotate_properties(video_frames, time, manual)
+        if manual:
+            self._track_aspiration_depth()
+        return self
+
+    def track_and_fit(self):
+        """
+        Track the aspiration depth automatically (if not done during the
+        annotation) and fit the models. Does not interact with the user.
+        """
+        if not self._aspiration_depth.manual:
+            self._track_aspiration_depth()
+        self._fit_models(plot=False)
+        self._archive_traces()
+        return self.measurement
 
-    def _fit_models(self):
-        time = self.measurement.data[PropertyKeys.TIME.value][0]
-        aspiration_depth = self.measurement.data[
-            PropertyKeys.ASPIRATION_DEPTH_ZONA_MECH.value][0]
+    def _archive_traces(self):
+        """ Move the traces of the measurement into the trace archive """
+        if self.trace_archive is None:
+            self.trace_archive = trace_archive.open_archive()
+        patient_number = self.measurement.data[PatientKeys.PATIENT_NUMBER.value]
+        oocyte_number = self.measurement.data[PatientKeys.OOCYTE_NUMBER.value]
+        aspiration_number = self.measurement.aspiration_number
+        traces = {}
+        for key in TRACE_KEYS:
+            value = self.measurement.data[key.value]
+            if isinstance(value, list):
+                traces[(patient_number, oocyte_number, key.value, aspiration_number)] = value[0]
+        with self._stage('archive_traces'):
+            references = self.trace_archive.append(traces)
+        for (patient_number, oocyte_number, name, aspiration_number), reference in \
+                references.items():
+            self.measurement.set_property(PropertyKeys(name), reference)
+
+    def _fit_models(self, plot=True):
+        time = self.measurement.get_property(PropertyKeys.TIME)[0]
+        aspiration_depth = self.measurement.get_property(
+            PropertyKeys.ASPIRATION_DEPTH_ZONA_MECH)[0]
         applied_force = self.measurement.data[PropertyKeys.APPLIED_FORCE.value]
+        force_trace = None
+        if self.use_force_trace:
+            force_trace = self.measurement.get_property(PropertyKeys.APPLIED_FORCE_TRACE)[0]
         modified_zener = oocyte_models.ModifiedZener(time, aspiration_depth,
-                                                     applied_force)
-        params = modified_zener.fit()
+                                                     applied_force, force_trace)
+        with self._stage('fit') as record:
+            params = modified_zener.fit(plot=plot, **self.fit_options)
+            record['frames'] = len(time)
         for key, value in params.items():
             if ParameterKeys.has_value(key):
                 self.measurement.set_model_parameter(ParameterKeys(key), value)
+        oolemma_depth = self.measurement.get_property(PropertyKeys.ASPIRATION_DEPTH_OOLEMMA_MECH)
+        if isinstance(oolemma_depth, list):
+            self._fit_oolemma(time, oolemma_depth[0], applied_force, force_trace)
+        if self.model_selection is not None:
+            self._select_model(time, aspiration_depth, applied_force, force_trace, params)
+
+    def _fit_oolemma(self, time, aspiration_depth, applied_force, force_trace):
+        """ Fit the modified Zener model to the oolemma and store the parameters as _OL """
+        modified_zener = oocyte_models.ModifiedZener(time, aspiration_depth,
+                                                     applied_force, force_trace)
+        with self._stage('fit_oolemma') as record:
+            params = modified_zener.fit(plot=False, **self.fit_options)
+            record['frames'] = len(time)
+        for key, value in params.items():
+            key = key.replace('_ZP', '_OL')
+            if ParameterKeys.has_value(key):
+                self.measurement.set_model_parameter(ParameterKeys(key), value)
+
+    def _select_model(self, time, aspiration_depth, applied_force, force_trace, zener_params):
+        """
+        Fit the other registered models and store their parameters and the
+        best model. The modified Zener model is not fitted again; its
+        criteria are those of the stored parameters (zener_params).
+        """
+        with self._stage('select_model') as record:
+            best, results = oocyte_models.select_model(
+                time, aspiration_depth, applied_force, force_trace, self.model_selection,
+                weighted=self.fit_options.get('weighted', True), executor=self.model_executor,
+                fitted={oocyte_models.ModifiedZener.NAME: zener_params})
+            record['frames'] = len(time)
+        for name, result in results.items():
+            for key, value in result['params'].items():
+                if ParameterKeys.has_value(key):
+                    self.measurement.set_model_parameter(ParameterKeys(key), value)
+        self.measurement.set_model_parameter(ParameterKeys.MODEL, best)
+        self.measurement.set_model_parameter(ParameterKeys.MODEL_AIC, results[best]['aic'])
+        self.measurement.set_model_parameter(ParameterKeys.MODEL_BIC, results[best]['bic'])
 
     def analyze(self, manual=False):
         self._extract_properties(manual)
         self._fit_models()
+        self._archive_traces()
         return True
 
 
@@ -0,0 +1,425 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import warnings
+import numpy as np
+import pandas as pd
+from measurement import (Measurement, PatientKeys, ParameterKeys, FIELD_TYPES,
+                         validate_dataframe)
+
+
+class MeasurementStore(object):
+    """
+    A columnar store of many measurements.
+
+    Every key of a measurement is stored in its own typed array together with
+    a mask of valid entries instead of the -1 placeholder of Measurement.
+    The rows are indexed by (PATIENT_NUMBER, OOCYTE, ASPIRATION), so several
+    aspirations of an oocyte are kept apart; a missing ASPIRATION is the
+    first aspiration. The model parameters,
+    the age and the number of mature oocytes are stored side by side in one
+    float array, so the feature matrix of the classifier is exported without
+    copying.
+    """
+    KEY_FIELDS = (PatientKeys.PATIENT_NUMBER, PatientKeys.OOCYTE_NUMBER)
+    FEATURE_KEYS = (ParameterKeys.K0_ZP, ParameterKeys.K1_ZP,
+                    ParameterKeys.TAU_ZP, ParameterKeys.ETA0_ZP,
+                    ParameterKeys.ETA1_ZP, PatientKeys.PATIENT_AGE,
+                    PatientKeys.MATURE_OOCYTES)
+    _DTYPES = {int: np.int64, float: np.float64, str: object, list: object}
+
+    def __init__(self, capacity=64, blob_store=None, trace_archive=None):
+        """
+        Initialize an empty store.
+
+        Args:
+            capacity (int):                 number of rows to allocate initially
+            blob_store (BlobStore):         store of the frames referenced as
+                                            text (see to_measurement), or None
+            trace_archive (TraceArchive):   archive of the traces referenced as
+                                            text, or None
+        """
+        self.blob_store = blob_store
+        self.trace_archive = trace_archive
+        self._size = 0
+        self._index = {}
+        self._allocate(max(int(capacity), 1))
+
+    @classmethod
+    def from_dataframe(cls, data):
+        """
+        Create a store from a table of measurements. The columns are
+        validated at once (see measurement.validate_dataframe). Rows without
+        a patient or oocyte number and repeated rows of a measurement are
+        skipped with a warning instead of failing the whole table.
+
+        Args:
+            data (DataFrame):   one measurement per row with the key values
+                                as column names
+        Returns:
+            store (MeasurementStore): the store of the measurements
+        """
+        columns = validate_dataframe(data)
+        store = cls(capacity=len(data))
+        if all(key.value in columns for key in cls.KEY_FIELDS):
+            keep = ~np.any([np.ma.getmaskarray(columns[key.value]) for key in cls.KEY_FIELDS],
+                           axis=0)
+            seen = set()
+            for i, key in enumerate(zip(*(keys.tolist() for keys in store._key_arrays(columns)))):
+                if keep[i]:
+                    keep[i] = key not in seen
+                    seen.add(key)
+            if not keep.all():
+                warnings.warn('Skipped rows {} without a patient or oocyte number or of a '
+                              'measurement in an earlier row.'.format(
+                                  data.index[~keep].tolist()))
+                columns = {key: values[keep] for key, values in columns.items()}
+        if len(data):
+            store.insert(columns)
+        return store
+
+    def __len__(self):
+        return self._size
+
+    def _allocate(self, capacity):
+        """ (Re)allocate the arrays for the given number of rows """
+        size = self._size
+        features = np.zeros((capacity, len(self.FEATURE_KEYS)), order='F')
+        columns = {}
+        masks = {}
+        for key, value_type in FIELD_TYPES.items():
+            if key in self.FEATURE_KEYS:
+                column = features[:, self.FEATURE_KEYS.index(key)]
+            else:
+                column = np.zeros(capacity, dtype=self._DTYPES[value_type])
+            mask = np.zeros(capacity, dtype=bool)
+            if size:
+                column[:size] = self._columns[key.value][:size]
+                mask[:size] = self._masks[key.value][:size]
+            columns[key.value] = column
+            masks[key.value] = mask
+        self._features = features
+        self._columns = columns
+        self._masks = masks
+        self._capacity = capacity
+
+    def _reserve(self, size):
+        if size > self._capacity:
+            self._allocate(max(size, 2 * self._capacity))
+
+    @staticmethod
+    def _check_key(key):
+        """ Get the value of a key given as enum or str """
+        value = getattr(key, 'value', key)
+        if value not in _FIELDS:
+            raise KeyError('{} is not a key of a measurement.'.format(key))
+        return value
+
+    def _assign(self, key, rows, values):
+        """ Write values into rows of a column; None and NaN are missing """
+        column = self._columns[key]
+        mask = self._masks[key]
+        if column.dtype == object:
+            masked = np.ma.getmask(values)
+            values = list(np.ma.getdata(values) if np.ma.isMaskedArray(values) else values)
+            if len(values) != len(rows):
+                raise ValueError('Expected {} values for {}, but got {} instead.'.format(
+                    len(rows), key, len(values)))
+            valid = np.fromiter((_is_valid(value) for value in values),
+                                dtype=bool, count=len(values))
+            if masked is not np.ma.nomask:
+                valid &= ~masked
+            for row, value, is_valid in zip(rows, values, valid):
+                column[row] = value if is_valid else None
+        else:
+            values = np.ma.asarray(values)
+            if values.shape != (len(rows),):
+                raise ValueError('Expected {} values for {}, but got {} instead.'.format(
+                    len(rows), key, values.shape))
+            valid = ~np.ma.getmaskarray(values)
+            data = np.ma.getdata(values)
+            if data.dtype == object:
+                valid &= np.fromiter((_is_valid(value) for value in data),
+                                     dtype=bool, count=len(data))
+                data = np.where(valid, data, 0)
+            if data.dtype.kind == 'f':
+                valid &= ~np.isnan(data)
+            column[rows] = np.where(valid, data, 0).astype(column.dtype)
+        mask[rows] = valid
+
+    def _key_arrays(self, columns):
+        keys = []
+        for key in self.KEY_FIELDS:
+            if key.value not in columns:
+                raise KeyError('The columns need the key {}.'.format(key.value))
+            keys.append(np.asarray(columns[key.value]).astype(np.int64))
+        keys.append(_aspiration_numbers(columns.get(PatientKeys.ASPIRATION.value),
+                                        len(keys[0])))
+        return keys
+
+    def insert(self, columns):
+        """
+        Insert several measurements at once.
+
+        Args:
+            columns (dict): a sequence of values for each key (str or enum);
+                            PATIENT_NUMBER and OOCYTE are required, None or
+                            NaN are stored as missing (the first
+                            aspiration for ASPIRATION)
+        Returns:
+            rows (array):   the rows of the new measurements
+        """
+        columns = {self._check_key(key): values for key, values in columns.items()}
+        new_keys = list(zip(*(keys.tolist() for keys in self._key_arrays(columns))))
+        duplicates = [key for key in new_keys if key in self._index]
+        if duplicates or len(set(new_keys)) != len(new_keys):
+            raise ValueError('Measurements {} are already in the store.'.format(
+                duplicates or new_keys))
+        rows = np.arange(self._size, self._size + len(new_keys))
+        self._reserve(self._size + len(new_keys))
+        for key, values in columns.items():
+            self._assign(key, rows, values)
+        self._size += len(new_keys)
+        self._index.update(zip(new_keys, rows.tolist()))
+        return rows
+
+    def update(self, columns):
+        """
+        Update several existing measurements at once. Only the given keys
+        of the given rows are written.
+
+        Args:
+            columns (dict): a sequence of values for each key (str or enum);
+                            PATIENT_NUMBER, OOCYTE and ASPIRATION identify
+                            the rows
+        Returns:
+            rows (array):   the updated rows
+        """
+        columns = {self._check_key(key): values for key, values in columns.items()}
+        rows = self.rows(*self._key_arrays(columns))
+        for key, values in columns.items():
+            self._assign(key, rows, values)
+        return rows
+
+    def rows(self, patient_numbers, oocyte_numbers, aspiration_numbers=None):
+        """
+        Look up the rows of measurements.
+
+        Args:
+            patient_numbers (array of int):     patient numbers
+            oocyte_numbers (array of int):      oocyte numbers
+            aspiration_numbers (array of int):  aspiration numbers, the first
+                                                aspirations if None
+        Returns:
+            rows (array):   the rows of the measurements
+        """
+        patient_numbers = np.asarray(patient_numbers)
+        aspiration_numbers = _aspiration_numbers(aspiration_numbers, len(patient_numbers))
+        keys = list(zip(patient_numbers.tolist(), np.asarray(oocyte_numbers).tolist(),
+                        aspiration_numbers.tolist()))
+        missing = [key for key in keys if key not in self._index]
+        if missing:
+            raise KeyError('Measurements {} are not in the store.'.format(missing))
+        return np.fromiter((self._index[key] for key in keys), dtype=np.int64,
+                           count=len(keys))
+
+    def row(self, patient_number, oocyte_number, aspiration_number=1):
+        """ The row of a single measurement """
+        try:
+            return self._index[(int(patient_number), int(oocyte_number), int(aspiration_number))]
+        except KeyError:
+            raise KeyError('Measurement ({}, {}, {}) is not in the store.'.format(
+                patient_number, oocyte_number, aspiration_number))
+
+    def column(self, key):
+        """ The values of a key (a view, invalid entries are undefined) """
+        return self._columns[self._check_key(key)][:self._size]
+
+    def mask(self, key):
+        """ True where the value of a key is valid (a view) """
+        return self._masks[self._check_key(key)][:self._size]
+
+    def select(self, key, value):
+        """ The rows where a key has a valid entry equal to value """
+        key = self._check_key(key)
+        return np.flatnonzero(self.mask(key) & (self.column(key) == value))
+
+    def feature_matrix(self, rows=None):
+        """
+        The features used by the classifier (see FEATURE_KEYS).
+
+        Args:
+            rows (array):   rows to export, all rows if None
+        Returns:
+            features (array):   array (size: NxF); a view of the store if
+                                rows is None
+            mask (array):       True where the features are valid
+        """
+        features = self._features[:self._size]
+        mask = np.column_stack([self.mask(key) for key in self.FEATURE_KEYS])
+        if rows is None:
+            return features, mask
+        return features[rows], mask[rows]
+
+    def insert_measurements(self, measurements):
+        """ Insert Measurement instances; -1 entries are stored as missing """
+        return self.insert(self._measurement_columns(measurements))
+
+    def update_measurements(self, measurements):
+        """ Update the rows of Measurement instances; -1 entries are stored as missing """
+        return self.update(self._measurement_columns(measurements))
+
+    @staticmethod
+    def _measurement_columns(measurements):
+        columns = {key: [] for key in _FIELDS}
+        for measurement in measurements:
+            for key in _FIELDS:
+                value = measurement.data[key]
+                columns[key].append(None if _is_placeholder(value) else value)
+        return columns
+
+    def to_measurement(self, row, blob_store=None, trace_archive=None):
+        """
+        Create a Measurement from a row; missing entries are -1. Frames and
+        traces stored as the text of a reference (e.g. after load) are
+        referenced in the given blob store and trace archive.
+
+        Args:
+            row (int):                      the row
+            blob_store (BlobStore):         store of the frames, the one of the
+                                            store if None
+            trace_archive (TraceArchive):   archive of the traces, the one of
+                                            the store if None
+        Returns:
+            measurement (Measurement):      the measurement of the row
+        """
+        blob_store = self.blob_store if blob_store is None else blob_store
+        trace_archive = self.trace_archive if trace_archive is None else trace_archive
+        measurement = Measurement({})
+        for key in _FIELDS:
+            if self._masks[key][row]:
+                measurement.set_value(_KEYS[key], _to_python(self._columns[key][row],
+                                                             FIELD_TYPES[_KEYS[key]],
+                                                             blob_store, trace_archive))
+        return measurement
+
+    def save(self, path):
+        """
+        Save the store into an .npz file with the values and the mask of
+        each key. Text values and references (e.g. BlobRef) are saved as
+        text, traces kept in memory are not saved. The file is replaced
+        atomically.
+
+        Args:
+            path (str): path of the .npz file
+        """
+        arrays = {}
+        for key in _FIELDS:
+            column = self.column(key)
+            mask = self.mask(key).copy()
+            if column.dtype == object:
+                mask &= np.fromiter((not isinstance(value, list) for value in column),
+                                    dtype=bool, count=len(column))
+                column = np.array([str(value) if valid else '' for value, valid
+                                   in zip(column, mask)], dtype=str)
+            arrays[key + '.values'] = column
+            arrays[key + '.mask'] = mask
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(suffix='.npz', dir=directory)
+        try:
+            with os.fdopen(handle, 'wb') as store_file:
+                np.savez(store_file, **arrays)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    @classmethod
+    def load(cls, path, blob_store=None, trace_archive=None):
+        """
+        Load a store saved with save.
+
+        Args:
+            path (str):                     path of the .npz file
+            blob_store (BlobStore):         store of the frames referenced in the
+                                            file (see to_measurement), or None
+            trace_archive (TraceArchive):   archive of the traces referenced in
+                                            the file, or None
+        Returns:
+            store (MeasurementStore): the loaded store
+        """
+        with np.load(path) as arrays:
+            columns = {}
+            for key in _FIELDS:
+                if key + '.values' not in arrays:
+                    continue
+                values = arrays[key + '.values']
+                if values.dtype.kind == 'U':
+                    values = values.astype(object)
+                columns[key] = np.ma.masked_array(values, mask=~arrays[key + '.mask'])
+        size = len(columns[_FIELDS[0]]) if columns else 0
+        store = cls(capacity=size, blob_store=blob_store, trace_archive=trace_archive)
+        if size:
+            store.insert(columns)
+        return store
+
+    def to_dataframe(self):
+        """ A DataFrame of the store with NaN for missing entries """
+        data = {}
+        for key in _FIELDS:
+            column = self.column(key)
+            if column.dtype != object:
+                column = column.astype(np.float64)
+            data[key] = pd.Series(column).where(self.mask(key))
+        return pd.DataFrame(data)
+
+
+_KEYS = {key.value: key for key in FIELD_TYPES}
+_FIELDS = tuple(_KEYS)
+
+
+def _is_valid(value):
+    if value is None:
+        return False
+    if isinstance(value, float) and np.isnan(value):
+        return False
+    return True
+
+
+def _aspiration_numbers(values, count):
+    """ The aspiration numbers of count rows, 1 where they are missing """
+    if values is None:
+        return np.ones(count, dtype=np.int64)
+    masked = np.ma.getmaskarray(values) if np.ma.isMaskedArray(values) else np.zeros(count, bool)
+    values = np.ma.getdata(values) if np.ma.isMaskedArray(values) else values
+    return np.fromiter((1 if is_masked or not _is_valid(value) or _is_placeholder(value)
+                        else int(value) for value, is_masked in zip(values, masked)),
+                       dtype=np.int64, count=count)
+
+
+def _is_placeholder(value):
+    return isinstance(value, (int, float, np.number)) and value == -1
+
+
+def _to_python(value, value_type, blob_store, trace_archive):
+    if value_type in (int, float):
+        return value_type(value)
+    if value_type is list and isinstance(value, str):
+        # The text of a reference to a blob store or trace archive
+        if value.startswith('blob:'):
+            name, store = 'blob store', blob_store
+        else:
+            name, store = 'trace archive', trace_archive
+        if store is None:
+            raise ValueError('Expected a {} to reference {}, but got None instead.'.format(
+                name, value))
+        return store.ref(value)
+    return value
+
+
+if __name__ == '__main__':
+    store = MeasurementStore()
+    store.insert({'NUMBER': [1, 1], 'OOCYTE': [1, 2], 'K0_ZP': [0.1, np.nan]})
+    print(store.to_dataframe())
@@ -3,22 +3,38 @@
 import pandas as pd
 import numpy as np
 import measurement as m
+from measurement_store import MeasurementStore
+from cohort_index import CohortIndex
+from results_store import ResultsStore
+from instrumentation import StageRecorder, STAGE_LOG, aggregate, format_summary
+from blob_store import BlobRef
+from trace_archive import TraceRef
 from utils import ioutils
-from measurement_analyzer import MeasurementAnalyzer
-import outcome_predictor
 
 
 class Menu:
-    """ Display a menu and run chosen routines. """
+    """
+    Display a menu and run chosen routines.
+
+    The analysis (OpenCV, scikit-image, SciPy, matplotlib) and the
+    classifier (scikit-learn) are imported when their action is chosen
+    for the first time, so the menu is shown without loading them.
+    """
 
     def __init__(self):
         """ Initialize an instance of the Menu class """
         self.patient_data = pd.DataFrame()
+        self.cohort = CohortIndex(self.patient_data)
+        self.store = MeasurementStore()
+        self.results = ResultsStore()
+        self.recorder = StageRecorder(STAGE_LOG)
         self.choices = {
             '1': self.load_patient_data,
             '2': self.analyze_measurement,
             '3': self.train_classifier,
-            '4': self.quit_menu
+            '4': self.analyze_series,
+            '5': self.export_results,
+            '6': self.quit_menu
         }
 
     def display_menu(self):
@@ -30,7 +46,9 @@ class Menu:
               1. Load patient data
               2. Analyze a measurement
               3. Train classifier
-              4. Quit
+              4. Analyze a series of measurements
+              5. Export results to excel
+              6. Quit
               ****************************************
               
               ''')
@@ -57,76 +75,170 @@ class Menu:
     def load_patient_data(self):
         """ Load patient data from excel file """
         print('Loading experimental data...')
-        self.patient_data = ioutils.load_excel_file()
+        patient_data = ioutils.load_excel_file()
+        cohort = CohortIndex(patient_data)
+        try:
+            store = self._create_store(cohort)
+        except ValueError as error:
+            # Report the invalid cells and keep the data loaded before
+            print(error)
+            print('Experimental data not loaded, the previous data is kept.')
+            return True
+        self.patient_data, self.cohort, self.store = patient_data, cohort, store
         print('Experimental data successfully loaded!')
         return True
 
+    @staticmethod
+    def _create_store(cohort):
+        """ Create a store of the measured oocytes of a cohort """
+        if cohort.patient_data.empty:
+            return MeasurementStore()
+        return MeasurementStore.from_dataframe(cohort.rows('MEASURED', 1))
+
+    def _find_measurement(self, patient_number, oocyte_number):
+        """
+        Find a measured oocyte of an existing patient in the patient data.
+        
+        Returns:
+            index (list):       index of the oocyte in the patient data
+            patient_data (DataFrame): the row of the oocyte, None if it does not exist
+        """
+        index = self.cohort.find(patient_number, oocyte_number)
+        if not index:
+            print('This oocyte number does not exist!')
+            return [], None
+        return index, self.patient_data.loc[index[:1]]
+
+    @staticmethod
+    def _ask_manual():
+        """ Ask if the measurement is analyzed manually, None if the answer is invalid """
+        manual = input('Analyze measurement manually [Y/N]? ').upper()
+        if manual == 'Y':
+            return True
+        elif manual == 'N':
+            return False
+        else:
+            print('{} is an invalid option.'.format(manual))
+            return None
+
+    @staticmethod
+    def _create_measurement(patient_data):
+        """ Create a measurement from the patient information and outcomes of a row """
+        columns = [key.value for key in list(m.PatientKeys) + list(m.OutcomesKeys)
+                   if key.value in patient_data.columns]
+        return m.Measurement.from_dataframe(patient_data[columns])[0]
+
+    def _store_measurement(self, measurement, index):
+        """ Write the results of an analyzed measurement into the patient data and the results store """
+        # Only the references of frames and traces stored out of line go into the sheet
+        values = [str(value) if isinstance(value, (BlobRef, TraceRef)) else value
+                  for value in measurement.data.values()]
+        patient_data = pd.DataFrame(data=[values],
+                                    columns=list(measurement.data.keys()),
+                                    index=index)
+        self.patient_data.update(patient_data)
+        self.cohort.invalidate(key.value for key in list(m.PropertyKeys) + list(m.ParameterKeys))
+        self.store.update_measurements([measurement])
+        self.results.record(measurement)
+
+    def export_results(self):
+        """ Write all analyzed measurements into an excel file """
+        filename = ioutils.choose_file('.xlsx')
+        self.results.export_excel(filename)
+        print('Results exported to {}.'.format(filename))
+        return True
+
     def analyze_measurement(self):
         if self.patient_data.empty:
             print('No patient data loaded yet!')
             return True
         print('Preparing measurement analysis ...')
-        patient_data = self.patient_data[self.patient_data['MEASURED'] == 1]
         patient_number = int(input('What is the patient number? '))
-        if not (patient_data[m.PatientKeys.PATIENT_NUMBER.value] == patient_number).any():
+        if not self.cohort.has_patient(patient_number):
             print('This patient number does not exist!')
             return True
-        else:
-            patient_data = patient_data[
-                patient_data[m.PatientKeys.PATIENT_NUMBER.value] == patient_number]
         oocyte_number = int(input('What is the oocyte number? '))
-        if not (patient_data[m.PatientKeys.OOCYTE_NUMBER.value] == oocyte_number).any():
-            print('This oocyte number does not exist!')
+        index, patient_data = self._find_measurement(patient_number, oocyte_number)
+        if patient_data is None:
             return True
-        else:
-            index = self.patient_data.index[
-                (self.patient_data[m.PatientKeys.PATIENT_NUMBER.value] == patient_number) &
-                (self.patient_data[m.PatientKeys.OOCYTE_NUMBER.value] == oocyte_number) &
-                (self.patient_data['MEASURED'] == 1)].tolist()
-            patient_data = patient_data[patient_data[m.PatientKeys.OOCYTE_NUMBER.value] == oocyte_number]
-            keys = patient_data.columns.values.tolist()
-            values = patient_data.values[0].tolist()
-            patient_data = dict(zip(keys, values))
-        manual = input('Analyze measurement manually [Y/N]? ').upper()
-        if manual == 'Y':
-            manual = True
-        elif manual == 'N':
-            manual = False
-        else:
-            print('{} is an invalid option.'.format(manual))
+        manual = self._ask_manual()
+        if manual is None:
             return True
-        patient_info = {patient_key.value: patient_data[patient_key.value]
-                        for patient_key in m.PatientKeys}
-        outcomes = {outcome_key.value: (patient_data[outcome_key.value]
-                                        if isinstance(patient_data[outcome_key.value], str)
-                                        else int(patient_data[outcome_key.value]))
-                    for outcome_key in m.OutcomesKeys}
-        measurement = m.Measurement(patient_info, outcomes)
-        meas_analyzer = MeasurementAnalyzer(measurement)
-        meas_analyzer.analyze(manual)
-        patient_data = pd.DataFrame(data=[measurement.data.values()],
-                                    columns=measurement.data.keys(),
-                                    index=index)
-        self.patient_data.update(patient_data)
-        filename = ioutils.choose_file('.xlsx')
-        self.patient_data.to_excel(filename)
+        from measurement_analyzer import MeasurementAnalyzer
+        from utils.drawing_shape_utils import AnnotationCancelled
+        measurement = self._create_measurement(patient_data)
+        meas_analyzer = MeasurementAnalyzer(measurement, recorder=self.recorder)
+        try:
+            meas_analyzer.analyze(manual)
+        except AnnotationCancelled:
+            print('Analysis cancelled, the measurement is not stored.')
+            return True
+        self._store_measurement(measurement, index)
+        return True
+
+    def analyze_series(self):
+        """
+        Analyze several oocytes of a patient in a pipelined session: the files
+        of all oocytes are chosen first, then the next measurements are
+        loaded and the previous ones are tracked and fitted in the background
+        while the user annotates the current one.
+        """
+        if self.patient_data.empty:
+            print('No patient data loaded yet!')
+            return True
+        print('Preparing measurement series ...')
+        patient_number = int(input('What is the patient number? '))
+        if not self.cohort.has_patient(patient_number):
+            print('This patient number does not exist!')
+            return True
+        oocyte_numbers = input('Which oocyte numbers (separated by commas)? ')
+        oocyte_numbers = [int(number) for number in oocyte_numbers.split(',')
+                          if number.strip()]
+        if len(set(oocyte_numbers)) < len(oocyte_numbers):
+            print('Each oocyte can only be analyzed once in a series!')
+            return True
+        manual = self._ask_manual()
+        if manual is None:
+            return True
+        from analysis_pipeline import AnalysisJob, AnalysisPipeline
+        from utils.drawing_shape_utils import AnnotationCancelled
+        first_record = len(self.recorder.records)
+        jobs = []
+        indices = []
+        for oocyte_number in oocyte_numbers:
+            index, patient_data = self._find_measurement(patient_number, oocyte_number)
+            if patient_data is None:
+                return True
+            print('Choose the video and pressure file of oocyte {}.'.format(oocyte_number))
+            video_path = ioutils.choose_file('.avi')
+            pressure_path = ioutils.choose_file('.txt')
+            jobs.append(AnalysisJob(self._create_measurement(patient_data),
+                                    video_path, pressure_path))
+            indices.append(index)
+        pipeline = AnalysisPipeline(recorder=self.recorder)
+        try:
+            measurements = pipeline.run(
+                jobs, manual,
+                annotated=lambda i: print('Oocyte {} annotated.'.format(oocyte_numbers[i])))
+        except AnnotationCancelled:
+            print('Analysis cancelled, no measurement of the series is stored.')
+            return True
+        for measurement, index in zip(measurements, indices):
+            self._store_measurement(measurement, index)
+        print(format_summary(aggregate(self.recorder.records[first_record:])))
         return True
 
     def train_classifier(self):
-        features = [m.ParameterKeys.K0_ZP.value,
-                    m.ParameterKeys.K1_ZP.value,
-                    m.ParameterKeys.TAU_ZP.value,
-                    m.ParameterKeys.ETA0_ZP.value,
-                    m.ParameterKeys.ETA1_ZP.value,
-                    m.PatientKeys.PATIENT_AGE.value,
-                    m.PatientKeys.MATURE_OOCYTES.value]
-        X = self.patient_data[self.patient_data[
-                                  m.OutcomesKeys.FERTILIZED.value] == 1]
-        X = X[features]
-        X = X.apply(np.log)
-        y = self.patient_data[self.patient_data[
-                                  m.OutcomesKeys.FERTILIZED.value] == 1]
-        y = y[m.OutcomesKeys.ANYBLAST.value]
+        import outcome_predictor
+        rows = self.store.select(m.OutcomesKeys.FERTILIZED, 1)
+        features, valid = self.store.feature_matrix(rows)
+        # Only oocytes with all features and a known outcome
+        complete = valid.all(axis=1) & self.store.mask(m.OutcomesKeys.ANYBLAST)[rows]
+        rows = rows[complete]
+        features = features[complete]
+        X = pd.DataFrame(np.log(features),
+                         columns=[key.value for key in MeasurementStore.FEATURE_KEYS])
+        y = pd.Series(self.store.column(m.OutcomesKeys.ANYBLAST)[rows])
         predictor = outcome_predictor.OutcomePredictor('svm', 'forward')
         X_train, X_test, y_train, y_test = predictor._create_train_test_set(X, y)
         predictor.fit(X_train, y_train)
@@ -1,17 +1,34 @@
 # -*- coding: utf-8 -*-
 
+import inspect
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
 import numpy as np
 from scipy.optimize import minimize
+from scipy.fft import next_fast_len
 from matplotlib import pyplot as plt
 from measurement import ParameterKeys
 
 
-class Model(object):
+class Model(ABC):
     """
     A parent class for different models used to fit the experimental data.
+    A model without its creep compliance or Jacobian is abstract, so it
+    cannot be registered or instantiated.
     """
 
-    def __init__(self, time, aspiration_depth, applied_force):
+    RESIDUAL_SCALE = 1e6    # residuals are computed in micrometers
+    registry = {}           # registered models by name (see register)
+
+    # A model is defined by its creep compliance and the ParameterKeys of
+    # the arguments of the compliance after time (see ModifiedZener)
+    NAME = None
+    KEYS = ()
+    START = ()              # default starting point of a fit
+    START_RANGES = ()       # ranges of the starting points of a multi-start fit
+
+    def __init__(self, time, aspiration_depth, applied_force, force_trace=None):
         """
         Initialize an instance of class Model.
         
@@ -19,6 +36,8 @@ class Model(object):
             time (array of float):   time vector
             aspiration_depth (array of float):  aspiration depth
             applied_force (float):  force applied to the oocyte during measurement
+            force_trace (array of float): force applied at each time point, None
+                                          to model the force as a step
         """
         for i, arg in enumerate([time, aspiration_depth]):
             if not isinstance(arg, np.ndarray):
@@ -32,16 +51,331 @@ class Model(object):
             raise TypeError('Input for applied_force is invalid.'
                             'Expected {}, but got {} instead.'.format(
                 float, type(applied_force)))
+        if force_trace is not None:
+            if not isinstance(force_trace, np.ndarray):
+                raise TypeError('Input for force_trace is invalid. Expected {}, '
+                                'but got {} instead.'.format(np.ndarray, type(force_trace)))
+            if force_trace.shape != time.shape:
+                raise ValueError('Expected a force trace of shape {}, '
+                                 'but got {} instead.'.format(time.shape, force_trace.shape))
         self.time = time
         self.aspiration_depth = aspiration_depth
         self.applied_force = applied_force
+        self.force_trace = force_trace
+
+    @classmethod
+    def register(cls, model):
+        """
+        Register a model class (usable as class decorator), so it is fitted
+        by select_model.
+        
+        Args:
+            model (class):  subclass of Model with NAME, KEYS, START,
+                            START_RANGES and the creep compliance and its
+                            Jacobian
+        Returns:
+            model (class):  the registered class
+        """
+        if not (isinstance(model, type) and issubclass(model, Model)):
+            raise TypeError('Expected a subclass of {}, but got {} instead.'.format(Model, model))
+        if len(model.KEYS) != len(model.START) or len(model.KEYS) != len(model.START_RANGES):
+            raise ValueError('Expected a start value and range for each of the {} parameters '
+                             'of {}.'.format(len(model.KEYS), model.NAME))
+        if inspect.isabstract(model):
+            raise TypeError('Expected the creep compliance and its Jacobian, but {} lacks {} '
+                            'instead.'.format(model.NAME, sorted(model.__abstractmethods__)))
+        Model.registry[model.NAME] = model
+        return model
+
+    @staticmethod
+    @abstractmethod
+    def _creep_compliance(time, *params):
+        """
+        The creep compliance of the model, i.e. the aspiration depth for a
+        unit step of the force. The parameters can be arrays (size: Px1) to
+        calculate the compliance of several parameter sets at once.
+        """
+
+    @staticmethod
+    @abstractmethod
+    def _creep_compliance_jacobian(time, *params):
+        """ The derivatives of the creep compliance (size: ...xKxN) """
+
+    @classmethod
+    def _step_evaluator(cls, time, applied_force):
+        """
+        Create a function that calculates the model output and its Jacobian
+        for a batch of parameter sets (size: PxK) and a step of the force.
+        """
+        def evaluate(params):
+            columns = [params[:, i:i+1] for i in range(params.shape[1])]
+            return (applied_force * cls._creep_compliance(time, *columns),
+                    applied_force * cls._creep_compliance_jacobian(time, *columns))
+        return evaluate
+
+    @classmethod
+    def _trace_evaluator(cls, time, force_trace):
+        """
+        Create a function that calculates the model output and its Jacobian
+        for a batch of parameter sets (size: PxK) and a time-varying force.
+        The compliance and its derivatives are convolved with the force
+        in a single FFT call.
+        """
+        increments = Model._force_increments(force_trace)
+
+        def evaluate(params):
+            columns = [params[:, i:i+1] for i in range(params.shape[1])]
+            compliance = cls._creep_compliance(time, *columns)
+            jacobian = cls._creep_compliance_jacobian(time, *columns)
+            response = Model._superpose(
+                np.concatenate([compliance[:, np.newaxis, :], jacobian], axis=1),
+                increments)
+            return response[:, 0, :], response[:, 1:, :]
+        return evaluate
+
+    @classmethod
+    def _start_ranges(cls, bounds):
+        """ The ranges of the starting points: the bounds where they are positive and finite """
+        if not bounds:
+            return cls.START_RANGES
+        ranges = []
+        for (low, high), (start_low, start_high) in zip(bounds, cls.START_RANGES):
+            low = low if low is not None and low > 0 else start_low
+            high = high if high is not None and np.isfinite(high) else max(start_high, low * 10)
+            ranges.append((low, high))
+        return ranges
+
+    @classmethod
+    def _parameter_dict(cls, *values):
+        """ Convert the fitted values to a dict with ParameterKeys """
+        return {key.value: float(value) for key, value in zip(cls.KEYS, values)}
+
+    @staticmethod
+    def _weights(num_points, weighted=True):
+        """ Weights of the data points: the first points count more if weighted """
+        if weighted:
+            weights = np.repeat(0.1, num_points)
+            weights[0] = 10
+            weights[1:5] = 1
+        else:
+            weights = np.repeat(1, num_points)
+        return weights
+
+    @staticmethod
+    def _force_increments(force_trace):
+        """
+        Steps of a sampled force; the first step is the force at time zero.
+        
+        Args:
+            force_trace (array of float):   force at each time point
+        Returns:
+            increments (array of float):    force increments
+        """
+        return np.diff(force_trace, prepend=0.0)
+
+    @staticmethod
+    def _superpose(compliance, force_increments):
+        """
+        Calculate the creep response to a time-varying force by Boltzmann
+        superposition, i.e. the discrete convolution of the creep compliance
+        with the force increments. The convolution is computed with an FFT
+        along the last axis, so any number of compliances (e.g. for several
+        parameter sets or the derivatives) is convolved in one call.
+        
+        Args:
+            compliance (array of float):        creep compliance sampled at the
+                                                (uniform) time points, size: ...xN
+            force_increments (array of float):  force increments, size: N
+        Returns:
+            response (array of float):  the creep response, size: ...xN
+        """
+        n = compliance.shape[-1]
+        size = next_fast_len(2 * n - 1, real=True)
+        spectrum = (np.fft.rfft(compliance, size, axis=-1)
+                    * np.fft.rfft(force_increments, size))
+        return np.fft.irfft(spectrum, size, axis=-1)[..., :n]
+
+    @staticmethod
+    def _levenberg_marquardt(evaluate, params0, y, weights, bounds=(),
+                             max_iter=200, tol=1e-12, deadline=None):
+        """
+        Fit several parameter sets at once with a Levenberg-Marquardt solver.
+        All parameter sets are updated together with array operations, so
+        fitting a batch costs about as much as fitting a single set. The
+        parameters are optimized on a log scale to keep them positive.
+        
+        Args:
+            evaluate (callable):        function of a parameter array (size: PxK)
+                                        returning the model output (size: PxN)
+                                        and its Jacobian (size: PxKxN)
+            params0 (array of float):   start values (size: PxK)
+            y (array of float):         data to fit (size: N or PxN)
+            weights (array of float):   weight of each data point (size: N)
+            bounds (tuple):             (min, max) for each parameter, or empty
+            max_iter (int):             maximum number of iterations
+            tol (float):                relative change of the cost to stop at
+            deadline (float):           perf_counter() time to stop at, or None
+        Returns:
+            params (array of float):    fitted parameters (size: PxK)
+            cost (array of float):      weighted sum of squared errors (size: P)
+        """
+        params0 = np.atleast_2d(np.asarray(params0, dtype=float))
+        n_params = params0.shape[1]
+        lower = np.full(n_params, -np.inf)
+        upper = np.full(n_params, np.inf)
+        for i, (low, high) in enumerate(bounds):
+            if low is not None and low > 0:
+                lower[i] = np.log(low)
+            if high is not None:
+                upper[i] = np.log(high)
+        sqrt_weights = np.sqrt(weights) * Model.RESIDUAL_SCALE
+
+        def residuals(theta):
+            params = np.exp(theta)
+            output, jacobian = evaluate(params)
+            residual = (output - y) * sqrt_weights
+            jacobian = jacobian * params[:, :, np.newaxis] * sqrt_weights
+            return residual, jacobian, np.einsum('pn,pn->p', residual, residual)
+
+        theta = np.clip(np.log(params0), lower, upper)
+        residual, jacobian, cost = residuals(theta)
+        damping = np.full(len(theta), 1e-3)
+        identity = np.eye(n_params)
+        for i in range(max_iter):
+            hessian = np.einsum('pkn,pln->pkl', jacobian, jacobian)
+            gradient = np.einsum('pkn,pn->pk', jacobian, residual)
+            diagonal = np.einsum('pkk->pk', hessian)
+            system = hessian + (damping[:, np.newaxis, np.newaxis]
+                                * (diagonal[:, :, np.newaxis] * identity + 1e-12 * identity))
+            try:
+                step = np.linalg.solve(system, -gradient[:, :, np.newaxis])[:, :, 0]
+            except np.linalg.LinAlgError:
+                # degenerate parameters, e.g. the delay of a model without delayed
+                # elasticity running off to infinity
+                step = np.einsum('pkl,pl->pk', np.linalg.pinv(system), -gradient)
+            theta_new = np.clip(theta + step, lower, upper)
+            residual_new, jacobian_new, cost_new = residuals(theta_new)
+            better = cost_new < cost
+            improvement = np.where(better, (cost - cost_new) / np.maximum(cost, 1e-300), 0.0)
+            theta[better] = theta_new[better]
+            residual[better] = residual_new[better]
+            jacobian[better] = jacobian_new[better]
+            cost = np.where(better, cost_new, cost)
+            damping = np.where(better, damping / 3.0, damping * 4.0)
+            if np.all((better & (improvement < tol)) | (damping > 1e12)):
+                break
+            if deadline is not None and perf_counter() > deadline:
+                break
+        return np.exp(theta), cost
+
+    @staticmethod
+    def _latin_hypercube(num_points, ranges, rng):
+        """
+        Sample points with a Latin hypercube on a log scale: the range of
+        each parameter is divided into num_points intervals of equal log
+        width and every interval is sampled exactly once.
+        
+        Args:
+            num_points (int):       number of points
+            ranges (list):          (min, max) of each parameter, both positive
+            rng (Generator):        random number generator
+        Returns:
+            points (array of float):    the points (size: num_points x K)
+        """
+        log_ranges = np.log(np.asarray(ranges, dtype=float))
+        strata = np.argsort(rng.random((len(log_ranges), num_points)), axis=1).T
+        fractions = (strata + rng.random(strata.shape)) / num_points
+        return np.exp(log_ranges[:, 0] + fractions * (log_ranges[:, 1] - log_ranges[:, 0]))
+
+    @staticmethod
+    def _multi_start(evaluate, y, weights, ranges, bounds=(), starts=64, refine=4,
+                     time_budget=None, workers=1, seed=0, params0=None):
+        """
+        Fit from many starting points to avoid local minima. The cost of
+        all starting points of a Latin hypercube is computed in a single
+        call of evaluate, then the best few are refined with the batched
+        Levenberg-Marquardt solver, optionally split over threads. The
+        refinement stops at the time budget with the best parameters so far.
+        Starting points with overflowing model outputs are discarded.
+        
+        Args:
+            evaluate (callable):        see _levenberg_marquardt
+            y (array of float):         data to fit (size: N)
+            weights (array of float):   weight of each data point (size: N)
+            ranges (list):              (min, max) of each parameter to sample
+                                        the starting points from
+            bounds (tuple):             (min, max) for each parameter, or empty
+            starts (int):               number of starting points
+            refine (int):               number of starting points to refine
+            time_budget (float):        wall-clock time for the fit [s], or None
+            workers (int):              number of threads for the refinement
+            seed (int):                 seed of the starting points
+            params0 (array of float):   start value that is always refined
+                                        (size: K), or None
+        Returns:
+            params (array of float):    the best parameters (size: K)
+            cost (float):               their weighted sum of squared errors
+        """
+        deadline = None if time_budget is None else perf_counter() + time_budget
+        points = Model._latin_hypercube(starts, ranges, np.random.default_rng(seed))
+        with np.errstate(all='ignore'):
+            return Model._refine_best(evaluate, points, y, weights, bounds, refine,
+                                      deadline, workers, params0)
 
+    @staticmethod
+    def _refine_best(evaluate, points, y, weights, bounds, refine, deadline, workers, params0):
+        """ Refine the best starting points (see _multi_start) """
+        output, jacobian = evaluate(points)
+        residual = (output - y) * np.sqrt(weights) * Model.RESIDUAL_SCALE
+        cost = np.einsum('pn,pn->p', residual, residual)
+        best = points[np.argsort(np.where(np.isfinite(cost), cost, np.inf))[:refine]]
+        if params0 is not None:
+            best = np.vstack([np.asarray(params0, dtype=float), best])
+        params, cost = Model._fit_batch(evaluate, best, y, weights, bounds, workers, deadline)
+        index = np.argmin(np.where(np.isfinite(cost), cost, np.inf))
+        return params[index], float(cost[index])
 
+    @staticmethod
+    def _fit_batch(evaluate, params0, y, weights, bounds=(), workers=1, deadline=None):
+        """
+        Fit a batch with the Levenberg-Marquardt solver, split into one
+        batch per thread if workers > 1 (see _levenberg_marquardt).
+        
+        Args:
+            workers (int):  number of threads
+        Returns:
+            params (array of float):    fitted parameters (size: PxK)
+            cost (array of float):      weighted sum of squared errors (size: P)
+        """
+        params0 = np.atleast_2d(np.asarray(params0, dtype=float))
+        y = np.asarray(y)
+        if workers <= 1 or len(params0) < 2:
+            return Model._levenberg_marquardt(evaluate, params0, y, weights, bounds,
+                                              deadline=deadline)
+
+        def fit_chunk(index):
+            return Model._levenberg_marquardt(evaluate, params0[index],
+                                              y if y.ndim == 1 else y[index],
+                                              weights, bounds, deadline=deadline)
+        chunks = np.array_split(np.arange(len(params0)), min(workers, len(params0)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(fit_chunk, chunks))
+        return (np.concatenate([result[0] for result in results]),
+                np.concatenate([result[1] for result in results]))
+
+
+@Model.register
 class ModifiedZener(Model):
     """
     A class to fit the modified zener model to the experimental data.
     """
 
+    NAME = 'MODIFIED_ZENER'
+    KEYS = (ParameterKeys.K0_ZP, ParameterKeys.K1_ZP, ParameterKeys.ETA1_ZP,
+            ParameterKeys.TAU_ZP)   # k0, k1, n1, tau
+    START = (0.1, 0.2, 0.1, 0.1)
+    START_RANGES = ((1e-3, 10.0), (1e-3, 10.0), (1e-3, 10.0), (1e-3, 1.0))
+
     @staticmethod
     def _calculate_model_output(X, k0, k1, n1, tau):
         """
@@ -59,6 +393,54 @@ class ModifiedZener(Model):
         f0 = X[1]
         return f0 / k1 * (1 - k0 / (k0 + k1) * np.exp(-time / tau)) + time * f0 / n1
 
+    @staticmethod
+    def _creep_compliance(time, k0, k1, n1, tau):
+        """
+        The creep compliance of the model, i.e. the aspiration depth for a
+        unit step of the force. The parameters can be arrays (size: Px1) to
+        calculate the compliance of several parameter sets at once.
+        
+        Args:
+            time (array of float):      time vector
+            k0, k1, n1, tau (float):    the parameters of the model
+        Returns:
+            compliance (array of float): the creep compliance
+        """
+        return 1.0 / k1 * (1 - k0 / (k0 + k1) * np.exp(-time / tau)) + time / n1
+
+    @staticmethod
+    def _creep_compliance_jacobian(time, k0, k1, n1, tau):
+        """
+        The derivatives of the creep compliance with respect to k0, k1, n1
+        and tau.
+        
+        Returns:
+            jacobian (array of float):  the derivatives (size: ...x4xN)
+        """
+        decay = np.exp(-time / tau)
+        k_sum = k0 + k1
+        d_k0 = -decay / k_sum ** 2
+        d_k1 = -1.0 / k1 ** 2 + decay * k0 * (k0 + 2 * k1) / (k_sum ** 2 * k1 ** 2)
+        d_n1 = -time / n1 ** 2
+        d_tau = -k0 / (k_sum * k1) * decay * time / tau ** 2
+        return np.stack(np.broadcast_arrays(d_k0, d_k1, d_n1, d_tau), axis=-2)
+
+    @staticmethod
+    def _calculate_model_output_trace(time, force_trace, k0, k1, n1, tau):
+        """
+        The aspiration depth for a time-varying force, calculated by
+        convolution of the force increments with the creep compliance.
+        
+        Args:
+            time (array of float):          uniform time vector starting at 0
+            force_trace (array of float):   force at each time point
+            k0, k1, n1, tau (float):        the parameters of the model
+        Returns:
+            asp_depth (array):  the calculated aspiration depth
+        """
+        compliance = ModifiedZener._creep_compliance(time, k0, k1, n1, tau)
+        return Model._superpose(compliance, Model._force_increments(force_trace))
+
     @staticmethod
     def _objective_fun(p, X, y):
         """
@@ -100,7 +482,7 @@ class ModifiedZener(Model):
         f0 = np.repeat(applied_force, len(time))
         X = [time, f0, weights]
         # k0, k1, n1, tau
-        params0 = [0.1, 0.2, 0.1, 0.1]
+        params0 = list(ModifiedZener.START)
         if not bounds:
             res_min = minimize(ModifiedZener._objective_fun, params0,
                                (X, aspiration_depth),
@@ -110,16 +492,100 @@ class ModifiedZener(Model):
                                (X, aspiration_depth),
                                method='TNC', bounds=bounds,
                                options={'gtol': 1e-14, 'disp': False})
-        k0, k1, eta1, tau = res_min.x
+        return ModifiedZener._parameter_dict(*res_min.x)
+
+    @staticmethod
+    def _parameter_dict(k0, k1, eta1, tau):
+        """ Convert the fitted values to a dict with ParameterKeys """
         eta0 = tau * (k0 * k1) / (k0 + k1)
-        params = {ParameterKeys.K0_ZP.value: k0, ParameterKeys.K1_ZP.value: k1,
-                  ParameterKeys.ETA0_ZP.value: eta0,
-                  ParameterKeys.ETA1_ZP.value: eta1,
-                  ParameterKeys.TAU_ZP.value: tau}
+        params = {ParameterKeys.K0_ZP.value: float(k0), ParameterKeys.K1_ZP.value: float(k1),
+                  ParameterKeys.ETA0_ZP.value: float(eta0),
+                  ParameterKeys.ETA1_ZP.value: float(eta1),
+                  ParameterKeys.TAU_ZP.value: float(tau)}
         return params
 
+    def _bootstrap(self, evaluate, params, weights, bounds, samples, confidence, workers,
+                   seed=0):
+        """
+        Confidence intervals of the parameters by resampling the residuals.
+        The residuals of the fit, scaled by the square root of their weights,
+        are drawn with replacement, scaled back with the weight of the point
+        they are added to and added to the fitted curve. This gives a 2D array
+        of resampled curves, which are all refitted in one batch starting at
+        the fitted parameters. If the fit has parameters that are not
+        positive (the step fit is not bounded), the curves are refitted from
+        a fit of the data with the log-scale solver instead. If fewer than
+        half of the refits converge, the bounds of the intervals are NaN.
+        
+        Args:
+            evaluate (callable):        see Model._levenberg_marquardt
+            params (dict):              the fitted parameters
+            weights (array of float):   weight of each data point
+            bounds (tuple):             bounds for each of the 4 model parameters
+            samples (int):              number of resampled curves
+            confidence (float):         confidence level, e.g. 0.95
+            workers (int):              number of threads
+            seed (int):                 seed of the resampling
+        Returns:
+            intervals (dict): the bounds of the interval of each parameter,
+                              with the keys <parameter>_CI_LOW/_CI_HIGH
+        """
+        best = np.array([[params[ParameterKeys.K0_ZP.value], params[ParameterKeys.K1_ZP.value],
+                          params[ParameterKeys.ETA1_ZP.value], params[ParameterKeys.TAU_ZP.value]]])
+        if not np.all(np.isfinite(best) & (best > 0)):
+            # The refits on a log scale cannot start at parameters <= 0
+            with np.errstate(all='ignore'):
+                best, cost = Model._levenberg_marquardt(evaluate, [ModifiedZener.START],
+                                                        self.aspiration_depth, weights, bounds)
+        fitted = evaluate(best)[0][0]
+        scale = np.sqrt(np.asarray(weights, dtype=float))
+        residuals = (self.aspiration_depth - fitted) * scale
+        rng = np.random.default_rng(seed)
+        curves = fitted + residuals[rng.integers(0, len(residuals), (samples, len(residuals)))] \
+            / scale
+        with np.errstate(all='ignore'):
+            fits, cost = Model._fit_batch(evaluate, np.repeat(best, samples, axis=0), curves,
+                                          weights, bounds, workers)
+        fits = fits[np.isfinite(cost) & np.all(np.isfinite(fits) & (fits > 0), axis=1)]
+        if len(fits) < max(2, samples / 2.0):
+            fits = np.full((1, 4), np.nan)
+        k0, k1, eta1, tau = fits.T
+        estimates = {ParameterKeys.K0_ZP: k0, ParameterKeys.K1_ZP: k1,
+                     ParameterKeys.ETA0_ZP: tau * (k0 * k1) / (k0 + k1),
+                     ParameterKeys.ETA1_ZP: eta1, ParameterKeys.TAU_ZP: tau}
+        tail = (1.0 - confidence) / 2.0 * 100.0
+        intervals = {}
+        for key, values in estimates.items():
+            low, high = np.percentile(values, [tail, 100.0 - tail])
+            intervals[key.value + '_CI_LOW'] = float(low)
+            intervals[key.value + '_CI_HIGH'] = float(high)
+        return intervals
+
     @staticmethod
-    def _plot_fits(aspiration_depth, time, params, force):
+    def _optimize_model_parameters_trace(time, aspiration_depth, force_trace,
+                                         weights, bounds):
+        """
+        Optimize the model parameters for a time-varying force with the
+        batched Levenberg-Marquardt solver.
+        
+        Args:
+            time (array of floats):                 uniform time vector starting at 0
+            aspiration_depth (array of floats):     measured aspiration depth
+            force_trace (array of floats):          force at each time point
+            weights (array of float):               vector of weights for each data point
+            bounds (tuple):                         bounds for each of the 4 model parameters
+        Returns:
+            params (dict): the optimal model parameters
+        """
+        evaluate = ModifiedZener._trace_evaluator(time, force_trace)
+        # k0, k1, n1, tau
+        params0 = [ModifiedZener.START]
+        params, cost = Model._levenberg_marquardt(evaluate, params0, aspiration_depth,
+                                                  weights, bounds)
+        return ModifiedZener._parameter_dict(*params[0])
+
+    @staticmethod
+    def _plot_fits(aspiration_depth, time, params, force, force_trace=None):
         """
         Plot the results of fitting the modified zener model to the
         experimental data.
@@ -129,15 +595,22 @@ class ModifiedZener(Model):
             time (array of float):              time points
             params (dict):                      the model parameters
             force (float):                      the applied force
+            force_trace (array of float):       the force at each time point,
+                                                None for a step of the force
         """
         k0 = params[ParameterKeys.K0_ZP.value]
         k1 = params[ParameterKeys.K1_ZP.value]
         eta1 = params[ParameterKeys.ETA1_ZP.value]
         tau = params[ParameterKeys.TAU_ZP.value]
-        t_fine = np.linspace(0, 0.5, num=1000)
-        force_fine = np.repeat(force, len(t_fine))
-        X = [t_fine, force_fine]
-        asp_dep = ModifiedZener._calculate_model_output(X, k0, k1, eta1, tau)
+        if force_trace is None:
+            t_fine = np.linspace(0, 0.5, num=1000)
+            force_fine = np.repeat(force, len(t_fine))
+            X = [t_fine, force_fine]
+            asp_dep = ModifiedZener._calculate_model_output(X, k0, k1, eta1, tau)
+        else:
+            t_fine = time
+            asp_dep = ModifiedZener._calculate_model_output_trace(
+                time, force_trace, k0, k1, eta1, tau)
         plt.figure()
         plt.plot(time, aspiration_depth, 'ro', label='Meas')
         plt.plot(t_fine, asp_dep, 'g', label='Fit')
@@ -147,13 +620,26 @@ class ModifiedZener(Model):
         plt.show
         plt.pause(1)
 
-    def fit(self, bounds=(), weighted=True):
+    def fit(self, bounds=(), weighted=True, plot=True, starts=1, refine=4,
+            time_budget=None, workers=1, bootstrap=0, confidence=0.95):
         """
-        Fit the model to the experimental data.
+        Fit the model to the experimental data. If the model has a force
+        trace, the response to the time-varying force is fitted.
         
         Args:
             bounds (tuple): limits for the model parameters
             weighted (bool): True for weighted fit
+            plot (bool): True to plot the fit (only from the main thread)
+            starts (int): number of starting points, more than 1 for a
+                          multi-start fit (see Model._multi_start)
+            refine (int): number of starting points refined in a multi-start fit
+            time_budget (float): wall-clock time of a multi-start fit [s], or None
+            workers (int): number of threads refining a multi-start fit or
+                           fitting the resampled curves
+            bootstrap (int): number of resampled curves, more than 0 to add
+                             the confidence intervals to the parameters
+                             (see _bootstrap)
+            confidence (float): confidence level of the intervals
         """
         if not isinstance(bounds, tuple):
             raise TypeError('Invalid type for input bounds.'
@@ -164,20 +650,222 @@ class ModifiedZener(Model):
         if not isinstance(weighted, bool):
             raise TypeError('Invalid type for input weighted.'
                             'Expected {}, but got {} instead.'.format(bool, type(weighted)))
-        if weighted:
-            weights = np.repeat(0.1, len(self.time))
-            weights[0] = 10
-            weights[1:5] = 1
-        else:
-            weights = np.repeat(1, len(self.time))
+        weights = Model._weights(len(self.time), weighted)
 
-        params = ModifiedZener._optimize_model_parameters(self.time,
-                                                          self.aspiration_depth,
-                                                          self.applied_force, weights, bounds)
-        ModifiedZener._plot_fits(self.aspiration_depth, self.time, params,
-                                 self.applied_force)
+        if not isinstance(starts, int) or starts < 1:
+            raise ValueError('Expected a positive number of starts, '
+                             'but got {} instead.'.format(starts))
+        if not isinstance(bootstrap, int) or bootstrap < 0:
+            raise ValueError('Expected a non-negative number of resampled curves, '
+                             'but got {} instead.'.format(bootstrap))
+        if not 0 < confidence < 1:
+            raise ValueError('Expected a confidence level between 0 and 1, '
+                             'but got {} instead.'.format(confidence))
+
+        if self.force_trace is None:
+            evaluate = ModifiedZener._step_evaluator(self.time, self.applied_force)
+        else:
+            evaluate = ModifiedZener._trace_evaluator(self.time, self.force_trace)
+        if starts > 1:
+            best, cost = Model._multi_start(evaluate, self.aspiration_depth, weights,
+                                            ModifiedZener._start_ranges(bounds), bounds,
+                                            starts, refine, time_budget, workers,
+                                            params0=ModifiedZener.START)
+            params = ModifiedZener._parameter_dict(*best)
+        elif self.force_trace is None:
+            params = ModifiedZener._optimize_model_parameters(self.time,
+                                                              self.aspiration_depth,
+                                                              self.applied_force, weights, bounds)
+        else:
+            params = ModifiedZener._optimize_model_parameters_trace(self.time,
+                                                                    self.aspiration_depth,
+                                                                    self.force_trace,
+                                                                    weights, bounds)
+        if bootstrap:
+            params.update(self._bootstrap(evaluate, params, weights, bounds, bootstrap,
+                                          confidence, workers))
+        if plot:
+            ModifiedZener._plot_fits(self.aspiration_depth, self.time, params,
+                                     self.applied_force, self.force_trace)
         return params
 
 
+@Model.register
+class KelvinVoigt(Model):
+    """ A spring k in parallel with a dashpot eta """
+
+    NAME = 'KELVIN_VOIGT'
+    KEYS = (ParameterKeys.KV_K, ParameterKeys.KV_ETA)
+    START = (0.2, 0.01)
+    START_RANGES = ((1e-3, 10.0), (1e-4, 10.0))
+
+    @staticmethod
+    def _creep_compliance(time, k, eta):
+        return (1 - np.exp(-k * time / eta)) / k
+
+    @staticmethod
+    def _creep_compliance_jacobian(time, k, eta):
+        decay = np.exp(-k * time / eta)
+        d_k = -(1 - decay) / k ** 2 + decay * time / (eta * k)
+        d_eta = -decay * time / eta ** 2
+        return np.stack(np.broadcast_arrays(d_k, d_eta), axis=-2)
+
+
+@Model.register
+class StandardLinearSolid(Model):
+    """ The modified Zener model without the dashpot n1, i.e. without flow """
+
+    NAME = 'STANDARD_LINEAR_SOLID'
+    KEYS = (ParameterKeys.SLS_K0, ParameterKeys.SLS_K1, ParameterKeys.SLS_TAU)
+    START = (0.1, 0.2, 0.1)
+    START_RANGES = ((1e-3, 10.0), (1e-3, 10.0), (1e-3, 1.0))
+
+    @staticmethod
+    def _creep_compliance(time, k0, k1, tau):
+        return 1.0 / k1 * (1 - k0 / (k0 + k1) * np.exp(-time / tau))
+
+    @staticmethod
+    def _creep_compliance_jacobian(time, k0, k1, tau):
+        jacobian = ModifiedZener._creep_compliance_jacobian(time, k0, k1, np.inf, tau)
+        return jacobian[..., [0, 1, 3], :]
+
+
+@Model.register
+class Maxwell(Model):
+    """
+    A spring k in series with a dashpot eta: an instantaneous compliance and
+    flow without delayed elasticity. (A Burgers model is not registered, its
+    compliance is a reparameterisation of the modified Zener model.)
+    """
+
+    NAME = 'MAXWELL'
+    KEYS = (ParameterKeys.MAXWELL_K, ParameterKeys.MAXWELL_ETA)
+    START = (0.3, 0.1)
+    START_RANGES = ((1e-3, 10.0), (1e-3, 10.0))
+
+    @staticmethod
+    def _creep_compliance(time, k, eta):
+        return 1.0 / k + time / eta
+
+    @staticmethod
+    def _creep_compliance_jacobian(time, k, eta):
+        d_k = -1.0 / k ** 2 * np.ones_like(time)
+        d_eta = -time / eta ** 2
+        return np.stack(np.broadcast_arrays(d_k, d_eta), axis=-2)
+
+
+@Model.register
+class PowerLaw(Model):
+    """ An instantaneous compliance 1/k and power-law creep a * t^beta [t in s] """
+
+    NAME = 'POWER_LAW'
+    KEYS = (ParameterKeys.POWER_K, ParameterKeys.POWER_A, ParameterKeys.POWER_BETA)
+    START = (0.3, 5.0, 0.5)
+    START_RANGES = ((1e-3, 10.0), (1e-2, 1e2), (1e-2, 1.0))
+
+    @staticmethod
+    def _creep_compliance(time, k, a, beta):
+        return 1.0 / k + a * time ** beta
+
+    @staticmethod
+    def _creep_compliance_jacobian(time, k, a, beta):
+        power = time ** beta
+        log_time = np.log(np.where(time > 0, time, 1.0))
+        d_k = -1.0 / k ** 2 * np.ones_like(time)
+        return np.stack(np.broadcast_arrays(d_k, power, a * power * log_time), axis=-2)
+
+
+def select_model(time, aspiration_depth, applied_force, force_trace=None, criterion='aic',
+                 models=None, weighted=True, starts=16, executor=None, fitted=None):
+    """
+    Fit every registered model and select the best one by an information
+    criterion. Each model is fitted with a multi-start fit (see
+    Model._multi_start). The models are fitted concurrently by an executor:
+    threads by default, or e.g. a ProcessPoolExecutor that is kept for all
+    measurements, so the models are fitted on separate cores (models must
+    then be registered when oocyte_models is imported).
+    
+    Args:
+        time (array of float):              uniform time vector starting at 0
+        aspiration_depth (array of float):  measured aspiration depth [m]
+        applied_force (float):              force applied to the oocyte [N]
+        force_trace (array of float):       force at each time point, None
+                                            for a step of the applied force
+        criterion (str):                    'aic' or 'bic'
+        models (list):                      names of the models, all
+                                            registered models if None
+        weighted (bool):                    True for weighted fits
+        starts (int):                       starting points of each fit
+        executor (Executor):                executor of the fits, a thread
+                                            per model if None
+        fitted (dict):                      parameters (dict with ParameterKeys)
+                                            of models fitted before, e.g.
+                                            {'MODIFIED_ZENER': params}; these
+                                            are not fitted again, only their
+                                            cost is computed
+    Returns:
+        best (str):         name of the selected model
+        results (dict):     for each model a dict with the 'params' (dict
+                            with ParameterKeys), the weighted sum of squared
+                            errors 'cost', 'aic' and 'bic'
+    """
+    if criterion not in ('aic', 'bic'):
+        raise ValueError('Expected aic or bic, but got {} instead.'.format(criterion))
+    names = list(Model.registry) if models is None else list(models)
+    for name in names:
+        if name not in Model.registry:
+            raise ValueError('Expected one of {}, but got {} instead.'.format(
+                list(Model.registry), name))
+    fitted = {} if fitted is None else fitted
+    weights = Model._weights(len(time), weighted)
+    args = (time, aspiration_depth, applied_force, force_trace, weights, starts)
+    results = {name: _fitted_model(name, fitted[name], *args[:-1])
+               for name in names if name in fitted}
+    remaining = [name for name in names if name not in fitted]
+    if executor is None and remaining:
+        with ThreadPoolExecutor(max_workers=len(remaining)) as threads:
+            futures = [threads.submit(_fit_model, name, *args) for name in remaining]
+            results.update((name, future.result()) for name, future in zip(remaining, futures))
+    elif remaining:
+        futures = [executor.submit(_fit_model, name, *args) for name in remaining]
+        results.update((name, future.result()) for name, future in zip(remaining, futures))
+    best = min(names, key=lambda name: results[name][criterion]
+               if np.isfinite(results[name][criterion]) else np.inf)
+    return best, results
+
+
+def _fit_model(name, time, aspiration_depth, applied_force, force_trace, weights, starts):
+    """ Fit a registered model and compute its information criteria (see select_model) """
+    model = Model.registry[name]
+    evaluate = _evaluator(model, time, applied_force, force_trace)
+    params, cost = Model._multi_start(evaluate, aspiration_depth, weights, model.START_RANGES,
+                                      starts=starts, params0=model.START)
+    return _model_result(model, params, cost, len(time))
+
+
+def _fitted_model(name, params, time, aspiration_depth, applied_force, force_trace, weights):
+    """ Compute the information criteria of the parameters of an earlier fit """
+    model = Model.registry[name]
+    params = [params[key.value] for key in model.KEYS]
+    output = _evaluator(model, time, applied_force, force_trace)(np.array([params]))[0][0]
+    residual = (output - aspiration_depth) * np.sqrt(weights) * Model.RESIDUAL_SCALE
+    return _model_result(model, params, float(np.dot(residual, residual)), len(time))
+
+
+def _evaluator(model, time, applied_force, force_trace):
+    if force_trace is None:
+        return model._step_evaluator(time, applied_force)
+    return model._trace_evaluator(time, force_trace)
+
+
+def _model_result(model, params, cost, num_points):
+    # Information criteria of a least squares fit; the weighted costs of
+    # all models are on the same scale
+    num_params = len(model.KEYS)
+    log_likelihood_term = num_points * np.log(max(cost, 1e-300) / num_points)
+    return {'params': model._parameter_dict(*params), 'cost': cost,
+            'aic': float(log_likelihood_term + 2 * num_params),
+            'bic': float(log_likelihood_term + num_params * np.log(num_points))}
+
 if __name__ == '__main__':
     print('models')
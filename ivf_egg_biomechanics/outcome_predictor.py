@@ -98,27 +98,30 @@ class OutcomePredictor(object):
         print('Starting forward feature selection process.')
         
         while True:
-            results = pd.DataFrame(columns=['Features', 'Score', 'Model'])
+            rows = []
             print('#####################################################')
             for col in features_to_choose_from:
                 features = best_features_so_far.copy()
                 features.append(col)
                 grid_search.fit(X_train[features], y_train)
-                results = results.append(pd.DataFrame({'Features': col, 
-                                                       'Score': grid_search.best_score_,
-                                                       'Model': grid_search},
-                                                      index=[0]), ignore_index=True, sort=True)
+                rows.append({'Features': col, 
+                             'Score': grid_search.best_score_,
+                             'Model': grid_search})
                 print('Score %s: %.3f' % (col, grid_search.best_score_))
                 print(grid_search.best_params_)
+            results = pd.DataFrame(rows, columns=['Features', 'Score', 'Model'])
             results = results.loc[results['Score'] == max(results['Score']),
                     ['Features', 'Score', 'Model']]
             next_feature = results.iloc[0]['Features']
             best_features_so_far.append(next_feature)
             features_to_choose_from.remove(next_feature)
-            if best_combination_of_features.iloc[0]['Score'] < results.iloc[0]['Score']:
-                best_combination_of_features = results
-                best_combination_of_features['Features'] = best_features_so_far
-            else:
+            improved = best_combination_of_features.iloc[0]['Score'] < results.iloc[0]['Score']
+            if improved:
+                best_combination_of_features = pd.DataFrame(
+                    {'Features': [best_features_so_far.copy()],
+                     'Score': [results.iloc[0]['Score']],
+                     'Model': [results.iloc[0]['Model']]})
+            if not improved or not features_to_choose_from:
                 self.classifier = best_combination_of_features.iloc[0]['Model']
                 print('')
                 print('Forward feature selection process terminated.')
@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
-import pandas as pd
 from skimage.exposure import equalize_hist
 from skimage.filters import gaussian
 from utils.drawing_shape_utils import DrawingShapeUtils, Shape
@@ -127,12 +126,25 @@ class AspirationDepth(Property):
         self.conversion_factor = conversion_factor
         self.time = time
         self.manual = manual
+        self.offset = None
+        self.roi_center = None
+        self.aspiration_depth_oolemma_pixel = None
+        self.aspiration_depth_oolemma_mechanical = None
     
     def extract_property(self):
         """
         Loads the video frames from the first movement and asks the user 
         to click on the zona/oolemma in each frame to track its movement.
         """ 
+        self.select_regions()
+        return self.track()
+    
+    def select_regions(self):
+        """
+        Asks the user to click on the inner diameter of the zona pellucida
+        and, for automated tracking, to select the inner pipette region in
+        which the zona is tracked.
+        """
         prompt = 'Click on inner diameter of zona pellucida'
         zp_thickness = int(round(self.zona_thickness
                                  * self.conversion_factor
@@ -141,64 +153,136 @@ class AspirationDepth(Property):
         point_1, point_2 = DrawingShapeUtils.draw(
                 pic, self.scale, prompt, Shape.zona, [zp_thickness])
         
-        offset = int((point_2[0] / self.scale + self.zona_thickness * self.conversion_factor))
+        self.offset = int((point_2[0] / self.scale + self.zona_thickness * self.conversion_factor))
         
         if not self.manual:
             prompt = 'Select inner pipette region for automated ZP tracking: '
             point_1, point_2 = DrawingShapeUtils.draw(pic, 1.0, prompt, Shape.offset,
                                                       [AspirationDepth.WIDTH_ROI, AspirationDepth.HEIGHT_ROI])
-            
             off_x, off_y = point_2
-            off_x = off_x+AspirationDepth.WIDTH_ROI/2
-            background = pic[int(off_y-AspirationDepth.HEIGHT_ROI/2):int(off_y+AspirationDepth.HEIGHT_ROI/2),
-                             int(off_x-AspirationDepth.WIDTH_ROI/2):int(off_x+AspirationDepth.WIDTH_ROI/2)].copy()
-            background = background.astype(np.uint8)
-            background = (gaussian(background, sigma=2.0)*255).astype(np.int16)
-    
-            subtracted_imgs = []
-            
-            for i, img in enumerate(self.video_frames[1:]):
-                roi = img.copy()
-                next_frame_cropped = roi[int(off_y-AspirationDepth.HEIGHT_ROI/2):
-                                         int(off_y+AspirationDepth.HEIGHT_ROI/2),
-                                         int(off_x-AspirationDepth.WIDTH_ROI/2):
-                                         int(off_x+AspirationDepth.WIDTH_ROI/2)].copy()
-                next_frame_filtered = (gaussian(next_frame_cropped, sigma=2.0)*255).astype(np.int16)
-                subtracted_img = np.abs((next_frame_filtered-background))
-                subtracted_imgs.append(subtracted_img.astype(np.uint8))
-            
-            subtracted_imgs = [np.sum(sub, axis=0) for sub in subtracted_imgs]
-            dsubtracted_imgs = pd.DataFrame(subtracted_imgs)
-            mov = dsubtracted_imgs.rolling(window=10, center=True, axis=1)
-            mean_subtracted_imgs = mov.mean()
-            derivative_subtracted_imgs = (mean_subtracted_imgs.iloc[:, 1:].values
-                                          - mean_subtracted_imgs.iloc[:, :-1].values)
-            derivative_subtracted_imgs = np.nan_to_num(derivative_subtracted_imgs)
-            position_zona = []
-            for i in range(len(derivative_subtracted_imgs)):
-                position_zona.append(np.argmin(derivative_subtracted_imgs[i, :]))
-    
-            position_zona = np.asarray(position_zona, dtype=np.uint8)
-            position_zona += int(off_x-AspirationDepth.WIDTH_ROI/2)
-                     
-            aspiration_depth_auto_pixel = np.asarray(position_zona)
-            aspiration_depth_auto_mechanical = ((aspiration_depth_auto_pixel-offset) * 1e-6 / self.conversion_factor)
-            return (offset, aspiration_depth_auto_pixel, aspiration_depth_auto_mechanical)
+            self.roi_center = (off_x+AspirationDepth.WIDTH_ROI/2, off_y)
+    
+    def track(self):
+        """
+        Tracks the zona pellucida in the frames after the first movement,
+        either automatically in the selected pipette region or by asking the
+        user to click on the zona in each frame. The automatic tracking also
+        sets the aspiration depth of the oolemma (aspiration_depth_oolemma_pixel
+        and aspiration_depth_oolemma_mechanical).
         
+        Returns:
+            offset (int):                           position of the inner zona diameter
+            aspiration_depth_pixel (array):         aspiration depth [pixel]
+            aspiration_depth_mechanical (array):    aspiration depth [m]
+        """
+        if not self.manual:
+            return self._track_automatically()
         else:
-            prompt = 'Click on zona pellucida'
-            aspiration_depth = np.repeat(-1,len(self.time))
-            
-            for i, im in enumerate(self.video_frames[1:]):
-                pic = im.copy()
-                point_1, point_2 = DrawingShapeUtils.draw(
-                        pic, self.scale, prompt, Shape.line, [])
-                aspiration_depth[i] = point_2[0]
-
-            aspiration_depth_manual_pixel = (np.asarray(aspiration_depth)/self.scale)
-            aspiration_depth_manual_mechanic = ((aspiration_depth_manual_pixel-offset) * 1e-6 / self.conversion_factor)
-            return offset, aspiration_depth_manual_pixel, aspiration_depth_manual_mechanic
+            return self._track_manually()
+    
+    def _track_automatically(self):
+        offset = self.offset
+        off_x, off_y = self.roi_center
+        background = AspirationDepth._filter(self._roi(self.video_frames[0]).astype(np.uint8))
+        profiles = np.array([AspirationDepth._difference_profile(
+            AspirationDepth._filter(self._roi(img)), background)
+            for img in self.video_frames[1:]])
+        left = int(off_x-AspirationDepth.WIDTH_ROI/2)
+        index_zona = AspirationDepth._edge_index(profiles)
+        # The oolemma is found in the same profiles, between its position
+        # before the aspiration (the inner zona diameter) and the zona
+        index_oolemma = [AspirationDepth._interface_index(profile, offset - left, index)
+                         for profile, index in zip(profiles, index_zona)]
+        position_zona = np.asarray(index_zona, dtype=np.uint8)
+        position_zona += left
+        position_oolemma = np.asarray(index_oolemma, dtype=np.uint8)
+        position_oolemma += left
+
+        aspiration_depth_auto_pixel = np.asarray(position_zona)
+        aspiration_depth_auto_mechanical = ((aspiration_depth_auto_pixel-offset) * 1e-6 / self.conversion_factor)
+        self.aspiration_depth_oolemma_pixel = position_oolemma
+        self.aspiration_depth_oolemma_mechanical = ((position_oolemma-offset) * 1e-6 / self.conversion_factor)
+        return (offset, aspiration_depth_auto_pixel, aspiration_depth_auto_mechanical)
+
+    def _roi(self, frame):
+        """ The region of a frame in which the zona is tracked """
+        off_x, off_y = self.roi_center
+        return frame[int(off_y-AspirationDepth.HEIGHT_ROI/2):int(off_y+AspirationDepth.HEIGHT_ROI/2),
+                     int(off_x-AspirationDepth.WIDTH_ROI/2):int(off_x+AspirationDepth.WIDTH_ROI/2)]
+
+    @staticmethod
+    def _filter(roi):
+        """ Smooth a region (gray values scaled to 0-255, int16) """
+        return (gaussian(roi, sigma=2.0)*255).astype(np.int16)
+
+    @staticmethod
+    def _difference_profile(filtered, background):
+        """ Column sums of the absolute difference of a filtered region to the background """
+        return np.sum(np.abs(filtered-background).astype(np.uint8), axis=0)
+
+    @staticmethod
+    def _edge_index(profiles, window=10):
+        """
+        Find the zona in difference profiles: the column where the profile,
+        smoothed with a centered moving average, falls the most.
+        
+        Args:
+            profiles (array):   difference profiles along the last axis
+            window (int):       width of the moving average [pixel]
+        Returns:
+            index (array or int): column of the zona in each profile
+        """
+        profiles = np.asarray(profiles, dtype=np.float64)
+        width = profiles.shape[-1]
+        sums = np.cumsum(profiles, axis=-1)
+        sums = np.concatenate([np.zeros(profiles.shape[:-1] + (1,)), sums], axis=-1)
+        mean = np.full(profiles.shape, np.nan)
+        # The average at column j covers the columns j-window/2 to j+window/2-1
+        mean[..., window//2:width-window//2+1] = (sums[..., window:] - sums[..., :-window]) / window
+        derivative = np.nan_to_num(mean[..., 1:] - mean[..., :-1])
+        return np.argmin(derivative, axis=-1)
+
+    @staticmethod
+    def _interface_index(profile, start, stop, margin=3):
+        """
+        Find the oolemma in a difference profile: the column between start
+        and the zona that best splits the profile into two levels, the
+        aspirated cytoplasm and the zona in front of it.
+
+        Args:
+            profile (array):    difference profile
+            start (int):        column of the oolemma before the aspiration
+            stop (int):         column of the zona
+            margin (int):       columns before the zona left out, which
+                                belong to the blurred zona edge [pixel]
+        Returns:
+            index (int):        column of the oolemma
+        """
+        start = max(int(start), 0)
+        segment = np.asarray(profile[start:int(stop)-margin], dtype=np.float64)
+        num = len(segment)
+        if num < 2:
+            return start
+        sums = np.cumsum(segment)
+        split = np.arange(1, num)
+        # Minimizing the squared deviations from the two means maximizes this score
+        score = sums[:-1] ** 2 / split + (sums[-1] - sums[:-1]) ** 2 / (num - split)
+        return start + 1 + int(np.argmax(score))
+    
+    def _track_manually(self):
+        offset = self.offset
+        prompt = 'Click on zona pellucida'
+        aspiration_depth = np.repeat(-1,len(self.time))
+        
+        for i, im in enumerate(self.video_frames[1:]):
+            pic = im.copy()
+            point_1, point_2 = DrawingShapeUtils.draw(
+                    pic, self.scale, prompt, Shape.line, [])
+            aspiration_depth[i] = point_2[0]
 
+        aspiration_depth_manual_pixel = (np.asarray(aspiration_depth)/self.scale)
+        aspiration_depth_manual_mechanic = ((aspiration_depth_manual_pixel-offset) * 1e-6 / self.conversion_factor)
+        return offset, aspiration_depth_manual_pixel, aspiration_depth_manual_mechanic
 
 if __name__ == '__main__':
     video_frames = list(np.ones((5, 200, 200), dtype=np.uint8)*100)
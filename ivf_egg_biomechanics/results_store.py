@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+import numpy as np
+from measurement import PatientKeys
+from measurement_store import MeasurementStore
+
+RESULTS_DIRECTORY = os.path.join(os.path.expanduser('~'), '.ivf_egg_biomechanics', 'results')
+
+
+class ResultsStore(object):
+    """
+    A persistent store of the analyzed measurements.
+
+    Every analyzed measurement is appended as one JSON line to a log, so
+    saving a result only writes the values of that measurement. The log is
+    compacted into a columnar snapshot (see MeasurementStore.save) after a
+    number of records. The complete results are the snapshot with the log
+    replayed on top. An Excel report is only written on request.
+    """
+    LOG_NAME = 'results.jsonl'
+    SNAPSHOT_NAME = 'results.npz'
+
+    def __init__(self, directory=RESULTS_DIRECTORY, compact_every=100):
+        """
+        Open a store, which is created when the first result is recorded.
+
+        Args:
+            directory (str):        directory of the log and the snapshot
+            compact_every (int):    number of records after which the log is
+                                    compacted, None to compact only on request
+        """
+        if compact_every is not None and compact_every < 1:
+            raise ValueError('Expected a positive number of records, but got {} instead.'.format(
+                compact_every))
+        self.directory = directory
+        self.compact_every = compact_every
+        self.log_path = os.path.join(directory, ResultsStore.LOG_NAME)
+        self.snapshot_path = os.path.join(directory, ResultsStore.SNAPSHOT_NAME)
+        self._lock = threading.Lock()
+        self._records = self._count_records()
+
+    def _count_records(self):
+        if not os.path.isfile(self.log_path):
+            return 0
+        with open(self.log_path, 'rb') as log:
+            return sum(1 for line in log if line.strip())
+
+    def record(self, measurement):
+        """
+        Append the values of a measurement to the log. Values that are not
+        set and traces kept in memory are skipped, references (e.g. BlobRef)
+        are written as text.
+
+        Args:
+            measurement (Measurement): the analyzed measurement
+        """
+        line = json.dumps(_record(measurement)) + '\n'
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.log_path, 'a') as log:
+                log.write(line)
+                log.flush()
+                os.fsync(log.fileno())
+            self._records += 1
+            compact = self.compact_every is not None and self._records >= self.compact_every
+        if compact:
+            self.compact()
+
+    def load(self):
+        """
+        Load all results.
+
+        Returns:
+            store (MeasurementStore): the snapshot updated with the records of the log
+        """
+        with self._lock:
+            return self._load()
+
+    def _load(self):
+        if os.path.isfile(self.snapshot_path):
+            store = MeasurementStore.load(self.snapshot_path)
+        else:
+            store = MeasurementStore()
+        if os.path.isfile(self.log_path):
+            with open(self.log_path) as log:
+                for line in log:
+                    if line.strip():
+                        _apply(store, json.loads(line))
+        return store
+
+    def compact(self):
+        """ Write the results into the snapshot and empty the log """
+        with self._lock:
+            store = self._load()
+            store.save(self.snapshot_path)
+            if os.path.isfile(self.log_path):
+                os.remove(self.log_path)
+            self._records = 0
+
+    def export_excel(self, filename):
+        """
+        Write all results into an excel file.
+
+        Args:
+            filename (str): full path to the excel file
+        """
+        self.load().to_dataframe().to_excel(filename, index=False)
+
+
+def _record(measurement):
+    """ The values of a measurement that can be written as JSON """
+    record = {}
+    for key, value in measurement.data.items():
+        if isinstance(value, list) or (isinstance(value, (int, float, np.number)) and value == -1):
+            continue
+        if isinstance(value, np.integer):
+            value = int(value)
+        elif isinstance(value, np.floating):
+            value = float(value)
+        elif not isinstance(value, (int, float, str)):
+            value = str(value)
+        record[key] = value
+    return record
+
+
+def _apply(store, record):
+    """ Insert or update the measurement of a record in a store """
+    columns = {key: [value] for key, value in record.items()}
+    try:
+        store.row(record[PatientKeys.PATIENT_NUMBER.value],
+                  record[PatientKeys.OOCYTE_NUMBER.value],
+                  record.get(PatientKeys.ASPIRATION.value, 1))
+    except KeyError:
+        store.insert(columns)
+    else:
+        store.update(columns)
+
+
+if __name__ == '__main__':
+    import tempfile
+    from measurement import Measurement
+    results = ResultsStore(tempfile.mkdtemp())
+    results.record(Measurement({'NUMBER': 1, 'OOCYTE': 2}))
+    print(results.load().to_dataframe())
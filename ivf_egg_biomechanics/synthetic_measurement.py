@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+
+import os
+import numpy as np
+from oocyte_models import ModifiedZener
+from properties import AspirationDepth
+
+
+class SyntheticMeasurement(object):
+    """
+    A synthetic micropipette aspiration of an oocyte with known parameters.
+
+    The video shows an oocyte (cytoplasm and zona pellucida) at the tip of a
+    pipette. When the valve opens, a tongue of the zona is aspirated into the
+    pipette; its length follows the modified Zener model for the given
+    parameters and the force of the applied pressure. The pressure log has
+    the format of the pressure sensor, with a valve event at the frame after
+    the frame before the first movement. The video and the log can be run
+    through decoding, tracking and fitting, and the fitted parameters
+    compared with the parameters of the generator. Optionally the oolemma
+    follows the zona into the pipette with parameters of its own.
+
+    Frame k of the video is at the time (k - valve_frame - 1) / frame_rate
+    after the valve opened (see ioutils.select_measurement_frames).
+    """
+    OOCYTE_RADIUS = 60.0    # [um]
+    WALL_THICKNESS = 8      # [pixel]
+    CROP_SIZE = 200         # [pixel], see ioutils._crop_video_frames
+    BACKGROUND, WALL, ZONA, CYTOPLASM = 180.0, 60.0, 110.0, 140.0   # gray values
+
+    def __init__(self, params=(0.1, 0.2, 0.1, 0.05), pressure=0.3, pipette_size=40.0,
+                 conversion_factor=1.55, zona_thickness=10.0, frame_rate=50.0, duration=1.0,
+                 valve_time=0.2, rise_time=0.0, noise=3.0, pressure_noise=0.002,
+                 pressure_rate=100.0, rotation=0, frame_size=(480, 640), seed=0,
+                 oolemma_params=None):
+        """
+        Initialize a synthetic measurement.
+
+        Args:
+            params (tuple):             model parameters (k0, k1, eta1, tau)
+            pressure (float):           applied pressure [psi]
+            pipette_size (float):       inner diameter of the pipette [um]
+            conversion_factor (float):  conversion factor [pixel/um]
+            zona_thickness (float):     thickness of the zona pellucida [um]
+            frame_rate (float):         frame rate of the video [fps]
+            duration (float):           length of the video [s]
+            valve_time (float):         time from the start of the video to
+                                        the opening of the valve [s]
+            rise_time (float):          time until the pressure is reached [s],
+                                        0 for a step of the pressure
+            noise (float):              standard deviation of the gray values
+            pressure_noise (float):     standard deviation of the pressure [psi]
+            pressure_rate (float):      sampling rate of the pressure log [Hz]
+            rotation (int):             angle (multiple of 90) by which the
+                                        video has to be rotated when decoded
+            frame_size (tuple):         height and width of the video [pixel]
+            seed (int):                 seed of the noise
+            oolemma_params (tuple):     model parameters (k0, k1, eta1, tau) of
+                                        the oolemma, None if only the zona is
+                                        aspirated
+        """
+        for values in (params, oolemma_params):
+            if values is not None and len(values) != 4:
+                raise ValueError('Expected 4 model parameters, but got {} instead.'.format(
+                    len(values)))
+        if rotation % 90 != 0:
+            raise ValueError('Expected a multiple of 90 degrees, but got {} instead.'.format(
+                rotation))
+        if frame_rate <= 0:
+            raise ValueError('Expected a positive frame rate, but got {} instead.'.format(
+                frame_rate))
+        if not 0 < valve_time < duration:
+            raise ValueError('Expected a valve time within the video, but got {} instead.'.format(
+                valve_time))
+        self.params = tuple(float(value) for value in params)
+        self.oolemma_params = None if oolemma_params is None else \
+            tuple(float(value) for value in oolemma_params)
+        self.pressure = pressure
+        self.pipette_size = pipette_size
+        self.conversion_factor = conversion_factor
+        self.zona_thickness = zona_thickness
+        self.frame_rate = frame_rate
+        self.rise_time = rise_time
+        self.noise = noise
+        self.pressure_noise = pressure_noise
+        self.pressure_rate = pressure_rate
+        self.rotation = rotation
+        self.frame_size = frame_size
+        self.seed = seed
+        self.num_frames = int(round(duration * frame_rate))
+        self.valve_frame = int(round(valve_time * frame_rate)) - 1
+        height, width = frame_size
+        self._center_y = height // 2
+        self._mouth_x = width // 2 - 40
+        # The pipette tip is 40 pixels from the left border of the cropped frames
+        self.crop_center = (self._mouth_x + self.CROP_SIZE // 2 - 40, self._center_y)
+        self.offset = 40
+        self.roi_center = (self.offset - 5 + AspirationDepth.WIDTH_ROI / 2, self.CROP_SIZE / 2)
+
+    @property
+    def force(self):
+        """ Force of the applied pressure [N] (see MeasurementAnalyzer._pressure_to_force) """
+        return self.pressure * 6894.76 * np.pi * (self.pipette_size / 2.0 * 1e-6) ** 2
+
+    @property
+    def time(self):
+        """ Time of the frames since the valve opened [s], negative before """
+        return (np.arange(self.num_frames) - self.valve_frame - 1) / self.frame_rate
+
+    def force_trace(self, time):
+        """ Force at time points since the valve opened [N] """
+        if self.rise_time > 0:
+            return self.force * np.clip(np.asarray(time) / self.rise_time, 0.0, 1.0)
+        return np.where(np.asarray(time) >= 0, self.force, 0.0)
+
+    def aspiration_depth(self, params=None):
+        """ Ground truth aspiration depth of the zona (or for params) in each frame [m] """
+        params = self.params if params is None else params
+        time = self.time
+        after = time >= 0
+        depth = np.zeros(len(time))
+        if self.rise_time > 0:
+            depth[after] = ModifiedZener._calculate_model_output_trace(
+                time[after], self.force_trace(time[after]), *params)
+        else:
+            depth[after] = ModifiedZener._calculate_model_output(
+                [time[after], self.force], *params)
+        return depth
+
+    def oolemma_depth(self):
+        """ Ground truth aspiration depth of the oolemma in each frame [m] """
+        if self.oolemma_params is None:
+            return np.zeros(self.num_frames)
+        # The oolemma cannot pass the zona
+        return np.minimum(self.aspiration_depth(self.oolemma_params), self.aspiration_depth())
+
+    def frames(self):
+        """
+        Render the video frames as they are after decoding and rotating.
+
+        Returns:
+            frames (list): grayscale frames (uint8)
+        """
+        height, width = self.frame_size
+        rows, columns = np.mgrid[0:height, 0:width].astype(np.float64)
+        scale = self.conversion_factor
+        radius = self.OOCYTE_RADIUS * scale
+        distance = np.hypot(columns - (self._mouth_x - radius), rows - self._center_y)
+        base = np.full(self.frame_size, self.BACKGROUND)
+        base[distance <= radius] = self.ZONA
+        base[distance <= radius - self.zona_thickness * scale] = self.CYTOPLASM
+        inner_radius = self.pipette_size * scale / 2.0
+        across = np.abs(rows[:, 0] - self._center_y)
+        inside = across < inner_radius
+        wall = (across >= inner_radius) & (across < inner_radius + self.WALL_THICKNESS)
+        base[np.ix_(wall, columns[0] >= self._mouth_x)] = self.WALL
+        base[np.ix_(inside, columns[0] >= self._mouth_x)] = self.BACKGROUND
+
+        rng = np.random.default_rng(self.seed)
+        tips = self.aspiration_depth() * 1e6 * scale
+        oolemma_tips = self.oolemma_depth() * 1e6 * scale
+        position = columns[0] - self._mouth_x
+        frames = []
+        for tip, oolemma_tip in zip(tips, oolemma_tips):
+            # Fraction of each pixel column covered by the aspirated zona and cytoplasm
+            coverage = np.clip(tip - position, 0.0, 1.0) * (position >= 0)
+            cytoplasm = np.clip(oolemma_tip - position, 0.0, 1.0) * (position >= 0)
+            frame = base.copy()
+            frame[inside] += (self.ZONA - self.BACKGROUND) * coverage \
+                + (self.CYTOPLASM - self.ZONA) * cytoplasm
+            frame += rng.normal(0.0, self.noise, frame.shape)
+            frames.append(np.clip(np.round(frame), 0, 255).astype(np.uint8))
+        return frames
+
+    def pressure_log(self):
+        """ The lines of the pressure log, with the time since the start of the video """
+        rng = np.random.default_rng(self.seed + 1)
+        valve_time = (self.valve_frame + 1) / self.frame_rate
+        stamps = np.arange(int(self.num_frames / self.frame_rate * self.pressure_rate) + 1) \
+            / self.pressure_rate
+        pressure = self.force_trace(stamps - valve_time) / self.force * self.pressure
+        pressure += rng.normal(0.0, self.pressure_noise, len(stamps))
+        lines = ['{:.4f}\t{:.5f}\n'.format(stamp, value) for stamp, value in zip(stamps, pressure)]
+        position = int(np.searchsorted(stamps, valve_time, side='right'))
+        lines.insert(position, '{:.4f}\tValve\n'.format(valve_time))
+        return lines
+
+    def write(self, directory, name='synthetic', fourcc='FFV1'):
+        """
+        Write the video and the pressure log.
+
+        Args:
+            directory (str):    directory of the files
+            name (str):         name of the files without extension
+            fourcc (str):       codec of the video, e.g. 'FFV1' (lossless)
+                                or 'MJPG' (compressed like the clinic videos)
+        Returns:
+            video_path (str):       full path to the video file (.avi)
+            pressure_path (str):    full path to the pressure log (.txt)
+        """
+        import cv2
+        os.makedirs(directory, exist_ok=True)
+        video_path = os.path.join(directory, name + '.avi')
+        pressure_path = os.path.join(directory, name + '.txt')
+        # Decoding rotates the frames clockwise by the rotation
+        frames = [np.ascontiguousarray(np.rot90(frame, self.rotation // 90))
+                  for frame in self.frames()]
+        height, width = frames[0].shape
+        writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*fourcc), self.frame_rate,
+                                 (width, height), True)
+        if not writer.isOpened():
+            raise ValueError('Codec {} is not available for writing {}.'.format(fourcc, video_path))
+        try:
+            for frame in frames:
+                writer.write(cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR))
+        finally:
+            writer.release()
+        with open(pressure_path, 'w') as log:
+            log.writelines(self.pressure_log())
+        return video_path, pressure_path
+
+    def analyze(self, video_path, pressure_path, use_force_trace=False, cache_directory=None):
+        """
+        Decode, track and fit a written measurement without user interaction,
+        with the frame before the movement and the regions of the generator.
+
+        Args:
+            video_path (str):       full path to the video file
+            pressure_path (str):    full path to the pressure log
+            use_force_trace (bool): True to fit the sampled force instead of
+                                    a step of the mean force
+            cache_directory (str):  directory of the pressure cache, None to
+                                    disable it
+        Returns:
+            params (dict):              the fitted model parameters
+            aspiration_depth (array):   the tracked aspiration depth [m]
+        """
+        from utils import ioutils
+        from utils.frame_transform import FrameTransform
+        # The frames are cropped while decoding, the selection keeps the whole crop
+        decoded, frame_rate = ioutils.decode_video_file(
+            video_path, transform=FrameTransform(self.rotation, self.crop_center,
+                                                 (self.CROP_SIZE, self.CROP_SIZE)))
+        video_frames, time = ioutils.select_measurement_frames(
+            decoded, frame_rate, self.valve_frame, (self.CROP_SIZE // 2, self.CROP_SIZE // 2))
+        trace, pressure = ioutils.read_pressure_trace(pressure_path, cache_directory)
+        tracker = AspirationDepth(video_frames, 4.0, self.zona_thickness,
+                                  self.conversion_factor, time)
+        tracker.offset = self.offset
+        tracker.roi_center = self.roi_center
+        offset, depth_pixel, depth = tracker.track()
+        force = pressure * 6894.76 * np.pi * (self.pipette_size / 2.0 * 1e-6) ** 2
+        force_trace = None
+        if use_force_trace:
+            force_trace = np.interp(time, trace[:, 0], trace[:, 1]) / pressure * force
+        model = ModifiedZener(time, depth[:len(time)].astype(np.float64), float(force),
+                              force_trace)
+        return model.fit(plot=False), depth
+
+
+if __name__ == '__main__':
+    import tempfile
+    measurement = SyntheticMeasurement(rotation=180)
+    paths = measurement.write(tempfile.mkdtemp())
+    print(paths)
+    print(measurement.params, measurement.analyze(*paths)[0])
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+import cv2
+import numpy as np
+import analysis_pipeline as ap
+import measurement as m
+import properties
+from blob_store import BlobStore
+from results_store import ResultsStore
+from synthetic_measurement import SyntheticMeasurement
+from trace_archive import TraceArchive
+
+
+class TestAnalysisPipeline(unittest.TestCase):
+    """ Test the AnalysisPipeline class """
+    def setUp(self):
+        self.measurements = [m.Measurement({'NUMBER': 1, 'OOCYTE': i}) for i in range(4)]
+        self.jobs = [ap.AnalysisJob(self.measurements[i], 'video{}.avi'.format(i),
+                                    'pressure{}.txt'.format(i)) for i in range(4)]
+
+    def test_invalid_input(self):
+        """ Test that a ValueError is raised for invalid settings """
+        with self.assertRaises(ValueError):
+            ap.AnalysisPipeline(prefetch=-1)
+        with self.assertRaises(ValueError):
+            ap.AnalysisPipeline(workers=0)
+
+    def test_run(self):
+        """ Test that loading and fitting run in the background and the
+        annotation on the calling thread in the order of the jobs """
+        calls = []
+        main_thread = threading.current_thread()
+
+        def load(analyzer, video_path, pressure_path):
+            calls.append(('load', video_path, threading.current_thread() is main_thread))
+            return analyzer
+
+        def annotate(analyzer, manual=False, time_valve_opened=None, roi_center=None):
+            calls.append(('annotate', analyzer.measurement,
+                          threading.current_thread() is main_thread))
+            return analyzer
+
+        def track_and_fit(analyzer):
+            calls.append(('fit', analyzer.measurement,
+                          threading.current_thread() is main_thread))
+            return analyzer.measurement
+
+        with patch.object(ap.MeasurementAnalyzer, 'load', load), \
+                patch.object(ap.MeasurementAnalyzer, 'annotate', annotate), \
+                patch.object(ap.MeasurementAnalyzer, 'track_and_fit', track_and_fit):
+            measurements = ap.AnalysisPipeline(prefetch=1).run(self.jobs)
+        self.assertEqual(measurements, self.measurements)
+        annotations = [call[1] for call in calls if call[0] == 'annotate']
+        self.assertEqual(annotations, measurements)
+        for call in calls:
+            self.assertEqual(call[2], call[0] == 'annotate')
+        self.assertEqual(len([call for call in calls if call[0] == 'load']), 4)
+
+    def test_run_several_measurements_per_video(self):
+        """ Test that a video with several measurements is decoded once and
+        each measurement gets its own frame before the movement and region """
+        jobs = [ap.AnalysisJob(self.measurements[i], 'video{}.avi'.format(i // 2),
+                               'pressure{}.txt'.format(i), 10 * i, (100, 50 * i))
+                for i in range(4)]
+        decoded = {}
+        events = {}
+        fitted = []
+        main_thread = threading.current_thread()
+
+        def decode(analyzer, video_path):
+            decoded[video_path] = decoded.get(video_path, 0) + 1
+            return ['frames of ' + video_path], 50.0
+
+        def load_decoded(analyzer, frames, frame_rate, pressure_path):
+            analyzer.frames = frames
+            return analyzer
+
+        def annotate(analyzer, manual=False, time_valve_opened=None, roi_center=None):
+            events[analyzer.measurement] = (analyzer.frames[0], time_valve_opened, roi_center)
+            return analyzer
+
+        def track_and_fit(analyzer):
+            fitted.append(threading.current_thread() is main_thread)
+            return analyzer.measurement
+
+        with patch.object(ap.MeasurementAnalyzer, 'decode', decode), \
+                patch.object(ap.MeasurementAnalyzer, 'load_decoded', load_decoded), \
+                patch.object(ap.MeasurementAnalyzer, 'annotate', annotate), \
+                patch.object(ap.MeasurementAnalyzer, 'track_and_fit', track_and_fit):
+            measurements = ap.AnalysisPipeline(prefetch=1).run(jobs)
+        self.assertEqual(measurements, self.measurements)
+        self.assertEqual(decoded, {'video0.avi': 1, 'video1.avi': 1})
+        self.assertEqual(events[self.measurements[1]], ('frames of video0.avi', 10, (100, 50)))
+        self.assertEqual(events[self.measurements[2]], ('frames of video1.avi', 20, (100, 100)))
+        self.assertEqual(fitted, [False] * 4)
+
+    def test_run_duplicate_jobs(self):
+        """ Test that a ValueError is raised for two jobs of the same aspiration """
+        jobs = [ap.AnalysisJob(m.Measurement({'NUMBER': 1, 'OOCYTE': 2}), 'video.avi',
+                               'pressure.txt') for i in range(2)]
+        with self.assertRaises(ValueError):
+            ap.AnalysisPipeline().run(jobs)
+
+    def test_run_aspirations_of_an_oocyte(self):
+        """ Test that the results of two aspirations of an oocyte in one video
+        are both kept """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        # One video with an aspiration of a soft and then of a stiff zona
+        aspirations = [SyntheticMeasurement(params=params, pipette_size=50.0, rotation=180,
+                                            seed=seed)
+                       for seed, params in enumerate([(0.1, 0.2, 0.1, 0.05),
+                                                      (0.1, 0.4, 0.1, 0.05)])]
+        video_path = os.path.join(directory, 'oocyte.avi')
+        frames = [np.rot90(frame, 2) for aspiration in aspirations
+                  for frame in aspiration.frames()]
+        height, width = frames[0].shape
+        writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'FFV1'),
+                                 aspirations[0].frame_rate, (width, height), True)
+        for frame in frames:
+            writer.write(cv2.cvtColor(np.ascontiguousarray(frame), cv2.COLOR_GRAY2BGR))
+        writer.release()
+        jobs = []
+        for i, aspiration in enumerate(aspirations):
+            pressure_path = aspiration.write(directory, 'aspiration{}'.format(i + 1))[1]
+            measurement = m.Measurement({'NUMBER': 1, 'OOCYTE': 2, 'ASPIRATION': i + 1})
+            jobs.append(ap.AnalysisJob(measurement, video_path, pressure_path,
+                                       i * aspirations[0].num_frames + aspiration.valve_frame,
+                                       aspiration.crop_center))
+
+        def annotate_properties(analyzer, video_frames, time, manual):
+            # The regions of the generator instead of the user
+            aspiration = aspirations[analyzer.measurement.aspiration_number - 1]
+            analyzer._aspiration_depth = properties.AspirationDepth(
+                video_frames, 4.0, aspiration.zona_thickness, aspiration.conversion_factor, time)
+            analyzer._aspiration_depth.offset = aspiration.offset
+            analyzer._aspiration_depth.roi_center = aspiration.roi_center
+
+        archive = TraceArchive(os.path.join(directory, 'traces.bin'))
+        pipeline = ap.AnalysisPipeline(analyzer_options={
+            'trace_archive': archive, 'blob_store': BlobStore(os.path.join(directory, 'blobs'))})
+        with patch.object(ap.MeasurementAnalyzer, '_annotate_properties', annotate_properties):
+            measurements = pipeline.run(jobs)
+        results = ResultsStore(os.path.join(directory, 'results'))
+        for measurement in measurements:
+            results.record(measurement)
+        store = ResultsStore(os.path.join(directory, 'results')).load()
+        self.assertEqual(len(store), 2)
+        for aspiration_number, aspiration in enumerate(aspirations, 1):
+            row = store.row(1, 2, aspiration_number)
+            self.assertAlmostEqual(store.column('K1_ZP')[row], aspiration.params[1], delta=0.02)
+            expected = aspiration.aspiration_depth()[aspiration.valve_frame + 1:]
+            depth = archive.get(1, 2, m.PropertyKeys.ASPIRATION_DEPTH_ZONA_MECH,
+                                aspiration_number)
+            np.testing.assert_allclose(depth, expected[:len(depth)], atol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
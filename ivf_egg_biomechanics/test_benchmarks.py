@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import benchmarks
+
+
+class TestBenchmarks(unittest.TestCase):
+    """ Test running, saving and comparing benchmarks """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_run_and_save(self):
+        """ Test that a quick run is saved by commit """
+        report = benchmarks.run_benchmarks(['fit'], quick=True)
+        names = set(result['name'] for result in report['results'])
+        self.assertEqual(names, {'fit_step', 'fit_trace', 'fit_multi_start', 'select_model',
+                                 'fit_batch'})
+        for result in report['results']:
+            self.assertLessEqual(result['min'], result['median'])
+        path = benchmarks.save_report(report, self.directory)
+        self.assertEqual(os.path.basename(path), report['commit'] + '.json')
+        with open(path) as report_file:
+            self.assertEqual(json.load(report_file), report)
+
+    def test_compare_reports(self):
+        """ Test that only benchmarks with the same parameters are compared """
+        old = {'commit': 'a', 'results': [
+            {'name': 'track', 'params': {'frames': 35}, 'median': 2.0}]}
+        new = {'commit': 'b', 'results': [
+            {'name': 'track', 'params': {'frames': 35}, 'median': 1.0},
+            {'name': 'track', 'params': {'frames': 100}, 'median': 3.0}]}
+        lines = benchmarks.compare_reports(old, new).splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].endswith('0.50'))
+
+
+if __name__ == '__main__':
+    unittest.main()
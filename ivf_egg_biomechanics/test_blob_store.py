@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import measurement as m
+from blob_store import BlobStore, BlobRef
+
+
+class TestBlobStore(unittest.TestCase):
+    """ Test the BlobStore class """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = BlobStore(self.directory)
+        self.frames = [np.full((6, 8), i, dtype=np.uint8) for i in range(5)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_put_and_get(self):
+        """ Test that frames are stored as one array and read back lazily """
+        reference = self.store.put(self.frames)
+        self.assertIn(reference.digest, self.store)
+        array = reference.load()
+        self.assertIsInstance(array, np.memmap)
+        self.assertEqual(array.shape, (5, 6, 8))
+        np.testing.assert_array_equal(array, np.stack(self.frames))
+        self.assertNotIsInstance(reference.load(mmap=False), np.memmap)
+
+    def test_content_hash(self):
+        """ Test that equal content is stored once and other content separately """
+        first = self.store.put(self.frames)
+        self.assertEqual(self.store.put(np.stack(self.frames)), first)
+        self.assertNotEqual(self.store.put(self.frames[::-1]), first)
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        self.assertEqual(self.store.ref(str(first)), first)
+
+    def test_invalid_input(self):
+        """ Test that errors are raised for invalid arrays and references """
+        with self.assertRaises(ValueError):
+            self.store.put([])
+        with self.assertRaises(ValueError):
+            self.store.put([np.zeros((2, 2)), np.zeros((3, 2))])
+        with self.assertRaises(ValueError):
+            self.store.ref('frames')
+        with self.assertRaises(KeyError):
+            self.store.ref('blob:1234').load()
+
+    def test_measurement(self):
+        """ Test that a measurement keeps only the reference of the frames """
+        meas = m.Measurement({})
+        reference = self.store.put(self.frames)
+        meas.set_property(m.PropertyKeys.VIDEO_FRAMES, reference)
+        self.assertIsInstance(meas.data['VIDEO_FRAMES'], BlobRef)
+        frames = meas.get_property(m.PropertyKeys.VIDEO_FRAMES)
+        np.testing.assert_array_equal(frames[2], self.frames[2])
+        self.assertEqual(meas.get_property(m.PropertyKeys.TIME), -1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import numpy as np
+import pandas as pd
+from cohort_index import CohortIndex
+
+
+class TestCohortIndex(unittest.TestCase):
+    """ Test the CohortIndex class """
+    def setUp(self):
+        self.data = pd.DataFrame({'NUMBER': [1, 1, 2, 2, np.nan],
+                                  'OOCYTE': [1, 2, 1, 2, 1],
+                                  'MEASURED': [1, 0, 1, 1, 1],
+                                  'FERTILIZED': [1, 1, 0, 1, 1]},
+                                 index=[10, 11, 12, 13, 14])
+        self.cohort = CohortIndex(self.data)
+
+    def test_find(self):
+        """ Test that measured oocytes are found by patient and oocyte number """
+        self.assertEqual(self.cohort.find(2, 2), [13])
+        self.assertEqual(self.cohort.find(1, 2), [])
+        self.assertTrue(self.cohort.has_patient(1))
+        self.assertFalse(self.cohort.has_patient(3))
+        self.assertEqual(CohortIndex(pd.DataFrame()).find(1, 1), [])
+        with self.assertRaises(TypeError):
+            CohortIndex({'NUMBER': [1]})
+
+    def test_select(self):
+        """ Test that filters are cached until their column changes """
+        positions = self.cohort.select('FERTILIZED', 1)
+        np.testing.assert_array_equal(positions, [0, 1, 3, 4])
+        self.assertIs(self.cohort.select('FERTILIZED', 1), positions)
+        self.assertEqual(self.cohort.rows('FERTILIZED', 0).index.tolist(), [12])
+        self.data.loc[10, 'FERTILIZED'] = 0
+        self.cohort.invalidate(['K0_ZP'])
+        self.assertIs(self.cohort.select('FERTILIZED', 1), positions)
+        self.cohort.invalidate(['FERTILIZED'])
+        np.testing.assert_array_equal(self.cohort.select('FERTILIZED', 1), [1, 3, 4])
+
+    def test_invalidate_index(self):
+        """ Test that the index is rebuilt when the measured oocytes change """
+        self.data.loc[11, 'MEASURED'] = 1
+        self.assertEqual(self.cohort.find(1, 2), [])
+        self.cohort.invalidate(['MEASURED'])
+        self.assertEqual(self.cohort.find(1, 2), [11])
+
+
+if __name__ == '__main__':
+    unittest.main()
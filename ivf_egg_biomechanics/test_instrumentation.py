@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+import numpy as np
+import measurement as m
+import instrumentation
+import oocyte_models
+from instrumentation import StageRecorder
+from measurement_analyzer import MeasurementAnalyzer
+from oocyte_models import ModifiedZener
+
+
+class TestInstrumentation(unittest.TestCase):
+    """ Test the StageRecorder class and the aggregation of records """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'stages.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_stage(self):
+        """ Test that stages are recorded in memory and in the file """
+        recorder = StageRecorder(self.path)
+        with patch.object(instrumentation, 'current_rss', side_effect=[80.0, 92.0]):
+            with recorder.stage('decode', patient=np.int64(3)) as record:
+                sum(range(10000))
+                record['frames'] = 12
+        with self.assertRaises(ValueError):
+            with recorder.stage('fit'):
+                raise ValueError('no convergence')
+        records = instrumentation.read_records(self.path)
+        self.assertEqual(records, recorder.records)
+        self.assertEqual(records[0]['patient'], 3)
+        self.assertEqual(records[0]['frames'], 12)
+        self.assertGreater(records[0]['wall'], 0.0)
+        self.assertGreaterEqual(records[0]['cpu'], 0.0)
+        self.assertEqual(records[1]['error'], 'ValueError')
+        self.assertGreaterEqual(records[0]['process_cpu'], 0.0)
+        if instrumentation.resource is not None:
+            self.assertGreater(records[0]['process_peak_rss'], 0.0)
+        self.assertEqual((records[0]['rss_start'], records[0]['rss_end']), (80.0, 92.0))
+        if os.path.exists('/proc/self/statm'):
+            self.assertGreater(instrumentation.current_rss(), 0.0)
+
+    def test_aggregate(self):
+        """ Test that records are aggregated by stage """
+        records = [{'stage': 'track', 'wall': 1.0, 'cpu': 0.5, 'process_cpu': 0.8,
+                    'rss_start': 80.0, 'rss_end': 90.0, 'process_peak_rss': 100.0, 'frames': 50},
+                   {'stage': 'fit', 'wall': 0.2, 'cpu': 0.2, 'process_cpu': 0.2,
+                    'rss_start': None, 'rss_end': None, 'process_peak_rss': None,
+                    'frames': None},
+                   {'stage': 'track', 'wall': 3.0, 'cpu': 1.5, 'process_cpu': 2.0,
+                    'rss_start': 90.0, 'rss_end': 85.0, 'process_peak_rss': 120.0,
+                    'frames': 150, 'error': 'KeyError'}]
+        summary = instrumentation.aggregate(records)
+        self.assertEqual(list(summary), ['track', 'fit'])
+        self.assertEqual(summary['track']['count'], 2)
+        self.assertEqual(summary['track']['wall'], 4.0)
+        self.assertEqual(summary['track']['wall_max'], 3.0)
+        self.assertEqual(summary['track']['wall_mean'], 2.0)
+        self.assertEqual(summary['track']['process_cpu'], 2.8)
+        self.assertEqual(summary['track']['rss_growth'], 5.0)
+        self.assertEqual(summary['track']['process_peak_rss'], 120.0)
+        self.assertIsNone(summary['fit']['rss_growth'])
+        self.assertEqual(summary['track']['fps'], 50.0)
+        self.assertEqual(summary['track']['errors'], 1)
+        self.assertIsNone(summary['fit']['fps'])
+        self.assertIn('track', instrumentation.format_summary(summary))
+
+    def test_analyzer(self):
+        """ Test that the analyzer records its stages """
+        recorder = StageRecorder()
+        meas = m.Measurement({'NUMBER': 4, 'OOCYTE': 2})
+        analyzer = MeasurementAnalyzer(meas, recorder=recorder)
+        analyzer._aspiration_depth = MagicMock(video_frames=[None] * 8)
+        analyzer._aspiration_depth.track.return_value = (3, np.zeros(8), np.zeros(8))
+        analyzer._track_aspiration_depth()
+        self.assertEqual(len(recorder.records), 1)
+        record = recorder.records[0]
+        self.assertEqual((record['stage'], record['patient'], record['oocyte'], record['frames']),
+                         ('track', 4, 2, 8))
+
+    def test_analyzer_model_selection(self):
+        """ Test that the selected model is recorded and stored """
+        recorder = StageRecorder()
+        meas = m.Measurement({'NUMBER': 4, 'OOCYTE': 2})
+        time = np.arange(35) / 70.0
+        meas.set_property(m.PropertyKeys.TIME, [time])
+        meas.set_property(m.PropertyKeys.APPLIED_FORCE, 4e-6)
+        meas.set_property(m.PropertyKeys.ASPIRATION_DEPTH_ZONA_MECH,
+                          [4e-6 * (1 - np.exp(-20.0 * time)) / 0.2])
+        analyzer = MeasurementAnalyzer(meas, recorder=recorder, model_selection='bic')
+        with patch.object(oocyte_models, '_fit_model', wraps=oocyte_models._fit_model) as fit:
+            analyzer._fit_models(plot=False)
+        # The modified Zener model is only fitted once
+        self.assertNotIn('MODIFIED_ZENER', [call[0][0] for call in fit.call_args_list])
+        self.assertEqual([record['stage'] for record in recorder.records],
+                         ['fit', 'select_model'])
+        self.assertIn(meas.data['MODEL'], ('KELVIN_VOIGT', 'STANDARD_LINEAR_SOLID'))
+        self.assertAlmostEqual(meas.data['KV_K'], 0.2, places=3)
+        self.assertNotEqual(meas.data['MODEL_BIC'], -1)
+        with self.assertRaises(ValueError):
+            MeasurementAnalyzer(meas, model_selection='r2')
+
+    def test_analyzer_oolemma(self):
+        """ Test that the oolemma is fitted if it was tracked """
+        recorder = StageRecorder()
+        meas = m.Measurement({'NUMBER': 4, 'OOCYTE': 2})
+        time = np.arange(35) / 70.0
+        meas.set_property(m.PropertyKeys.TIME, [time])
+        meas.set_property(m.PropertyKeys.APPLIED_FORCE, 4e-6)
+        meas.set_property(m.PropertyKeys.ASPIRATION_DEPTH_ZONA_MECH,
+                          [ModifiedZener._calculate_model_output([time, 4e-6], 0.1, 0.2, 0.1, 0.05)])
+        meas.set_property(m.PropertyKeys.ASPIRATION_DEPTH_OOLEMMA_MECH,
+                          [ModifiedZener._calculate_model_output([time, 4e-6], 0.3, 0.4, 0.2, 0.05)])
+        analyzer = MeasurementAnalyzer(meas, recorder=recorder,
+                                       fit_options={'starts': 16})
+        analyzer._fit_models(plot=False)
+        self.assertEqual([record['stage'] for record in recorder.records],
+                         ['fit', 'fit_oolemma'])
+        self.assertAlmostEqual(meas.data['K1_ZP'], 0.2, places=3)
+        self.assertAlmostEqual(meas.data['K1_OL'], 0.4, places=3)
+        self.assertAlmostEqual(meas.data['ETA1_OL'], 0.2, places=3)
+
+
+if __name__ == '__main__':
+    unittest.main()
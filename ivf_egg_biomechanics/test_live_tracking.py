@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from live_tracking import LiveTracker
+from properties import AspirationDepth
+from synthetic_measurement import SyntheticMeasurement
+
+
+class TestLiveTracker(unittest.TestCase):
+    """ Test the tracking and fitting while a measurement is recorded """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _tracker(self, measurement, **kwargs):
+        return LiveTracker(measurement.roi_center, measurement.offset,
+                           measurement.conversion_factor, float(measurement.force),
+                           crop_center=measurement.crop_center, **kwargs)
+
+    def _offline_depth(self, measurement, frames):
+        video_frames = [frame[measurement.crop_center[1] - 100:measurement.crop_center[1] + 100,
+                              measurement.crop_center[0] - 100:measurement.crop_center[0] + 100]
+                        for frame in frames[measurement.valve_frame:]]
+        time = np.arange(25) / measurement.frame_rate
+        tracker = AspirationDepth(video_frames, 4.0, measurement.zona_thickness,
+                                  measurement.conversion_factor, time)
+        tracker.offset = measurement.offset
+        tracker.roi_center = measurement.roi_center
+        return tracker.track()[2][:len(time)]
+
+    def test_init(self):
+        """ Test that invalid settings are rejected """
+        measurement = SyntheticMeasurement()
+        with self.assertRaises(TypeError):
+            LiveTracker(measurement.roi_center, measurement.offset, 1.55, 1)
+        with self.assertRaises(ValueError):
+            self._tracker(measurement, update_every=0)
+        with self.assertRaises(ValueError):
+            self._tracker(measurement).process(np.zeros((480, 640), dtype=np.uint8))
+
+    def test_process(self):
+        """ Test that the valve is detected and the depth matches the offline tracking """
+        measurement = SyntheticMeasurement()
+        frames = measurement.frames()
+        estimates = []
+        tracker = self._tracker(measurement, frame_rate=measurement.frame_rate,
+                                on_estimate=estimates.append)
+        for frame in frames:
+            tracker.process(frame)
+        self.assertEqual(tracker.valve_frame, measurement.valve_frame)
+        self.assertTrue(tracker.done)
+        np.testing.assert_allclose(tracker.time, np.arange(25) / measurement.frame_rate)
+        np.testing.assert_allclose(tracker.aspiration_depth,
+                                   self._offline_depth(measurement, frames))
+        # The first estimate is provisional and is emitted after the delay
+        self.assertTrue(estimates[0]['provisional'])
+        self.assertAlmostEqual(estimates[0]['time'], 0.1)
+        self.assertFalse(estimates[-1]['provisional'])
+        self.assertTrue(all(estimate['provisional'] for estimate in estimates[:-1]))
+        self.assertAlmostEqual(estimates[-1]['K1_ZP'], 0.2, delta=0.02)
+        self.assertAlmostEqual(estimates[-1]['ETA1_ZP'], 0.1, delta=0.01)
+
+    def test_valve_frame(self):
+        """ Test that a given valve frame is used instead of the detection """
+        measurement = SyntheticMeasurement()
+        tracker = self._tracker(measurement, frame_rate=measurement.frame_rate,
+                                valve_frame=measurement.valve_frame)
+        for frame in measurement.frames():
+            tracker.process(frame)
+        self.assertEqual(len(tracker.time), 25)
+        self.assertEqual(tracker.time[0], 0.0)
+
+    def test_dropped_frames(self):
+        """ Test that the window ends in time when frames are dropped """
+        measurement = SyntheticMeasurement()
+        frames = measurement.frames()
+        start = measurement.valve_frame + 1
+        # Every third frame after the valve opened and the last ones of the window are dropped
+        indices = [index for index in range(len(frames))
+                   if index < start or ((index - start) % 3 and not 22 <= index - start <= 24)]
+        tracker = self._tracker(measurement, frame_rate=measurement.frame_rate,
+                                valve_frame=measurement.valve_frame)
+        for index in indices:
+            tracker.process(frames[index], index)
+            if tracker.done:
+                break
+        self.assertTrue(tracker.done)
+        self.assertEqual(index, start + 25)
+        self.assertAlmostEqual(tracker.time[-1], 20 / measurement.frame_rate)
+        self.assertFalse(tracker.estimates[-1]['provisional'])
+        self.assertLess(tracker.estimates[-1]['time'], LiveTracker.WINDOW)
+
+    def test_finish(self):
+        """ Test the final estimate of a measurement that ends early """
+        measurement = SyntheticMeasurement()
+        tracker = self._tracker(measurement, frame_rate=measurement.frame_rate)
+        for frame in measurement.frames()[:measurement.valve_frame + 16]:
+            tracker.process(frame)
+        self.assertFalse(tracker.done)
+        estimate = tracker.finish()
+        self.assertFalse(estimate['provisional'])
+        self.assertEqual(estimate['frames'], 15)
+        self.assertIsNone(tracker.finish())
+
+    def test_run(self):
+        """ Test the replay of a video file like a camera """
+        measurement = SyntheticMeasurement(rotation=180)
+        video_path, pressure_path = measurement.write(self.directory)
+        tracker = self._tracker(measurement)
+        estimate = tracker.run(video_path, rotation=180, realtime=True)
+        self.assertEqual(tracker.frame_rate, 50.0)
+        self.assertEqual(tracker.valve_frame, measurement.valve_frame)
+        self.assertEqual(tracker.dropped, 0)
+        self.assertFalse(estimate['provisional'])
+        self.assertAlmostEqual(estimate['K1_ZP'], 0.2, delta=0.02)
+        # The latency is bounded by the tracking and the budget of the fit
+        self.assertLess(max(tracker.latencies), 1.0 / 50.0 + 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
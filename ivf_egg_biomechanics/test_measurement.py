@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import numpy as np
+import pandas as pd
 import measurement as m
 import unittest
 
@@ -80,7 +82,76 @@ class TestMeasurement(unittest.TestCase):
         """ Test that a TypeError is raised if parameter is not in ParameterKeys """
         with self.assertRaises(TypeError):
             m.Measurement.set_model_parameter('INVALIDKEY', 4.7)
-    
+
+    def test_compact_layout(self):
+        """ Test that a measurement has no instance dict and a read-only data view """
+        meas = m.Measurement({'NUMBER': 1234, 'CLINIC': 'STANFORD', 'INVALIDKEY': 3},
+                             self.outcomes)
+        self.assertFalse(hasattr(meas, '__dict__'))
+        self.assertEqual(meas.data[m.PatientKeys.PATIENT_NUMBER.value], 1234)
+        self.assertEqual(meas.data[m.OutcomesKeys.D3GOOD.value], 1)
+        self.assertEqual(meas.data[m.ParameterKeys.K0_ZP.value], -1)
+        self.assertNotIn('INVALIDKEY', meas.data)
+        self.assertEqual(list(meas.data.keys()), [key.value for key in m.FIELD_TYPES])
+        with self.assertRaises(TypeError):
+            meas.data['NUMBER'] = 5
+
+    def test_has_value(self):
+        """ Test that has_value finds the values of the keys """
+        self.assertTrue(m.PatientKeys.has_value('NUMBER'))
+        self.assertFalse(m.PatientKeys.has_value('PATIENT_NUMBER'))
+        self.assertTrue(m.OutcomesKeys.has_value('BLASTGRADE'))
+        self.assertFalse(m.ParameterKeys.has_value('BLASTGRADE'))
+
+    def test_set_value(self):
+        """ Test that set_value validates the value of any key """
+        meas = m.Measurement({})
+        meas.set_value(m.ParameterKeys.TAU_ZP, 0.1)
+        self.assertEqual(meas.data['TAU_ZP'], 0.1)
+        with self.assertRaises(TypeError):
+            meas.set_value(m.OutcomesKeys.D3GRADE, 1)
+        with self.assertRaises(TypeError):
+            meas.set_value('TAU_ZP', 0.1)
+        with self.assertRaises(TypeError):
+            m.Measurement({'NUMBER': 4.2})
+
+    def test_numpy_values(self):
+        """ Test that the setters accept numpy integers and floats """
+        meas = m.Measurement({'NUMBER': np.int64(12)})
+        meas.set_model_parameter(m.ParameterKeys.K0_ZP, np.float32(0.5))
+        self.assertEqual(meas.data['NUMBER'], 12)
+        with self.assertRaises(TypeError):
+            meas.set_model_parameter(m.ParameterKeys.K0_ZP, np.int64(1))
+
+    def test_from_dataframe(self):
+        """ Test that measurements are created from the rows of a table """
+        data = pd.DataFrame({'NUMBER': [1.0, 2.0], 'OOCYTE': [1, 1],
+                             'CLINIC': ['STANFORD', None], 'K0_ZP': [0.1, np.nan],
+                             'D3GRADE': ['8A', '6B'], 'MEASURED': [1, 1]})
+        first, second = m.Measurement.from_dataframe(data)
+        self.assertEqual(first.data['NUMBER'], 1)
+        self.assertIs(type(first.data['NUMBER']), int)
+        self.assertEqual(first.data['CLINIC'], 'STANFORD')
+        self.assertEqual(first.data['K0_ZP'], 0.1)
+        self.assertEqual(second.data['CLINIC'], -1)
+        self.assertEqual(second.data['K0_ZP'], -1)
+        self.assertEqual(second.data['D3GRADE'], '6B')
+        self.assertEqual(second.data['AGE'], -1)
+
+    def test_from_dataframe_invalid(self):
+        """ Test that all invalid cells are reported at once """
+        data = pd.DataFrame({'NUMBER': [1, 2.5, 3], 'AGE': ['30', 'old', 35],
+                             'D3GRADE': ['8A', 6, None]})
+        with self.assertRaises(ValueError) as error:
+            m.Measurement.from_dataframe(data)
+        message = str(error.exception)
+        self.assertIn('NUMBER', message)
+        self.assertIn('[1]', message)
+        self.assertIn("['old']", message)
+        self.assertIn('D3GRADE', message)
+        with self.assertRaises(TypeError):
+            m.Measurement.from_dataframe({'NUMBER': [1]})
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import unittest
+import measurement as m
+from measurement_store import MeasurementStore
+
+
+class TestMeasurementStore(unittest.TestCase):
+    """ Test the MeasurementStore class """
+    def setUp(self):
+        self.store = MeasurementStore(capacity=2)
+        self.store.insert({'NUMBER': [1, 1, 2], 'OOCYTE': [1, 2, 1],
+                           'AGE': [30, 30, 41], 'CLINIC': ['A', 'A', None],
+                           m.ParameterKeys.K0_ZP: [0.1, np.nan, 0.3],
+                           'FERTILIZED': [1, 0, 1]})
+
+    def test_insert(self):
+        """ Test that values and masks are stored and the store grows """
+        self.assertEqual(len(self.store), 3)
+        np.testing.assert_array_equal(self.store.column('AGE'), [30, 30, 41])
+        np.testing.assert_array_equal(self.store.mask('K0_ZP'), [True, False, True])
+        np.testing.assert_array_equal(self.store.mask('CLINIC'), [True, True, False])
+        self.assertFalse(self.store.mask('MII').any())
+        self.assertEqual(self.store.column('FERTILIZED').dtype, np.int64)
+
+    def test_insert_invalid(self):
+        """ Test that errors are raised for duplicates and unknown keys """
+        with self.assertRaises(ValueError):
+            self.store.insert({'NUMBER': [1], 'OOCYTE': [2]})
+        with self.assertRaises(KeyError):
+            self.store.insert({'NUMBER': [3], 'OOCYTE': [1], 'INVALIDKEY': [1]})
+        with self.assertRaises(KeyError):
+            self.store.insert({'NUMBER': [3]})
+
+    def test_update(self):
+        """ Test that only the given rows and keys are updated """
+        rows = self.store.update({'NUMBER': [2, 1], 'OOCYTE': [1, 2],
+                                  'K0_ZP': [0.5, 0.2]})
+        np.testing.assert_array_equal(rows, [2, 1])
+        np.testing.assert_allclose(self.store.column('K0_ZP'), [0.1, 0.2, 0.5])
+        self.assertTrue(self.store.mask('K0_ZP').all())
+        np.testing.assert_array_equal(self.store.column('AGE'), [30, 30, 41])
+        with self.assertRaises(KeyError):
+            self.store.update({'NUMBER': [5], 'OOCYTE': [1], 'K0_ZP': [0.5]})
+
+    def test_aspirations(self):
+        """ Test that the aspirations of an oocyte are kept in their own rows """
+        rows = self.store.insert({'NUMBER': [1, 1], 'OOCYTE': [2, 2], 'ASPIRATION': [2, 3],
+                                  'K0_ZP': [0.4, 0.6]})
+        np.testing.assert_array_equal(rows, [3, 4])
+        self.assertEqual(self.store.row(1, 2), 1)
+        self.assertEqual(self.store.row(1, 2, 3), 4)
+        np.testing.assert_array_equal(self.store.rows([1, 1], [2, 2], [2, None]), [3, 1])
+        self.store.update({'NUMBER': [1], 'OOCYTE': [2], 'ASPIRATION': [2], 'K0_ZP': [0.5]})
+        np.testing.assert_allclose(self.store.column('K0_ZP')[[0, 2, 3, 4]], [0.1, 0.3, 0.5, 0.6])
+        self.assertEqual(self.store.to_measurement(3).aspiration_number, 2)
+        self.assertEqual(self.store.to_measurement(1).aspiration_number, 1)
+        with self.assertRaises(ValueError):
+            self.store.insert({'NUMBER': [1], 'OOCYTE': [2], 'ASPIRATION': [1]})
+
+    def test_feature_matrix(self):
+        """ Test that the feature matrix is a view of the store """
+        features, valid = self.store.feature_matrix()
+        self.assertEqual(features.shape, (3, len(MeasurementStore.FEATURE_KEYS)))
+        self.assertTrue(np.shares_memory(features, self.store.column('K0_ZP')))
+        np.testing.assert_array_equal(features[:, 0], self.store.column('K0_ZP'))
+        np.testing.assert_array_equal(valid[:, 0], [True, False, True])
+        rows = self.store.select(m.OutcomesKeys.FERTILIZED, 1)
+        np.testing.assert_array_equal(rows, [0, 2])
+
+    def test_measurements(self):
+        """ Test the conversion from and to Measurement instances """
+        meas = m.Measurement({'NUMBER': 3, 'OOCYTE': 4, 'CLINIC': 'B'},
+                             {'FERTILIZED': 1})
+        meas.set_model_parameter(m.ParameterKeys.K1_ZP, 0.2)
+        row = self.store.insert_measurements([meas])[0]
+        self.assertEqual(self.store.row(3, 4), row)
+        self.assertFalse(self.store.mask('K0_ZP')[row])
+        result = self.store.to_measurement(row)
+        self.assertEqual(result.data, meas.data)
+
+    def test_from_dataframe(self):
+        """ Test that a store is created from a table """
+        data = pd.DataFrame({'NUMBER': [1, 1], 'OOCYTE': [1, 2],
+                             'CLINIC': ['A', np.nan], 'K0_ZP': [np.nan, 0.2]})
+        store = MeasurementStore.from_dataframe(data)
+        self.assertEqual(store.row(1, 2), 1)
+        np.testing.assert_array_equal(store.mask('CLINIC'), [True, False])
+        np.testing.assert_array_equal(store.mask('K0_ZP'), [False, True])
+        self.assertEqual(store.column('K0_ZP')[1], 0.2)
+        with self.assertRaises(ValueError):
+            MeasurementStore.from_dataframe(data.assign(OOCYTE=['1', 'two']))
+
+    def test_from_dataframe_invalid_keys(self):
+        """ Test that rows without keys and repeated rows are skipped with a warning """
+        data = pd.DataFrame({'NUMBER': [1, np.nan, 1, 2, 1], 'OOCYTE': [1, 1, 1, np.nan, 2],
+                             'K0_ZP': [0.1, 0.2, 0.3, 0.4, 0.5]})
+        with self.assertWarns(UserWarning):
+            store = MeasurementStore.from_dataframe(data)
+        self.assertEqual(len(store), 2)
+        np.testing.assert_allclose(store.column('K0_ZP')[store.rows([1, 1], [1, 2])], [0.1, 0.5])
+
+    def test_save_and_load(self):
+        """ Test that values, masks and text survive saving and loading """
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'store.npz')
+            self.store.update({'NUMBER': [1], 'OOCYTE': [2], 'TIME': [[np.arange(2.0)]]})
+            self.store.save(path)
+            store = MeasurementStore.load(path)
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.row(2, 1), 2)
+        np.testing.assert_array_equal(store.mask('K0_ZP'), self.store.mask('K0_ZP'))
+        np.testing.assert_array_equal(store.column('K0_ZP'), self.store.column('K0_ZP'))
+        self.assertEqual(list(store.column('CLINIC')[:2]), ['A', 'A'])
+        self.assertFalse(store.mask('CLINIC')[2])
+        self.assertFalse(store.mask('TIME').any())
+
+
+    def test_load_references(self):
+        """ Test that references are resolved in the stores passed to load """
+        from blob_store import BlobStore, BlobRef
+        from trace_archive import TraceArchive, TraceRef
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'store.npz')
+            self.store.update({'NUMBER': [1], 'OOCYTE': [2], 'VIDEO_FRAMES': ['blob:1234'],
+                               'TIME': ['trace:1/2/TIME/1']})
+            self.store.save(path)
+            blob_store = BlobStore(os.path.join(directory, 'blobs'))
+            archive = TraceArchive(os.path.join(directory, 'traces.bin'))
+            store = MeasurementStore.load(path, blob_store, archive)
+            result = store.to_measurement(store.row(1, 2))
+            with self.assertRaises(ValueError):
+                MeasurementStore.load(path).to_measurement(store.row(1, 2))
+        finally:
+            shutil.rmtree(directory)
+        frames = result.data['VIDEO_FRAMES']
+        self.assertIsInstance(frames, BlobRef)
+        self.assertIs(frames.store, blob_store)
+        self.assertIsInstance(result.data['TIME'], TraceRef)
+        self.assertEqual(str(result.data['TIME']), 'trace:1/2/TIME/1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import os
+import subprocess
+import sys
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+import menu
+from measurement_store import MeasurementStore
+
+
+class TestMenu(unittest.TestCase):
+    """ Test the Menu class """
+    IMPORT_TIME_BUDGET = 1.0    # seconds for importing the menu
+    HEAVY_MODULES = ('cv2', 'imutils', 'tkinter', 'sklearn', 'scipy', 'matplotlib', 'skimage')
+
+    def test_import_time(self):
+        """ Test that the menu is imported quickly and without the heavy libraries """
+        script = ('import sys, time\n'
+                  'start = time.perf_counter()\n'
+                  'import menu\n'
+                  'print(time.perf_counter() - start)\n'
+                  'print(",".join(name for name in {!r} if name in sys.modules))\n'
+                  ).format(self.HEAVY_MODULES)
+        output = subprocess.run([sys.executable, '-c', script], check=True,
+                                cwd=os.path.dirname(os.path.abspath(menu.__file__)),
+                                stdout=subprocess.PIPE, universal_newlines=True).stdout
+        import_time, loaded = output.splitlines()
+        self.assertEqual(loaded, '')
+        self.assertLess(float(import_time), self.IMPORT_TIME_BUDGET)
+
+    def test_call_action(self):
+        """ Test that invalid choices keep the menu running """
+        egg_menu = menu.Menu()
+        with patch('builtins.print'):
+            self.assertEqual(egg_menu._call_action('9'), ('9', True))
+            self.assertEqual(egg_menu._call_action('6'), ('6', False))
+            self.assertEqual(egg_menu._call_action('2'), ('2', True))
+
+    def test_load_invalid_patient_data(self):
+        """ Test that invalid patient data is reported and the previous data is kept """
+        egg_menu = menu.Menu()
+        valid = pd.DataFrame({'NUMBER': [1], 'OOCYTE': [1], 'AGE': [30], 'MEASURED': [1]})
+        invalid = pd.DataFrame({'NUMBER': [2], 'OOCYTE': [1], 'AGE': ['n/a'], 'MEASURED': [1]})
+        with patch.object(menu.ioutils, 'load_excel_file', return_value=valid), \
+                patch('builtins.print'):
+            self.assertTrue(egg_menu.load_patient_data())
+        with patch.object(menu.ioutils, 'load_excel_file', return_value=invalid), \
+                patch('builtins.print') as printed:
+            self.assertTrue(egg_menu.load_patient_data())
+        self.assertIn('AGE', str(printed.call_args_list[1][0][0]))
+        self.assertIs(egg_menu.patient_data, valid)
+        self.assertEqual(len(egg_menu.store), 1)
+        self.assertTrue(egg_menu.cohort.has_patient(1))
+        self.assertFalse(egg_menu.cohort.has_patient(2))
+
+    def test_analyze_unknown_patient(self):
+        """ Test that an unknown patient is reported once, before asking for oocytes """
+        egg_menu = menu.Menu()
+        egg_menu.patient_data = pd.DataFrame({'NUMBER': [1], 'OOCYTE': [1], 'MEASURED': [1]})
+        egg_menu.cohort = menu.CohortIndex(egg_menu.patient_data)
+        for action in (egg_menu.analyze_measurement, egg_menu.analyze_series):
+            with patch('builtins.input', side_effect=['2']) as entered, \
+                    patch('builtins.print') as printed:
+                self.assertTrue(action())
+            self.assertEqual(entered.call_count, 1)
+            messages = [call[0][0] for call in printed.call_args_list]
+            self.assertEqual(messages.count('This patient number does not exist!'), 1)
+
+    def test_analyze_series_repeated_oocyte(self):
+        """ Test that an oocyte entered twice is rejected before choosing the files """
+        egg_menu = menu.Menu()
+        egg_menu.patient_data = pd.DataFrame({'NUMBER': [1, 1], 'OOCYTE': [1, 2], 'MEASURED': [1, 1]})
+        egg_menu.cohort = menu.CohortIndex(egg_menu.patient_data)
+        with patch('builtins.input', side_effect=['1', '1, 2, 1']), \
+                patch('builtins.print') as printed, \
+                patch.object(menu.ioutils, 'choose_file') as choose_file:
+            self.assertTrue(egg_menu.analyze_series())
+        choose_file.assert_not_called()
+        self.assertIn('once', printed.call_args[0][0])
+
+    def test_train_classifier(self):
+        """ Test that oocytes without a known outcome are left out of the training """
+        import outcome_predictor
+        egg_menu = menu.Menu()
+        features = {key.value: [0.1, 0.2, 0.3, 0.4] for key in MeasurementStore.FEATURE_KEYS}
+        egg_menu.store.insert(dict(features, NUMBER=[1, 1, 2, 2], OOCYTE=[1, 2, 1, 2],
+                                   FERTILIZED=[1, 1, 1, 0], ANYBLAST=[1, None, 0, 1]))
+        with patch.object(outcome_predictor, 'OutcomePredictor') as predictor:
+            predictor.return_value._create_train_test_set.return_value = (None,) * 4
+            self.assertTrue(egg_menu.train_classifier())
+        X, y = predictor.return_value._create_train_test_set.call_args[0]
+        np.testing.assert_allclose(X['K0_ZP'], np.log([0.1, 0.3]))
+        self.assertEqual(y.tolist(), [1, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 
+import time
 import unittest
-import models
+from unittest.mock import patch
+import measurement as m
+import oocyte_models as models
 import numpy as np
 
 
@@ -56,7 +59,193 @@ class TestModels(unittest.TestCase):
         X = [self.model.time, F0, weights]
         result = self.model._objective_fun(self.params, X, asp_dep_temp)
         self.assertAlmostEqual(result, 80.8234, places=3)
-        
-        
+
+
+    def test_invalid_input_force_trace(self):
+        """ Test that errors are raised when input for force_trace is invalid """
+        with self.assertRaises(TypeError):
+            models.ModifiedZener(self.time, self.aspiration_depth, 1.0, [1.0] * 4)
+        with self.assertRaises(ValueError):
+            models.ModifiedZener(self.time, self.aspiration_depth, 1.0, np.ones(3))
+
+    def test_calculate_model_output_trace(self):
+        """ Test that a constant force trace gives the step response """
+        k0, k1, n1, tau = self.params
+        time = np.arange(35) / 70.0
+        force = np.repeat(self.model.applied_force, len(time))
+        result = self.model._calculate_model_output_trace(time, force, k0, k1, n1, tau)
+        result_correct = self.model._calculate_model_output([time, force], k0, k1, n1, tau)
+        np.testing.assert_allclose(result, result_correct, rtol=1e-10)
+
+    def test_fit_force_trace(self):
+        """ Test that the parameters are recovered for a time-varying force """
+        k0, k1, n1, tau = (0.0045, 0.103, 0.3447, 0.01)
+        time = np.arange(35) / 70.0
+        force = self.model.applied_force * (1 - np.exp(-time / 0.02))
+        aspiration_depth = self.model._calculate_model_output_trace(
+            time, force, k0, k1, n1, tau)
+        model = models.ModifiedZener(time, aspiration_depth,
+                                     self.model.applied_force, force)
+        params = model.fit(weighted=False, plot=False)
+        self.assertAlmostEqual(params['K0_ZP'] / k0, 1.0, places=3)
+        self.assertAlmostEqual(params['K1_ZP'] / k1, 1.0, places=3)
+        self.assertAlmostEqual(params['ETA1_ZP'] / n1, 1.0, places=3)
+        self.assertAlmostEqual(params['TAU_ZP'] / tau, 1.0, places=3)
+
+    def test_latin_hypercube(self):
+        """ Test that every interval of each parameter is sampled once """
+        ranges = [(1e-3, 10.0), (0.1, 1.0)]
+        points = models.Model._latin_hypercube(50, ranges, np.random.default_rng(0))
+        self.assertEqual(points.shape, (50, 2))
+        for i, (low, high) in enumerate(ranges):
+            strata = np.floor(np.log(points[:, i] / low) / np.log(high / low) * 50)
+            self.assertCountEqual(strata, range(50))
+
+    def test_fit_multi_start(self):
+        """ Test that a multi-start fit finds the parameters a single start misses """
+        k0, k1, n1, tau = (0.339, 0.558, 0.058, 0.084)
+        time = np.arange(25) / 50.0
+        aspiration_depth = self.model._calculate_model_output([time, 4e-6], k0, k1, n1, tau)
+        model = models.ModifiedZener(time, aspiration_depth, 4e-6)
+        params = model.fit(plot=False, starts=64, workers=2)
+        self.assertAlmostEqual(params['K0_ZP'] / k0, 1.0, places=3)
+        self.assertAlmostEqual(params['K1_ZP'] / k1, 1.0, places=3)
+        self.assertAlmostEqual(params['ETA1_ZP'] / n1, 1.0, places=3)
+        self.assertAlmostEqual(params['TAU_ZP'] / tau, 1.0, places=3)
+        with self.assertRaises(ValueError):
+            model.fit(plot=False, starts=0)
+
+    def test_fit_multi_start_time_budget(self):
+        """ Test that a multi-start fit stops at the time budget """
+        start = time.perf_counter()
+        params = self.model.fit(plot=False, starts=256, refine=64, time_budget=0.01)
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(len(params), 5)
+
+    def test_fit_bootstrap(self):
+        """ Test that the confidence intervals contain the fitted parameters """
+        k0, k1, n1, tau = (0.1, 0.2, 0.1, 0.05)
+        time = np.arange(35) / 70.0
+        noise = np.random.default_rng(0).normal(0, 3e-7, len(time))
+        aspiration_depth = self.model._calculate_model_output([time, 4e-6], k0, k1, n1, tau)
+        model = models.ModifiedZener(time, aspiration_depth + noise, 4e-6)
+        params = model.fit(weighted=False, plot=False, bootstrap=200, workers=2)
+        for key in m.ParameterKeys:
+            if '_ZP' in key.value:
+                self.assertIn(key.value, params)
+        for key, value in ((m.ParameterKeys.K0_ZP, k0), (m.ParameterKeys.K1_ZP, k1),
+                           (m.ParameterKeys.ETA1_ZP, n1), (m.ParameterKeys.TAU_ZP, tau)):
+            low = params[key.value + '_CI_LOW']
+            high = params[key.value + '_CI_HIGH']
+            self.assertLess(low, params[key.value])
+            self.assertGreater(high, params[key.value])
+            self.assertLess(high - low, 3 * value)
+        with self.assertRaises(ValueError):
+            model.fit(plot=False, bootstrap=100, confidence=95)
+
+    def test_fit_bootstrap_flat_curve(self):
+        """ Test the confidence intervals of a curve without aspiration """
+        time = np.arange(25) / 50.0
+        noise = np.random.default_rng(0).normal(0, 1e-7, len(time))
+        model = models.ModifiedZener(time, noise, 1e-8)
+        params = model.fit(plot=False, bootstrap=50)
+        self.assertLessEqual(params[m.ParameterKeys.K0_ZP.value], 0.0)
+        # The parameters of a flat curve are not determined
+        self.assertTrue(np.isnan(params[m.ParameterKeys.K1_ZP_CI_LOW.value]))
+        bounds = ((1e-3, 10.0), (1e-3, 10.0), (1e-3, 10.0), (1e-3, 1.0))
+        params = model.fit(plot=False, bootstrap=50, bounds=bounds)
+        for key in (m.ParameterKeys.K0_ZP, m.ParameterKeys.K1_ZP, m.ParameterKeys.TAU_ZP):
+            self.assertGreaterEqual(params[key.value + '_CI_LOW'], 1e-3 * (1 - 1e-9))
+            self.assertLessEqual(params[key.value + '_CI_HIGH'], 10.0 * (1 + 1e-9))
+
+
+class TestModelRegistry(unittest.TestCase):
+    """ Test the registered models and the model selection """
+    def setUp(self):
+        self.time = np.arange(35) / 70.0
+        self.force = 4e-6
+
+    def test_register(self):
+        """ Test that the models are registered and invalid models rejected """
+        self.assertEqual(set(models.Model.registry),
+                         {'MODIFIED_ZENER', 'KELVIN_VOIGT', 'STANDARD_LINEAR_SOLID', 'MAXWELL',
+                          'POWER_LAW'})
+        with self.assertRaises(TypeError):
+            models.Model.register(object)
+
+        class Incomplete(models.Model):
+            NAME = 'INCOMPLETE'
+            KEYS = (m.ParameterKeys.KV_K,)
+        with self.assertRaises(ValueError):
+            models.Model.register(Incomplete)
+
+        class NoCompliance(models.Model):
+            NAME = 'NO_COMPLIANCE'
+            KEYS = (m.ParameterKeys.KV_K,)
+            START = (0.1,)
+            START_RANGES = ((1e-3, 10.0),)
+        with self.assertRaises(TypeError):
+            models.Model.register(NoCompliance)
+        with self.assertRaises(TypeError):
+            NoCompliance(self.time, self.time, self.force)
+        self.assertNotIn('NO_COMPLIANCE', models.Model.registry)
+
+    def test_jacobian(self):
+        """ Test the Jacobians of the models against finite differences """
+        for name, model in models.Model.registry.items():
+            params = np.array([model.START])
+            evaluate = model._step_evaluator(self.time, self.force)
+            output, jacobian = evaluate(params)
+            self.assertEqual(jacobian.shape, (1, len(model.KEYS), len(self.time)))
+            for i in range(len(model.KEYS)):
+                step = np.array(params)
+                step[0, i] *= 1 + 1e-6
+                numeric = (evaluate(step)[0] - output) / (params[0, i] * 1e-6)
+                np.testing.assert_allclose(jacobian[:, i], numeric, rtol=1e-4,
+                                           atol=1e-4 * np.abs(jacobian).max(), err_msg=name)
+
+    def test_distinct_models(self):
+        """ Test that no two registered models fit each other's curves equally well """
+        weights = models.Model._weights(len(self.time))
+        costs = {}
+        for name, model in models.Model.registry.items():
+            curve = self.force * model._creep_compliance(self.time, *model.START)
+            scale = np.sum(weights * (curve * models.Model.RESIDUAL_SCALE) ** 2)
+            for other_name, other in models.Model.registry.items():
+                evaluate = other._step_evaluator(self.time, self.force)
+                params, cost = models.Model._multi_start(
+                    evaluate, curve, weights, other.START_RANGES, starts=16,
+                    params0=other.START)
+                costs[(name, other_name)] = cost / scale
+        for (name, other_name), cost in costs.items():
+            if name != other_name:
+                self.assertGreater(max(cost, costs[(other_name, name)]), 1e-6,
+                                   msg='{} and {}'.format(name, other_name))
+
+    def test_select_model(self):
+        """ Test that the model of the data is selected and the others are fitted """
+        params = (0.3, 5.0, 0.5)
+        aspiration_depth = self.force * models.PowerLaw._creep_compliance(self.time, *params)
+        for criterion in ('aic', 'bic'):
+            best, results = models.select_model(self.time, aspiration_depth, self.force,
+                                                criterion=criterion)
+            self.assertEqual(best, 'POWER_LAW')
+            self.assertEqual(set(results), set(models.Model.registry))
+            self.assertAlmostEqual(results[best]['params']['POWER_BETA'], 0.5, places=3)
+            self.assertLess(results[best]['aic'], results['KELVIN_VOIGT']['aic'])
+        fitted = models.PowerLaw._parameter_dict(*params)
+        with patch.object(models, '_fit_model', wraps=models._fit_model) as fit_model:
+            best, fitted_results = models.select_model(self.time, aspiration_depth, self.force,
+                                                       fitted={'POWER_LAW': fitted})
+        self.assertNotIn('POWER_LAW', [call[0][0] for call in fit_model.call_args_list])
+        self.assertEqual(fitted_results['POWER_LAW']['params'], fitted)
+        self.assertAlmostEqual(fitted_results['POWER_LAW']['cost'], 0.0)
+        self.assertEqual(best, 'POWER_LAW')
+        with self.assertRaises(ValueError):
+            models.select_model(self.time, aspiration_depth, self.force, criterion='r2')
+        with self.assertRaises(ValueError):
+            models.select_model(self.time, aspiration_depth, self.force, models=['BURGERS'])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 
+import numpy as np
 import properties as prop
 import unittest
+from synthetic_measurement import SyntheticMeasurement
 
 
 class TestProperty(unittest.TestCase):
@@ -49,5 +51,36 @@ class TestProperty(unittest.TestCase):
                 6.25)
 
 
+    def test_interface_index(self):
+        """
+        Test that the oolemma is found between two levels of a profile
+        """
+        profile = np.concatenate([np.zeros(5), np.full(12, 40.0), np.full(10, 70.0),
+                                  np.zeros(20)])
+        self.assertEqual(prop.AspirationDepth._interface_index(profile, 5, 27), 17)
+        self.assertEqual(prop.AspirationDepth._interface_index(profile, 5, 7), 5)
+
+    def test_track_oolemma(self):
+        """
+        Test that zona and oolemma are tracked in one pass
+        """
+        measurement = SyntheticMeasurement(oolemma_params=(0.3, 0.4, 0.2, 0.05))
+        x, y = measurement.crop_center
+        video_frames = [frame[y-100:y+100, x-100:x+100]
+                        for frame in measurement.frames()[measurement.valve_frame:]]
+        time = np.arange(25) / measurement.frame_rate
+        aspiration_depth = prop.AspirationDepth(video_frames, 4.0, measurement.zona_thickness,
+                                                measurement.conversion_factor, time)
+        aspiration_depth.offset = measurement.offset
+        aspiration_depth.roi_center = measurement.roi_center
+        offset, depth_pixel, depth = aspiration_depth.track()
+        start = measurement.valve_frame + 1
+        np.testing.assert_allclose(depth[:25], measurement.aspiration_depth()[start:start + 25],
+                                   atol=1e-6)
+        np.testing.assert_allclose(aspiration_depth.aspiration_depth_oolemma_mechanical[:25],
+                                   measurement.oolemma_depth()[start:start + 25], atol=1e-6)
+        self.assertEqual(len(aspiration_depth.aspiration_depth_oolemma_pixel), len(depth_pixel))
+
+
 if __name__ == '__main__':
     unittest.main()
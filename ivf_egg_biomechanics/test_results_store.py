@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import measurement as m
+from results_store import ResultsStore
+
+
+class TestResultsStore(unittest.TestCase):
+    """ Test the ResultsStore class """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.results = ResultsStore(self.directory, compact_every=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _measurement(self, oocyte_number, k0):
+        meas = m.Measurement({'NUMBER': 7, 'OOCYTE': oocyte_number, 'CLINIC': 'STANFORD'})
+        meas.set_model_parameter(m.ParameterKeys.K0_ZP, np.float64(k0))
+        meas.set_property(m.PropertyKeys.TIME, [np.arange(3.0)])
+        return meas
+
+    def test_record_and_load(self):
+        """ Test that records are appended and replayed in order """
+        self.results.record(self._measurement(1, 0.1))
+        self.results.record(self._measurement(2, 0.2))
+        self.results.record(self._measurement(1, 0.3))
+        store = ResultsStore(self.directory).load()
+        self.assertEqual(len(store), 2)
+        np.testing.assert_allclose(store.column('K0_ZP'), [0.3, 0.2])
+        self.assertFalse(store.mask('TIME').any())
+        self.assertEqual(store.column('CLINIC')[0], 'STANFORD')
+
+    def test_compact(self):
+        """ Test that the log is compacted into the snapshot """
+        for oocyte_number in range(1, 5):
+            self.results.record(self._measurement(oocyte_number, 0.1 * oocyte_number))
+        self.assertTrue(os.path.isfile(self.results.snapshot_path))
+        with open(self.results.log_path) as log:
+            self.assertEqual(len(log.readlines()), 1)
+        store = self.results.load()
+        np.testing.assert_allclose(store.column('K0_ZP'), [0.1, 0.2, 0.3, 0.4])
+        np.testing.assert_array_equal(store.column('OOCYTE'), [1, 2, 3, 4])
+        self.assertFalse(store.mask('AGE').any())
+
+    def test_export_excel(self):
+        """ Test that the results are written into an excel file """
+        self.results.record(self._measurement(1, 0.1))
+        filename = os.path.join(self.directory, 'results.xlsx')
+        self.results.export_excel(filename)
+        data = pd.read_excel(filename, engine='openpyxl')
+        self.assertEqual(data['K0_ZP'].tolist(), [0.1])
+        with self.assertRaises(ValueError):
+            ResultsStore(self.directory, compact_every=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
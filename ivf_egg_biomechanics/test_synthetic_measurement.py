@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from synthetic_measurement import SyntheticMeasurement
+from utils import ioutils
+
+
+class TestSyntheticMeasurement(unittest.TestCase):
+    """ Test the generator of synthetic measurements """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_init(self):
+        """ Test that invalid settings are rejected """
+        with self.assertRaises(ValueError):
+            SyntheticMeasurement(params=(0.1, 0.2, 0.1))
+        with self.assertRaises(ValueError):
+            SyntheticMeasurement(oolemma_params=(0.1, 0.2))
+        with self.assertRaises(ValueError):
+            SyntheticMeasurement(rotation=45)
+        with self.assertRaises(ValueError):
+            SyntheticMeasurement(valve_time=2.0, duration=1.0)
+
+    def test_aspiration_depth(self):
+        """ Test that the zona only moves after the valve opened """
+        measurement = SyntheticMeasurement()
+        depth = measurement.aspiration_depth()
+        self.assertEqual(len(depth), 50)
+        np.testing.assert_array_equal(depth[:measurement.valve_frame + 1], 0.0)
+        k0, k1, eta1, tau = measurement.params
+        self.assertAlmostEqual(depth[measurement.valve_frame + 1],
+                               measurement.force / (k0 + k1))
+        self.assertTrue(np.all(np.diff(depth) >= 0))
+
+    def test_oolemma_depth(self):
+        """ Test that the oolemma follows the zona but does not pass it """
+        np.testing.assert_array_equal(SyntheticMeasurement().oolemma_depth(), 0.0)
+        measurement = SyntheticMeasurement(oolemma_params=(0.3, 0.4, 0.2, 0.05))
+        depth = measurement.oolemma_depth()
+        self.assertAlmostEqual(depth[measurement.valve_frame + 1], measurement.force / 0.7)
+        self.assertTrue(np.all(depth <= measurement.aspiration_depth()))
+        self.assertTrue(np.all(SyntheticMeasurement(oolemma_params=measurement.params)
+                               .oolemma_depth() == measurement.aspiration_depth()))
+
+    def test_write(self):
+        """ Test that decoding and parsing restore the frames and the pressure """
+        for rotation in (0, 90, 180, 270):
+            measurement = SyntheticMeasurement(duration=0.3, valve_time=0.1, rotation=rotation)
+            video_path, pressure_path = measurement.write(self.directory, str(rotation))
+            decoded, frame_rate = ioutils.decode_video_file(video_path, rotation)
+            self.assertEqual(frame_rate, 50.0)
+            for frame, expected in zip(decoded, measurement.frames()):
+                np.testing.assert_array_equal(frame, expected)
+            trace, pressure = ioutils.read_pressure_trace(pressure_path, None)
+            self.assertAlmostEqual(pressure, 0.3, places=2)
+            self.assertAlmostEqual(float(trace[0, 0]), 0.01, places=4)
+
+    def test_analyze(self):
+        """ Test that tracking and fitting recover the parameters """
+        measurement = SyntheticMeasurement(rotation=90)
+        params, depth = measurement.analyze(*measurement.write(self.directory))
+        expected = measurement.aspiration_depth()[measurement.valve_frame + 1:][:len(depth)]
+        self.assertLess(np.max(np.abs(depth - expected)), 1e-6)
+        self.assertAlmostEqual(params['K1_ZP'], 0.2, delta=0.02)
+        self.assertAlmostEqual(params['ETA1_ZP'], 0.1, delta=0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
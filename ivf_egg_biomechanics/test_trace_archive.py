@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import measurement as m
+import trace_archive
+from trace_archive import TraceArchive, TraceRef
+
+
+class TestTraceArchive(unittest.TestCase):
+    """ Test the TraceArchive class """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'traces.bin')
+        self.archive = TraceArchive(self.path)
+        self.time = np.linspace(0, 1, 7)
+        self.depth = np.arange(4.0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_append_and_get(self):
+        """ Test that traces are read back as views of the file """
+        references = self.archive.append({(1, 2, m.PropertyKeys.TIME): self.time,
+                                          (1, 2, 'ASPIRATION_DEPTH_ZONA_MECH'): self.depth})
+        self.assertEqual(set(references), {(1, 2, 'TIME'), (1, 2, 'ASPIRATION_DEPTH_ZONA_MECH')})
+        time = self.archive.get(1, 2, m.PropertyKeys.TIME)
+        self.assertEqual(time.dtype, np.float32)
+        self.assertIsInstance(time.base, np.memmap)
+        np.testing.assert_allclose(time, self.time, rtol=1e-6)
+        np.testing.assert_array_equal(references[(1, 2, 'ASPIRATION_DEPTH_ZONA_MECH')].load(),
+                                      self.depth)
+        with self.assertRaises(KeyError):
+            self.archive.get(1, 3, 'TIME')
+        with self.assertRaises(ValueError):
+            self.archive.append({(1, 3, 'TIME'): np.zeros((2, 2))})
+
+    def test_reopen_and_compact(self):
+        """ Test that replaced traces are kept until the archive is compacted """
+        self.archive.append({(1, 2, 'TIME'): self.time, (3, 1, 'TIME'): self.depth})
+        self.archive.append({(1, 2, 'TIME'): self.time[:3]})
+        size = os.path.getsize(self.path)
+        archive = TraceArchive(self.path)
+        self.assertEqual(sorted(archive.keys()), [(1, 2, 'TIME', 1), (3, 1, 'TIME', 1)])
+        np.testing.assert_allclose(archive.get(1, 2, 'TIME'), self.time[:3], rtol=1e-6)
+        archive.compact()
+        self.assertLess(os.path.getsize(self.path), size)
+        np.testing.assert_array_equal(TraceArchive(self.path).get(3, 1, 'TIME'), self.depth)
+        np.testing.assert_allclose(archive.get(1, 2, 'TIME'), self.time[:3], rtol=1e-6)
+
+    def test_many_appends(self):
+        """ Test that the file grows with the traces, not with the number of appends """
+        for i in range(200):
+            self.archive.append({(i, 1, 'TIME'): self.time, (i, 1, 'DEPTH'): self.depth})
+        used = 200 * (trace_archive._entry_size(len(self.time))
+                      + trace_archive._entry_size(len(self.depth)) + trace_archive._BLOCK.size)
+        self.assertEqual(os.path.getsize(self.path), trace_archive._HEADER_SIZE + used)
+        for i in range(200):
+            self.archive.append({(0, 1, 'TIME'): self.time * i})
+        # Replaced traces are freed once they are half of the file
+        self.assertLess(os.path.getsize(self.path), 2 * (trace_archive._HEADER_SIZE + used))
+        archive = TraceArchive(self.path)
+        self.assertEqual(len(archive), 400)
+        np.testing.assert_allclose(archive.get(0, 1, 'TIME'), self.time * 199, rtol=1e-6)
+        np.testing.assert_array_equal(archive.get(199, 1, 'DEPTH'), self.depth)
+
+    def test_two_instances(self):
+        """ Test that an instance reads the index again after another one appended """
+        other = TraceArchive(self.path)
+        self.archive.append({(1, 2, 'TIME'): self.time})
+        other.append({(3, 1, 'TIME'): self.depth})
+        self.archive.append({(5, 1, 'TIME'): self.depth})
+        archive = TraceArchive(self.path)
+        self.assertEqual(sorted(archive.keys()),
+                         [(1, 2, 'TIME', 1), (3, 1, 'TIME', 1), (5, 1, 'TIME', 1)])
+        np.testing.assert_array_equal(archive.get(3, 1, 'TIME'), self.depth)
+
+    def test_aspirations(self):
+        """ Test that the traces of each aspiration of an oocyte are kept """
+        references = self.archive.append({(1, 2, 'TIME', 1): self.time,
+                                          (1, 2, 'TIME', 2): self.depth})
+        self.assertEqual(str(references[(1, 2, 'TIME', 2)]), 'trace:1/2/TIME/2')
+        np.testing.assert_allclose(self.archive.get(1, 2, 'TIME'), self.time, rtol=1e-6)
+        np.testing.assert_array_equal(TraceArchive(self.path).get(1, 2, 'TIME', 2), self.depth)
+
+    def test_read_version_1(self):
+        """ Test that the traces of an archive without aspiration numbers are read """
+        entries = np.array([(1, 2, b'TIME', trace_archive._HEADER_SIZE, len(self.depth))],
+                           dtype=trace_archive._INDEX_DTYPES[1])
+        values = self.depth.astype(np.float32).tobytes()
+        with open(self.path, 'wb') as archive:
+            archive.write(trace_archive._HEADER.pack(
+                trace_archive._MAGIC, 1, 1, trace_archive._HEADER_SIZE + len(values))
+                .ljust(trace_archive._HEADER_SIZE, b'\0'))
+            archive.write(values + entries.tobytes())
+        archive = TraceArchive(self.path)
+        self.assertEqual(archive.keys(), [(1, 2, 'TIME', 1)])
+        np.testing.assert_array_equal(archive.get(1, 2, 'TIME'), self.depth)
+        archive.append({(1, 2, 'TIME', 2): self.time})
+        np.testing.assert_array_equal(TraceArchive(self.path).get(1, 2, 'TIME'), self.depth)
+
+    def test_references(self):
+        """ Test the references in measurements and their text """
+        reference = self.archive.append({(5, 6, 'TIME'): self.time})[(5, 6, 'TIME')]
+        self.assertEqual(str(reference), 'trace:5/6/TIME/1')
+        self.assertEqual(self.archive.ref(str(reference)), reference)
+        self.assertEqual(self.archive.ref('trace:5/6/TIME'), reference)
+        self.assertIs(trace_archive.open_archive(self.path), trace_archive.open_archive(self.path))
+        meas = m.Measurement({})
+        meas.set_property(m.PropertyKeys.TIME, reference)
+        self.assertIsInstance(meas.data['TIME'], TraceRef)
+        np.testing.assert_allclose(meas.get_property(m.PropertyKeys.TIME)[0], self.time,
+                                   rtol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
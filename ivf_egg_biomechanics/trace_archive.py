@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+
+import os
+import struct
+import threading
+import numpy as np
+
+TRACE_ARCHIVE = os.path.join(os.path.expanduser('~'), '.ivf_egg_biomechanics', 'traces.bin')
+_MAGIC = b'IVFTRACE'
+# Since version 3: magic, version, number of index blocks, offset of the last
+# block; before: magic, version, number of entries, offset of the index
+_HEADER = struct.Struct('<8sIQQ')
+_HEADER_SIZE = 64
+_BLOCK = struct.Struct('<QQ')           # number of entries, offset of the previous block
+_VERSION = 3
+_INDEX_DTYPE = np.dtype([('patient', '<i8'), ('oocyte', '<i8'), ('aspiration', '<i8'),
+                         ('trace', 'S32'), ('offset', '<i8'), ('length', '<i8')])
+# Version 1 had no aspiration numbers, all its traces are of the first aspiration
+_INDEX_DTYPES = {1: np.dtype([('patient', '<i8'), ('oocyte', '<i8'), ('trace', 'S32'),
+                              ('offset', '<i8'), ('length', '<i8')]),
+                 2: _INDEX_DTYPE, 3: _INDEX_DTYPE}
+_VALUE_DTYPE = np.dtype('<f4')
+_PREFIX = 'trace:'
+_ARCHIVES = {}
+_ARCHIVES_LOCK = threading.Lock()
+
+
+class TraceRef(object):
+    """ A lazy reference to a trace in a TraceArchive """
+    __slots__ = ('archive', 'key')
+
+    def __init__(self, archive, key):
+        """
+        Initialize a reference.
+
+        Args:
+            archive (TraceArchive): the archive of the trace
+            key (tuple):            (patient number, oocyte number, trace name,
+                                    aspiration number)
+        """
+        self.archive = archive
+        self.key = key
+
+    def load(self):
+        """ Read the trace (see TraceArchive.get) """
+        return self.archive.get(*self.key)
+
+    def __str__(self):
+        return _PREFIX + '{}/{}/{}/{}'.format(*self.key)
+
+    def __repr__(self):
+        return 'TraceRef({!r})'.format(str(self))
+
+    def __eq__(self, other):
+        return isinstance(other, TraceRef) and other.key == self.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+
+class TraceArchive(object):
+    """
+    An archive of time series of different lengths (e.g. time points and
+    aspiration depths) keyed by (patient number, oocyte number, trace name,
+    aspiration number). An oocyte can be aspirated several times in one
+    video, so each aspiration has its own traces.
+
+    All traces are stored as float32 values one after the other in a single
+    file. Each append writes the new traces and a block of index entries
+    with the offset and length of each new trace after the end of the file;
+    the header points to the last block and every block to the previous
+    one. The header is updated last, so a failed write never damages the
+    archive. The file is memory-mapped, so a trace is returned as a view of
+    the file without reading or copying it. The index is kept in memory and
+    only read again if another instance changed the header. The space of
+    replaced traces is freed by compact, which append calls once it is more
+    than COMPACT_FRACTION of the file.
+    """
+    COMPACT_FRACTION = 0.5  # fraction of unused bytes at which append compacts the file
+
+    def __init__(self, path=TRACE_ARCHIVE):
+        """
+        Open an archive, which is created when the first trace is added.
+
+        Args:
+            path (str): path of the archive file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._index = {}
+        self._map = None
+        self._end = _HEADER_SIZE
+        self._header = None     # (version, blocks, last block) of the index in memory
+        self._used = 0          # bytes of the file used by the traces and their entries
+        if os.path.isfile(path):
+            self._read_index()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def keys(self):
+        """ The keys (patient number, oocyte number, trace name, aspiration number) """
+        return list(self._index)
+
+    def _read_header(self):
+        with open(self.path, 'rb') as archive:
+            magic, version, count, index_offset = _HEADER.unpack(archive.read(_HEADER.size))
+        if magic != _MAGIC or version not in _INDEX_DTYPES:
+            raise ValueError('{} is not a trace archive of version {}.'.format(
+                self.path, _VERSION))
+        return version, count, index_offset
+
+    def _read_index(self):
+        version, count, index_offset = self._read_header()
+        blocks = []
+        with open(self.path, 'rb') as archive:
+            if version < 3:
+                # A single index of count entries
+                archive.seek(index_offset)
+                blocks.append(np.fromfile(archive, dtype=_INDEX_DTYPES[version], count=count))
+                end = index_offset + blocks[0].nbytes
+            else:
+                offset = index_offset
+                for i in range(count):
+                    archive.seek(offset)
+                    num_entries, offset = _BLOCK.unpack(archive.read(_BLOCK.size))
+                    blocks.append(np.fromfile(archive, dtype=_INDEX_DTYPE, count=num_entries))
+                end = index_offset + _BLOCK.size + blocks[0].nbytes if count else _HEADER_SIZE
+        index = {}
+        for entries in reversed(blocks):    # the entries of later blocks replace earlier ones
+            aspirations = (entries['aspiration'] if version > 1
+                           else np.ones(len(entries), dtype=np.int64))
+            for entry, aspiration in zip(entries, aspirations):
+                index[(int(entry['patient']), int(entry['oocyte']), entry['trace'].decode(),
+                       int(aspiration))] = (int(entry['offset']), int(entry['length']))
+        self._index = index
+        self._used = sum(_entry_size(length) for offset, length in index.values())
+        self._end = end
+        self._header = (version, count, index_offset)
+        self._map = None
+
+    def _memory_map(self):
+        if self._map is None:
+            self._map = np.memmap(self.path, dtype=np.uint8, mode='r')
+        return self._map
+
+    @staticmethod
+    def _key(patient_number, oocyte_number, trace, aspiration_number=1):
+        trace = getattr(trace, 'value', trace)
+        if not isinstance(trace, str) or len(trace.encode()) > _INDEX_DTYPE['trace'].itemsize:
+            raise ValueError('Expected a trace name of at most {} characters, '
+                             'but got {} instead.'.format(_INDEX_DTYPE['trace'].itemsize, trace))
+        return int(patient_number), int(oocyte_number), trace, int(aspiration_number)
+
+    def get(self, patient_number, oocyte_number, trace, aspiration_number=1):
+        """
+        Get a trace as a read-only view of the archive.
+
+        Args:
+            patient_number (int):   patient number
+            oocyte_number (int):    oocyte number
+            trace (str or Enum):    name of the trace (e.g. PropertyKeys.TIME)
+            aspiration_number (int): number of the aspiration of the oocyte
+        Returns:
+            values (array):         the values of the trace (float32)
+        """
+        key = self._key(patient_number, oocyte_number, trace, aspiration_number)
+        with self._lock:
+            if key not in self._index:
+                raise KeyError('Trace {} is not in the archive {}.'.format(key, self.path))
+            offset, length = self._index[key]
+            memory_map = self._memory_map()
+        return memory_map[offset:offset + length * _VALUE_DTYPE.itemsize].view(_VALUE_DTYPE)
+
+    def append(self, traces):
+        """
+        Add traces to the archive, replacing traces with the same key.
+
+        Args:
+            traces (dict):      1-D array of values for each key
+                                (patient number, oocyte number, trace name) or
+                                (..., aspiration number), the first aspiration
+                                if it is not given
+        Returns:
+            references (dict):  TraceRef of each key, with as many parts as given
+        """
+        keys = {key: self._key(*key) for key in traces}
+        traces = {keys[key]: np.ascontiguousarray(values, dtype=_VALUE_DTYPE)
+                  for key, values in traces.items()}
+        for key, values in traces.items():
+            if values.ndim != 1:
+                raise ValueError('Expected a 1-D trace for {}, but got shape {} instead.'.format(
+                    key, values.shape))
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            exists = os.path.isfile(self.path)
+            if exists and self._read_header() != self._header:
+                self._read_index()      # the file was changed by another instance
+            if exists and self._header[0] < _VERSION:
+                self._compact()         # rewrite an archive of an older version
+            blocks, previous = (self._header[1], self._header[2]) if exists else (0, 0)
+            entries = {}
+            with open(self.path, 'r+b' if exists else 'w+b') as archive:
+                archive.seek(self._end)
+                offset = self._end
+                for key, values in traces.items():
+                    archive.write(values.tobytes())
+                    entries[key] = (offset, len(values))
+                    offset += values.nbytes
+                self._write_block(archive, entries, offset, blocks + 1, previous)
+            for key, (offset, length) in entries.items():
+                if key in self._index:
+                    self._used -= _entry_size(self._index[key][1])
+                self._index[key] = (offset, length)
+                self._used += _entry_size(length)
+            if self._end - _HEADER_SIZE - self._used > \
+                    self.COMPACT_FRACTION * (self._end - _HEADER_SIZE):
+                self._compact()
+        return {archive_key[:len(key)]: TraceRef(self, archive_key)
+                for key, archive_key in keys.items()}
+
+    def _write_block(self, archive, index, block_offset, blocks, previous):
+        """ Write a block of index entries and point the header to it """
+        entries = np.empty(len(index), dtype=_INDEX_DTYPE)
+        for i, (key, (offset, length)) in enumerate(index.items()):
+            entries[i] = (key[0], key[1], key[3], key[2].encode(), offset, length)
+        archive.seek(block_offset)
+        archive.write(_BLOCK.pack(len(entries), previous))
+        archive.write(entries.tobytes())
+        archive.flush()
+        os.fsync(archive.fileno())
+        archive.seek(0)
+        archive.write(_HEADER.pack(_MAGIC, _VERSION, blocks, block_offset)
+                      .ljust(_HEADER_SIZE, b'\0'))
+        archive.flush()
+        self._end = block_offset + _BLOCK.size + entries.nbytes
+        self._header = (_VERSION, blocks, block_offset)
+        self._map = None
+
+    def compact(self):
+        """ Rewrite the archive without the space of replaced traces and old blocks """
+        with self._lock:
+            if os.path.isfile(self.path) and self._read_header() != self._header:
+                self._read_index()
+            self._compact()
+
+    def _compact(self):
+        if not self._index:
+            return
+        memory_map = self._memory_map()
+        temp_path = self.path + '.compact'
+        index = {}
+        with open(temp_path, 'w+b') as archive:
+            archive.write(b'\0' * _HEADER_SIZE)
+            offset = _HEADER_SIZE
+            for key, (old_offset, length) in self._index.items():
+                archive.write(memory_map[old_offset:old_offset + length * _VALUE_DTYPE.itemsize])
+                index[key] = (offset, length)
+                offset += length * _VALUE_DTYPE.itemsize
+            self._write_block(archive, index, offset, 1, 0)
+        self._map = None
+        del memory_map
+        os.replace(temp_path, self.path)
+        self._index = index
+
+    def ref(self, text):
+        """
+        Create the reference from its text (e.g. from a spreadsheet cell).
+
+        Args:
+            text (str):         the reference as
+                                'trace:<patient>/<oocyte>/<name>/<aspiration>', or
+                                without the aspiration for the first one
+        Returns:
+            reference (TraceRef): the reference
+        """
+        if not isinstance(text, str) or not text.startswith(_PREFIX):
+            raise ValueError('Expected a text starting with {}, but got {} instead.'.format(
+                _PREFIX, text))
+        parts = text[len(_PREFIX):].split('/')
+        if len(parts) not in (3, 4):
+            raise ValueError('Expected a text with 3 or 4 parts, but got {} instead.'.format(text))
+        return TraceRef(self, self._key(*parts))
+
+
+def _entry_size(length):
+    """ Bytes of a trace of a length and its index entry """
+    return length * _VALUE_DTYPE.itemsize + _INDEX_DTYPE.itemsize
+
+
+def open_archive(path=TRACE_ARCHIVE):
+    """
+    Get the archive of a file. All threads share one instance per file, so
+    their writes do not overlap.
+
+    Args:
+        path (str):     path of the archive file
+    Returns:
+        archive (TraceArchive): the archive
+    """
+    path = os.path.abspath(path)
+    with _ARCHIVES_LOCK:
+        if path not in _ARCHIVES:
+            _ARCHIVES[path] = TraceArchive(path)
+        return _ARCHIVES[path]
+
+
+if __name__ == '__main__':
+    import tempfile
+    archive = TraceArchive(os.path.join(tempfile.mkdtemp(), 'traces.bin'))
+    references = archive.append({(1, 2, 'TIME'): np.linspace(0, 1, 5)})
+    print(references, archive.get(1, 2, 'TIME'))
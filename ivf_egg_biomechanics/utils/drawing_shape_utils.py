@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import threading
 import cv2
 from enum import Enum
 import numpy as np
@@ -13,31 +14,83 @@ class Shape(Enum):
     offset = 5
 
 
-class DrawingShapeUtils(object):
+class AnnotationCancelled(Exception):
+    """ Raised when the user cancels the annotation of an image with escape """
+
+
+class AnnotationSession(object):
+    """
+    An interactive annotation of a single image.
+
+    Every session keeps its own copy of the displayed image, the selected
+    points and the state of the mouse button, so several sessions can exist
+    at the same time. The event loop wakes up every KEY_WAIT ms to check for
+    a key press, but the image is only shown again when a mouse event
+    changed it, so waiting for the next click costs little CPU.
+    """
     LINE_THICKNESS = 3
     COLOR = (155, 155, 155)
-    
-    @staticmethod
-    def _select_draw_function(shape):
+    KEY_WAIT = 30   # time [ms] to wait for a key press in each pass of the event loop
+
+    def __init__(self, pic, scale, prompt, shape, params):
+        """
+        Initialize an annotation session.
+
+        pic:        (array)     A grayscale image
+        scale:      (float)     Scaling factor to enlarge image
+        prompt:     (str)       Message to display with image
+        shape:      (enum)      Desired shape
+        params:     (list)      Additional parameters for drawing function
+        """
+        self.source_img = cv2.resize(pic, (0, 0), fx=scale, fy=scale)
+        self.img = self.source_img.copy()
+        self.prompt = prompt
+        self.params = params
+        self.state = False
+        self.p1 = None
+        self.p2 = None
+        self._draw_function = self._select_draw_function(shape)
+        self._lock = threading.Lock()
+        self._dirty = True
+
+    def _select_draw_function(self, shape):
         """
         Selects the right function to draw the desired shape.
         
         shape   (enum)  The desired shape
         """
         shapes = {
-            Shape.arrow: DrawingShapeUtils._draw_arrow,
-            Shape.line: DrawingShapeUtils._draw_line,
-            Shape.zona: DrawingShapeUtils._draw_zona_position,
-            Shape.rectangle: DrawingShapeUtils._draw_rectangle,
-            Shape.offset: DrawingShapeUtils._draw_rectangle_with_offset}
+            Shape.arrow: self._draw_arrow,
+            Shape.line: self._draw_line,
+            Shape.zona: self._draw_zona_position,
+            Shape.rectangle: self._draw_rectangle,
+            Shape.offset: self._draw_rectangle_with_offset}
         draw_function = shapes.get(shape)
         if draw_function:
             return draw_function
         else:
             raise ValueError('Selected shape ({}) is not available'.format(shape))
-    
-    @staticmethod
-    def _draw_arrow(event, x, y, flags, params):
+
+    def on_mouse(self, event, x, y, flags, params):
+        """
+        Mouse callback registered with OpenCV. Forwards the event to the
+        drawing function of the selected shape.
+
+        event:      A mouse click event
+        x:          x position of cursor
+        y:          y position of cursor
+        flags:      N/A
+        params:     Additional parameters for drawing function
+        """
+        with self._lock:
+            self._draw_function(event, x, y, flags, params)
+
+    def _redraw(self):
+        """ Start a new overlay on a clean copy of the source image """
+        self.img = self.source_img.copy()
+        self._dirty = True
+
+    def _draw_arrow(self, event, x, y, flags, params):
         """
         Draw an arrow from the position where left mouse button is clicked to
         where left mouse button is released.
@@ -48,30 +101,27 @@ class DrawingShapeUtils(object):
         flags:      N/A
         params:     N/A
         """
-        global img, source_img, state
-        global p1, p2
         if event == cv2.EVENT_LBUTTONDOWN:
-            state = True
-            p1 = (x, y)
-            img = source_img.copy()
+            self.state = True
+            self.p1 = (x, y)
+            self._redraw()
         elif event == cv2.EVENT_LBUTTONUP:
-            state = False
-            p2 = (x, y)
-            img = source_img.copy()
-            cv2.arrowedLine(img, p1, p2, DrawingShapeUtils.COLOR, 
-                            DrawingShapeUtils.LINE_THICKNESS)
-            cv2.arrowedLine(img, p2, p1, DrawingShapeUtils.COLOR, 
-                            DrawingShapeUtils.LINE_THICKNESS)
+            self.state = False
+            self.p2 = (x, y)
+            self._redraw()
+            cv2.arrowedLine(self.img, self.p1, self.p2, self.COLOR,
+                            self.LINE_THICKNESS)
+            cv2.arrowedLine(self.img, self.p2, self.p1, self.COLOR,
+                            self.LINE_THICKNESS)
         elif event == cv2.EVENT_MOUSEMOVE:
-            if state:
-                img = source_img.copy()
-                cv2.arrowedLine(img, p1, (x, y), DrawingShapeUtils.COLOR,
-                                DrawingShapeUtils.LINE_THICKNESS)
-                cv2.arrowedLine(img, (x, y), p1, DrawingShapeUtils.COLOR,
-                                DrawingShapeUtils.LINE_THICKNESS)
-        
-    @staticmethod        
-    def _draw_line(event, x, y, flags, params):
+            if self.state:
+                self._redraw()
+                cv2.arrowedLine(self.img, self.p1, (x, y), self.COLOR,
+                                self.LINE_THICKNESS)
+                cv2.arrowedLine(self.img, (x, y), self.p1, self.COLOR,
+                                self.LINE_THICKNESS)
+
+    def _draw_line(self, event, x, y, flags, params):
         """
         Draw a line at the position where the left mouse button is released.
                 
@@ -81,23 +131,20 @@ class DrawingShapeUtils(object):
         flags:      N/A
         params:     N/A
         """
-        global img, source_img
-        global p1, p2
         if event == cv2.EVENT_LBUTTONDOWN:
-            img = source_img.copy()
-            p1 = (x, y)
+            self.p1 = (x, y)
+            self._redraw()
         elif event == cv2.EVENT_LBUTTONUP:
-            p2 = (x, y)
-            img = source_img.copy()
-            text = 'position: %d' % p2[0]
-            cv2.putText(img, text, (100, 100),
-                        cv2.FONT_HERSHEY_SIMPLEX, 3, DrawingShapeUtils.COLOR, 
-                        DrawingShapeUtils.LINE_THICKNESS)
-            cv2.line(img, (x, y+100), (x, y-100), DrawingShapeUtils.COLOR,
-                     DrawingShapeUtils.LINE_THICKNESS)
-    
-    @staticmethod
-    def _draw_zona_position(event, x, y, flags, params):
+            self.p2 = (x, y)
+            self._redraw()
+            text = 'position: %d' % self.p2[0]
+            cv2.putText(self.img, text, (100, 100),
+                        cv2.FONT_HERSHEY_SIMPLEX, 3, self.COLOR,
+                        self.LINE_THICKNESS)
+            cv2.line(self.img, (x, y+100), (x, y-100), self.COLOR,
+                     self.LINE_THICKNESS)
+
+    def _draw_zona_position(self, event, x, y, flags, params):
         """
         Draw a vertical line at mouse position and a horizontal line 
         with the length of the zona thickness
@@ -108,26 +155,23 @@ class DrawingShapeUtils(object):
         flags:      N/A
         params:     zona thickness
         """
-        global img, source_img
-        global p1, p2
         zp_thickness = params[0]
         if event == cv2.EVENT_LBUTTONDOWN:
-            img = source_img.copy()
-            p1 = (x, y)
+            self.p1 = (x, y)
+            self._redraw()
         elif event == cv2.EVENT_LBUTTONUP:
-            p2 = (x, y)
-            img = source_img.copy()
-            text = 'position: %d' % p2[0]
-            cv2.putText(img, text, (100,100), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 3, DrawingShapeUtils.COLOR, 
-                        DrawingShapeUtils.LINE_THICKNESS)
-            cv2.line(img, (x, y+100), (x, y-100), DrawingShapeUtils.COLOR,
-                     DrawingShapeUtils.LINE_THICKNESS)
-            cv2.line(img, (x, y), (x+zp_thickness, y), DrawingShapeUtils.COLOR,
-                     DrawingShapeUtils.LINE_THICKNESS)
-    
-    @staticmethod
-    def _draw_rectangle(event, x, y, flags, params):
+            self.p2 = (x, y)
+            self._redraw()
+            text = 'position: %d' % self.p2[0]
+            cv2.putText(self.img, text, (100,100),
+                        cv2.FONT_HERSHEY_SIMPLEX, 3, self.COLOR,
+                        self.LINE_THICKNESS)
+            cv2.line(self.img, (x, y+100), (x, y-100), self.COLOR,
+                     self.LINE_THICKNESS)
+            cv2.line(self.img, (x, y), (x+zp_thickness, y), self.COLOR,
+                     self.LINE_THICKNESS)
+
+    def _draw_rectangle(self, event, x, y, flags, params):
         """
         Draw a rectangle on a mouse click event.
         
@@ -138,41 +182,22 @@ class DrawingShapeUtils(object):
         y:          y position of cursor
         flags:      N/A
         params:     desired width and height of the rectangle
-        
-        RETURN
-        ---------------------------------------------------------------
-        p1:         Coordinates of where left mouse button was clicked
-        p2:         Coordinates of where left mouse button was released
         """
-        global img, source_img, state
-        global p1, p2
         width, height = params
         if event == cv2.EVENT_LBUTTONDOWN:
-            state = True
-            img = source_img.copy()
-            cv2.rectangle(img, (int(x-width/2), int(y-height/2)),
-                          (int(x+width/2), int(y+height/2)),
-                          DrawingShapeUtils.COLOR, 
-                          DrawingShapeUtils.LINE_THICKNESS)
-            p1 = (x, y)
+            self.state = True
+            self.p1 = (x, y)
         elif event == cv2.EVENT_LBUTTONUP:
-            state = False
-            img = source_img.copy()
-            cv2.rectangle(img, (int(x-width/2), int(y-height/2)),
-                          (int(x+width/2), int(y+height/2)),
-                          DrawingShapeUtils.COLOR, 
-                          DrawingShapeUtils.LINE_THICKNESS)
-            p2 = (x, y)
-        if event == cv2.EVENT_MOUSEMOVE:
-            if state:
-                img = source_img.copy()
-                cv2.rectangle(img, (int(x-width/2), int(y-height/2)),
-                              (int(x+width/2), int(y+height/2)),
-                              DrawingShapeUtils.COLOR, 
-                              DrawingShapeUtils.LINE_THICKNESS)
-               
-    @staticmethod
-    def _draw_rectangle_with_offset(event, x, y, flags, params):
+            self.state = False
+            self.p2 = (x, y)
+        elif not (event == cv2.EVENT_MOUSEMOVE and self.state):
+            return
+        self._redraw()
+        cv2.rectangle(self.img, (int(x-width/2), int(y-height/2)),
+                      (int(x+width/2), int(y+height/2)),
+                      self.COLOR, self.LINE_THICKNESS)
+
+    def _draw_rectangle_with_offset(self, event, x, y, flags, params):
         """
         Draw a rectangle on a mouse click event.
         
@@ -182,31 +207,55 @@ class DrawingShapeUtils(object):
         flags:      Flags
         params:     desired width and height of the rectangle
         """
-        global img, source_img, state
-        global p1, p2
         width, height = params
         if event == cv2.EVENT_LBUTTONDOWN:
-            state = True
-            img = source_img.copy()
-            cv2.rectangle(img, (x, int(y-height/2)), (x+width, int(y+height/2)),
-                          DrawingShapeUtils.COLOR, 
-                          DrawingShapeUtils.LINE_THICKNESS)
-            p1 = (x, y)
+            self.state = True
+            self.p1 = (x, y)
         elif event == cv2.EVENT_LBUTTONUP:
-            state = False
-            img = source_img.copy()
-            cv2.rectangle(img, (x, int(y-height/2)), (x+width, int(y+height/2)),
-                          DrawingShapeUtils.COLOR, 
-                          DrawingShapeUtils.LINE_THICKNESS)
-            p2 = (x, y)
-        if event == cv2.EVENT_MOUSEMOVE:
-            if state:
-                img = source_img.copy()
-                cv2.rectangle(img, (x, int(y-height/2)),
-                              (x+width, int(y+height/2)),
-                              DrawingShapeUtils.COLOR, 
-                              DrawingShapeUtils.LINE_THICKNESS)
-                
+            self.state = False
+            self.p2 = (x, y)
+        elif not (event == cv2.EVENT_MOUSEMOVE and self.state):
+            return
+        self._redraw()
+        cv2.rectangle(self.img, (x, int(y-height/2)), (x+width, int(y+height/2)),
+                      self.COLOR, self.LINE_THICKNESS)
+
+    def run(self):
+        """
+        Display the image and let the user draw the shape. The session ends
+        when the user presses enter (accept) after drawing the shape or
+        escape (cancel).
+
+        Returns:
+            p1, p2 (tuple): coordinates of where the left mouse button was
+                            clicked and released, (None, None) if cancelled
+        """
+        cv2.namedWindow(self.prompt)
+        cv2.moveWindow(self.prompt, 20, 20)
+        cv2.setMouseCallback(self.prompt, self.on_mouse, self.params)
+        points = (None, None)
+        while True:
+            with self._lock:
+                img = self.img if self._dirty else None
+                self._dirty = False
+            if img is not None:
+                cv2.imshow(self.prompt, img)
+            key = 0xFF & cv2.waitKey(self.KEY_WAIT)
+            if key == 27:  # escape key
+                break
+            elif key == 13:  # enter key
+                with self._lock:
+                    points = (self.p1, self.p2)
+                if points[1] is not None:
+                    break
+        cv2.destroyWindow(self.prompt)
+        return points
+
+
+class DrawingShapeUtils(object):
+    LINE_THICKNESS = AnnotationSession.LINE_THICKNESS
+    COLOR = AnnotationSession.COLOR
+
     @staticmethod
     def draw(pic, scale, prompt, shape, params):
         """
@@ -217,28 +266,14 @@ class DrawingShapeUtils(object):
         prompt:     (str)       Message to display with image
         shape:      (enum)      Desired shape
         params:     (list)      Additional parameters for drawing function
-        """
-        global source_img, img, state
-        global p1, p2
         
-        state = False
-        temp = cv2.resize(pic, (0, 0), fx=scale, fy=scale)
-        source_img = temp.copy()
-        img = source_img.copy()
-        draw_function = DrawingShapeUtils._select_draw_function(shape)
-        cv2.namedWindow(prompt)
-        cv2.moveWindow(prompt, 20, 20)
-        cv2.setMouseCallback(prompt, draw_function, params)
-        while True:
-            cv2.imshow(prompt, img)
-            key = 0xFF & cv2.waitKey(1)
-            if key == 27:  # escape key
-                break
-            elif key == 13:  # enter key
-                y1, y2 = p1, p2
-                break
-        cv2.destroyAllWindows()
-        return y1, y2
+        Raises AnnotationCancelled if the user pressed escape.
+        """
+        session = AnnotationSession(pic, scale, prompt, shape, params)
+        point_1, point_2 = session.run()
+        if point_2 is None:
+            raise AnnotationCancelled('The annotation "{}" was cancelled.'.format(prompt))
+        return point_1, point_2
 
 
 if __name__ == '__main__':
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+import cv2
+import numpy as np
+
+
+class FrameScrubber(object):
+    """
+    Browse the frames of a video to find the frame before the oocyte moves.
+
+    The frames are downscaled once into a stack of thumbnails and the scrubber
+    starts at the detected onset of the motion. Overlays such as the frame
+    counter are drawn on a separate display buffer, so the video frames used
+    for the tracking are never modified. The window is only redrawn after a
+    key press.
+
+    Keys:
+        . / ,       next / previous frame
+        l / j       10 frames forward / back
+        L / J       100 frames forward / back
+        o           jump to the detected onset of the motion
+        enter       select the displayed frame
+        escape      cancel
+    """
+    THUMBNAIL_WIDTH = 320
+    PROMPT = 'Look for frame number before movement starts.'
+    COLOR = (0, 0, 255)
+    STEPS = {ord('.'): 1, ord(','): -1,
+             ord('l'): 10, ord('j'): -10,
+             ord('L'): 100, ord('J'): -100}
+
+    def __init__(self, frames, thumbnail_width=THUMBNAIL_WIDTH):
+        """
+        Initialize the scrubber.
+
+        Args:
+            frames (list):          list of grayscale video frames
+            thumbnail_width (int):  maximum width of the thumbnails [pixel]
+        """
+        if len(frames) == 0:
+            raise ValueError('Expected at least one frame, but got none.')
+        self.thumbnails = FrameScrubber._create_thumbnails(frames, thumbnail_width)
+        self.onset = FrameScrubber._detect_motion_onset(self.thumbnails)
+        self.position = self.onset
+        self._display = np.empty(self.thumbnails.shape[1:] + (3,), dtype=np.uint8)
+
+    @staticmethod
+    def _create_thumbnails(frames, thumbnail_width):
+        """
+        Downscale all frames into one array.
+
+        Returns:
+            thumbnails (array): array (size: NxHxW) of downscaled frames
+        """
+        height, width = frames[0].shape[:2]
+        factor = min(1.0, thumbnail_width / float(width))
+        size = (max(1, int(round(width * factor))), max(1, int(round(height * factor))))
+        thumbnails = np.empty((len(frames), size[1], size[0]), dtype=np.uint8)
+        for i, frame in enumerate(frames):
+            if factor < 1.0:
+                cv2.resize(frame, size, dst=thumbnails[i], interpolation=cv2.INTER_AREA)
+            else:
+                thumbnails[i] = frame
+        return thumbnails
+
+    @staticmethod
+    def _detect_motion_onset(thumbnails, sensitivity=5.0):
+        """
+        Detect the frame before the first movement in a stack of thumbnails.
+
+        The mean absolute difference between consecutive frames is compared
+        to the noise level of the video. The first frame after which the
+        difference rises above the noise is the onset of the motion.
+
+        Args:
+            thumbnails (array):     array (size: NxHxW) of frames
+            sensitivity (float):    threshold in multiples of the noise spread
+        Returns:
+            onset (int):            frame number before the movement starts
+        """
+        if len(thumbnails) < 2:
+            return 0
+        differences = np.empty(len(thumbnails) - 1)
+        for i in range(len(differences)):
+            differences[i] = cv2.absdiff(thumbnails[i], thumbnails[i+1]).mean()
+        noise = np.median(differences)
+        spread = np.median(np.abs(differences - noise))
+        threshold = noise + sensitivity * max(spread, 0.5)
+        moving = np.flatnonzero(differences > threshold)
+        if len(moving) == 0:
+            return 0
+        return int(moving[0])
+
+    def handle_key(self, key):
+        """
+        Move to another frame depending on the pressed key.
+
+        Args:
+            key (int):  code of the pressed key
+        Returns:
+            done (bool): True if the user selected a frame or cancelled
+        """
+        if key in FrameScrubber.STEPS:
+            self.position = int(np.clip(self.position + FrameScrubber.STEPS[key],
+                                        0, len(self.thumbnails) - 1))
+        elif key == ord('o'):
+            self.position = self.onset
+        elif (key == 13) | (key == 27):  # enter or escape key
+            return True
+        return False
+
+    def render(self):
+        """ Draw the current thumbnail and the overlays into the display buffer """
+        cv2.cvtColor(self.thumbnails[self.position], cv2.COLOR_GRAY2BGR,
+                     dst=self._display)
+        text = 'Frame: {} / {}  onset: {}'.format(self.position,
+                                                 len(self.thumbnails) - 1,
+                                                 self.onset)
+        cv2.putText(self._display, text, (5, 15), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.4, FrameScrubber.COLOR)
+        return self._display
+
+    def run(self):
+        """
+        Display the frames and let the user select the frame before the
+        movement starts.
+
+        Returns:
+            frame (int): the selected frame number, None if cancelled
+        """
+        cv2.namedWindow(FrameScrubber.PROMPT)
+        cv2.moveWindow(FrameScrubber.PROMPT, 20, 20)
+        key = None
+        while True:
+            cv2.imshow(FrameScrubber.PROMPT, self.render())
+            key = cv2.waitKey(0) & 0xFF
+            if self.handle_key(key):
+                break
+        cv2.destroyWindow(FrameScrubber.PROMPT)
+        if key == 27:
+            return None
+        return self.position
+
+
+if __name__ == '__main__':
+    frames = [np.full((480, 640), 100, dtype=np.uint8) for i in range(200)]
+    for frame in frames[120:]:
+        frame[200:280, 300:400] = 200
+    print(FrameScrubber(frames).run())
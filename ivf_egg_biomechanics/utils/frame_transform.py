@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+import cv2
+import numpy as np
+
+
+class FrameTransform(object):
+    """
+    Transform decoded video frames into the grayscale frames of the analysis:
+    grayscale conversion, rotation, crop and downsampling.
+
+    The steps are composed once for the frame size of the video. The crop is
+    given in the rotated frame (like the regions selected by the user), but
+    it is cut out of the decoded frame first, so only the pixels of the crop
+    are converted. Rotations by multiples of 90 degrees are exact views
+    (transpose and flip) and only the result is copied into a new array, so
+    no full-size intermediate frame is kept. Other angles are rotated with
+    imutils.rotate_bound after the conversion.
+    """
+
+    def __init__(self, rotation=0, crop_center=None, crop_size=(200, 200), downsample=1):
+        """
+        Initialize the transform.
+
+        Args:
+            rotation (int):         clockwise angle to rotate the frames
+                                    (see imutils.rotate_bound)
+            crop_center (tuple):    center (x, y) of the crop in the rotated
+                                    frame, None to keep the whole frame
+            crop_size (tuple):      width and height of the crop [pixel]
+            downsample (int):       keep every n-th row and column
+        """
+        if not isinstance(downsample, int) or downsample < 1:
+            raise ValueError('Expected a positive int for downsample, '
+                             'but got {} instead.'.format(downsample))
+        self.rotation = rotation
+        self.crop_center = crop_center
+        self.crop_size = crop_size
+        self.downsample = downsample
+        self._plans = {}
+
+    def output_shape(self, shape):
+        """ Shape of the transformed frames of decoded frames of the given shape """
+        quarter_turns, source, rows, columns = self._plan(shape[:2])
+        if quarter_turns is None:
+            return None     # depends on the rotation by imutils
+        return (len(range(rows.start, rows.stop, self.downsample)),
+                len(range(columns.start, columns.stop, self.downsample)))
+
+    def _crop_box(self, height, width):
+        """ Rows and columns of the crop in a rotated frame of the given size """
+        if self.crop_center is None:
+            return slice(0, height), slice(0, width)
+        x, y = self.crop_center
+        crop_width, crop_height = self.crop_size
+        rows = (int(y - crop_height / 2), int(y + crop_height / 2))
+        columns = (int(x - crop_width / 2), int(x + crop_width / 2))
+        return (slice(*np.clip(rows, 0, height)), slice(*np.clip(columns, 0, width)))
+
+    def _plan(self, shape):
+        """
+        Compose the steps for decoded frames of a shape (height, width).
+
+        Returns:
+            quarter_turns (int):    clockwise quarter turns, None for other angles
+            source (tuple):         slices of the crop in the decoded frame
+            rows, columns (slice):  the crop in the rotated frame
+        """
+        if shape not in self._plans:
+            height, width = shape
+            if self.rotation % 90 != 0:
+                self._plans[shape] = (None, None, None, None)
+            else:
+                quarter_turns = (self.rotation // 90) % 4
+                rotated = (width, height) if quarter_turns % 2 else (height, width)
+                rows, columns = self._crop_box(*rotated)
+                r0, r1, c0, c1 = rows.start, rows.stop, columns.start, columns.stop
+                # Rows and columns of the decoded frame that end up in the crop
+                source = {0: (slice(r0, r1), slice(c0, c1)),
+                          1: (slice(height - c1, height - c0), slice(r0, r1)),
+                          2: (slice(height - r1, height - r0), slice(width - c1, width - c0)),
+                          3: (slice(c0, c1), slice(width - r1, width - r0))}[quarter_turns]
+                self._plans[shape] = (quarter_turns, source, rows, columns)
+        return self._plans[shape]
+
+    def __call__(self, frame):
+        """
+        Transform a frame.
+
+        Args:
+            frame (array):  decoded BGR (or grayscale) frame
+        Returns:
+            frame (array):  the transformed grayscale frame (contiguous)
+        """
+        quarter_turns, source, rows, columns = self._plan(frame.shape[:2])
+        if quarter_turns is None:
+            import imutils
+            rotated = imutils.rotate_bound(self._gray(frame), self.rotation)
+            rows, columns = self._crop_box(*rotated.shape)
+            result = rotated[rows, columns]
+        else:
+            result = np.rot90(self._gray(frame[source]), -quarter_turns)
+        return np.ascontiguousarray(result[::self.downsample, ::self.downsample])
+
+    @staticmethod
+    def _gray(frame):
+        if frame.ndim == 2:
+            return frame
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+if __name__ == '__main__':
+    frame = np.random.randint(0, 256, (480, 640, 3), dtype=np.uint8)
+    transform = FrameTransform(90, crop_center=(240, 320), downsample=2)
+    print(transform(frame).shape, transform.output_shape(frame.shape))
@@ -1,13 +1,11 @@
 # -*- coding: utf-8 -*-
 
 import os
-import cv2
-import imutils
 import numpy as np
-import utils.drawing_shape_utils as dsu
-from tkinter import Tk
-from tkinter.filedialog import askopenfilename
+from utils import pressure_log, patient_table
 import pandas as pd
+# cv2, imutils and tkinter are imported by the functions that use them,
+# so the menu starts without loading the video and GUI libraries
 
 
 def load_excel_file():
@@ -27,80 +25,144 @@ def load_excel_file():
     return data
 
 
-def _extract_data_from_file(filename):
+def _extract_data_from_file(filename, cache_directory=patient_table.CACHE_DIRECTORY):
     """ 
-    Extract data from a given file.
+    Extract data from a given file (see patient_table.read_patient_table).
     
     Args:
-        filename (str): full path to file
+        filename (str):         full path to file
+        cache_directory (str):  directory of the cache, None to disable it
         
     Returns:
-        data (dataframe): a dataframe with the data
+        data (dataframe): a dataframe with the data, NaN for empty cells
     """
-    data = pd.read_excel(filename, engine='openpyxl')
-    data.replace(np.nan, 0, inplace=True)
-    data.columns = map(str.upper, data.columns)
-    return data
+    return patient_table.read_patient_table(filename, cache_directory)
 
 
-def read_video_file(rot_angle=0):
+def read_video_file(rot_angle=0, full_path=None):
     """
     Ask the user to choose the corresponding video file for the measurement
     and if the video has to be rotated.
     Read in the video frames and ask the user to specify the frame number
     before the first movement of the oocyte.
-    
+
     Args:
         rot_angle (int): angle to rotate the video frames
-    
+        full_path (str): full path to the video file, asks the user if None
+
     Returns:
         video_frames (list):    list of arrays corresponding to the grayscale video frames
         time (list):            list of time points
     """
-    full_path = choose_file('.avi')
-    path = str(os.path.dirname(full_path))
-    filename = str(os.path.basename(full_path))
-    os.chdir(path)
+    if full_path is None:
+        full_path = choose_file('.avi')
+    frames, frame_rate = decode_video_file(full_path, rot_angle)
+    return select_measurement_frames(frames, frame_rate)
+
+
+def _source_path(source):
+    """
+    Get the path of a file given as path or as an opened file object.
+
+    Args:
+        source (str, path-like or file object): the file
+    Returns:
+        path (str): the path of the file
+    """
+    if hasattr(source, 'read'):
+        source = getattr(source, 'name', None)
+        if not isinstance(source, (str, bytes, os.PathLike)):
+            raise TypeError('Expected a file object of a file on disk, '
+                            'but got a file object without a name instead.')
+    if not isinstance(source, (str, bytes, os.PathLike)):
+        raise TypeError('Expected {} or a file object, but got {} instead.'.format(
+            str, type(source)))
+    return os.fsdecode(os.fspath(source))
+
+
+def decode_video_file(source, rot_angle=0, transform=None):
+    """
+    Decode all frames of a video file without any user interaction.
+    The function has no side effects on the process (e.g. the working
+    directory), so several videos can be decoded in parallel threads.
+    Each frame is converted to grayscale, rotated and optionally cropped
+    and downsampled while it is decoded (see FrameTransform).
+
+    Args:
+        source (str or file object): full path to the video file or the opened file
+        rot_angle (int): clockwise angle to rotate the video frames
+        transform (FrameTransform): transform of the decoded frames, a
+                                    rotation by rot_angle if None
+
+    Returns:
+        frames (list):      list of arrays corresponding to the grayscale video frames
+        frame_rate (float): frame rate of the video [fps]
+    """
+    import cv2
+    from utils.frame_transform import FrameTransform
+    if transform is None:
+        transform = FrameTransform(rot_angle)
+    full_path = _source_path(source)
+    if not os.path.isfile(full_path):
+        raise FileNotFoundError('Video file {} does not exist.'.format(full_path))
     frames = []
-    video = cv2.VideoCapture(filename)
+    video = cv2.VideoCapture(full_path)
     frame_rate = video.get(cv2.CAP_PROP_FPS)
-    num_frames = 0
-    cv2.namedWindow('Aspiration Depth Video')
-    cv2.moveWindow('Aspiration Depth Video', 20, 20)
     while video.isOpened():
         ret, frame = video.read()
         if not ret:
             break
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        rot_frame = imutils.rotate_bound(gray_frame, rot_angle)
-        cv2.imshow('Aspiration Depth Video', rot_frame)
-        frames.append(rot_frame)
-        num_frames += 1
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+        frames.append(transform(frame))
     video.release()
-    cv2.destroyAllWindows()
-    time_valve_opened = _find_starting_point_of_movement(frames)
-    time = _create_time_vector(num_frames, time_valve_opened, frame_rate)
+    return frames, frame_rate
+
+
+def select_measurement_frames(frames, frame_rate, time_valve_opened=None, roi_center=None):
+    """
+    Ask the user to specify the frame number before the first movement of the
+    oocyte and the region of interest, and cut the measurement out of the
+    decoded video. The user is only asked for what is not given.
+    
+    Args:
+        frames (list):              list of grayscale video frames
+        frame_rate (float):         frame rate of the video [fps]
+        time_valve_opened (int):    frame number before the first movement
+        roi_center (tuple):         center (x, y) of the region of interest
+    
+    Returns:
+        video_frames (list):    list of cropped grayscale video frames
+        time (list):            list of time points
+    """
+    if time_valve_opened is None:
+        time_valve_opened = _find_starting_point_of_movement(frames)
+    time = _create_time_vector(len(frames), time_valve_opened, frame_rate)
     video_frames = frames[time_valve_opened:time_valve_opened+len(time)+1]
-    video_frames_cropped = _crop_video_frames(video_frames)
+    video_frames_cropped = _crop_video_frames(video_frames, roi_center)
     return video_frames_cropped, time
 
 
 def choose_file(extension):
     """
     Ask user to choose a file with the correct extension.
+    The dialog is the only interactive part of reading a file; the readers
+    take the chosen path.
     
     Args:
         extension (str): the desired file extension with a preceeding dot (e.g.: .xlsx)
     Returns:
         filename (str): full path of file
     """
-    Tk().withdraw()
+    from tkinter import Tk
+    from tkinter.filedialog import askopenfilename
+    root = Tk()
+    root.withdraw()
     filetype = '*' + extension
-    filename = askopenfilename(initialdir="/",
-                               title="Select a file with {} extension".format(extension),
-                               filetypes=(("{} files".format(extension), filetype), ("all files", "*.*")))
+    try:
+        filename = askopenfilename(parent=root, initialdir="/",
+                                   title="Select a file with {} extension".format(extension),
+                                   filetypes=(("{} files".format(extension), filetype), ("all files", "*.*")))
+    finally:
+        root.destroy()
     return filename
 
 
@@ -108,9 +170,10 @@ def _find_starting_point_of_movement(frames):
     """
     Find the frame before the oocyte moves.
     
-    Displays a frame and lets the user search for the frame number before the
-    movement of the oocyte begins. The user has to input the frame number before
-    movement starts.
+    Lets the user browse downscaled copies of the frames, starting at the
+    automatically detected onset of the motion, and select the frame before
+    the movement of the oocyte begins with the enter key. If the user cancels
+    with the escape key, the frame number has to be entered instead.
     
     Args:
         frames (list): a list of video frames
@@ -118,25 +181,10 @@ def _find_starting_point_of_movement(frames):
     Returns:
         time_valve_opened (int): the frame number before the movement begins
     """
-    fr = 0
-    while True:
-        num_frame = 'Frame: %d' % fr
-        frame = frames[fr]
-        cv2.putText(frame, num_frame, (5, 30), cv2.FONT_HERSHEY_SIMPLEX,
-                    1, (0, 0, 0))
-        prompt = 'Look for frame number before movement starts.'
-        cv2.namedWindow(prompt)
-        cv2.imshow(prompt, frames[fr])
-        cv2.moveWindow(prompt, 20, 20)
-        key = cv2.waitKey(1) & 0xFF
-        if key == 46:  # if period button is pressed, show next frame
-            fr += 1
-        elif key == 44:  # if comma button is pressed, show previous frame
-            fr -= 1
-        elif (key == 27) | (key == 13):  # if Esc is pressed, break from the loop
-            break
-    cv2.destroyAllWindows()
-    time_valve_opened = int(input('Enter the frame number before first movement: '))
+    from utils.frame_scrubber import FrameScrubber
+    time_valve_opened = FrameScrubber(frames).run()
+    if time_valve_opened is None:
+        time_valve_opened = int(input('Enter the frame number before first movement: '))
     return time_valve_opened
 
 
@@ -166,11 +214,14 @@ def _create_time_vector(num_frames, time_valve_opened, frame_rate):
     return time
 
 
-def _crop_video_frames(video_frames):
+def _crop_video_frames(video_frames, roi_center=None):
     start_image = video_frames[0]
     roi_width = 200
     roi_height = 200
-    x, y = _choose_roi(start_image, roi_width, roi_height)
+    if roi_center is None:
+        x, y = _choose_roi(start_image, roi_width, roi_height)
+    else:
+        x, y = roi_center
     video_frames_cropped = []
     for frame in video_frames:
         video_frames_cropped.append(
@@ -191,29 +242,63 @@ def _choose_roi(pic, roi_width, roi_height):
         (tuple):            top left corner coordinates
     """
     
+    import utils.drawing_shape_utils as dsu
     prompt = 'Select ROI'
     point_1, point_2 = dsu.DrawingShapeUtils.draw(
             pic, 1.0, prompt, dsu.Shape.rectangle, [roi_width, roi_height])
     return point_2[0], point_2[1]
 
 
-def read_pressure_file():
+def read_pressure_file(full_path=None):
     """
     Read the pressure log file and return the mean of the applied pressure.
     
-    ReturnsS:
+    Args:
+        full_path (str): full path to the pressure log file, asks the user if None
+    Returns:
+        applied_pressure (float):     applied pressure in [psi]
+    """
+    if full_path is None:
+        full_path = choose_file('.txt')
+    return parse_pressure_file(full_path)
+
+
+def parse_pressure_file(source, cache_directory=pressure_log.CACHE_DIRECTORY):
+    """
+    Parse a pressure log file and return the mean of the applied pressure.
+    The function has no side effects on the process, so several files can be
+    parsed in parallel threads.
+    
+    Args:
+        source (str or file object): full path to the pressure log file or
+                                     the opened file
+        cache_directory (str):       directory of the cache of parsed logs,
+                                     None to disable it
+    Returns:
         applied_pressure (float):     applied pressure in [psi]
     """
-    full_path = choose_file('.txt')
-    path = str(os.path.dirname(full_path))
-    filename = str(os.path.basename(full_path))
-    os.chdir(path)
-    press_read = np.genfromtxt(filename, delimiter=' ', dtype=str)
-    ind = np.ravel(np.where(press_read[:, 1] == 'Valve'))
-    press_read = press_read[ind[0]+1:,1]
-    press_read = press_read.astype(np.float)
-    applied_pressure = np.mean(press_read)
-    return applied_pressure
+    return read_pressure_trace(source, cache_directory)[1]
+
+
+def read_pressure_trace(source, cache_directory=pressure_log.CACHE_DIRECTORY):
+    """
+    Parse the time stamped pressure values after the valve was opened from
+    a pressure log file. See pressure_log.read_pressure_trace.
+    
+    Args:
+        source (str or file object): full path to the pressure log file or
+                                     the opened file
+        cache_directory (str):       directory of the cache of parsed logs,
+                                     None to disable it
+    Returns:
+        trace (array):              array (size: Nx2, float32) with the time
+                                    since the valve was opened [s] and the
+                                    pressure [psi]
+        applied_pressure (float):   mean of the applied pressure [psi]
+    """
+    if not hasattr(source, 'read'):
+        source = _source_path(source)
+    return pressure_log.read_pressure_trace(source, cache_directory)
 
 
 if __name__ == '__main__':
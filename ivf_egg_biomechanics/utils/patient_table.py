@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import pickle
+import tempfile
+import numpy as np
+import pandas as pd
+from measurement import FIELD_TYPES
+
+CACHE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.ivf_egg_biomechanics',
+                               'excel_cache')
+_CACHE_VERSION = 1
+MEASURED = 'MEASURED'
+# Columns read from the patient table and their types; list properties are no table columns
+COLUMN_TYPES = {key.value: value_type for key, value_type in FIELD_TYPES.items()
+                if value_type is not list}
+COLUMN_TYPES[MEASURED] = int
+
+
+def read_patient_table(filename, cache_directory=CACHE_DIRECTORY):
+    """
+    Read the patient table from an excel file.
+
+    Only the columns of the keys of a measurement and MEASURED are read
+    (column names are not case-sensitive). Number columns are float64 with
+    NaN for empty cells, text columns are objects with None for empty
+    cells, so an empty cell is never confused with a zero. The table is
+    cached next to a fingerprint of the file (modification time, size and
+    content hash), so the workbook is only parsed again after it changed.
+
+    Args:
+        filename (str):         full path to the excel file
+        cache_directory (str):  directory of the cache, None to disable it
+    Returns:
+        data (dataframe):       the table with upper-case column names
+    """
+    if cache_directory is None:
+        return _parse_table(filename)
+    cache_path = os.path.join(cache_directory, _cache_name(filename))
+    stat = os.stat(filename)
+    cached = _load_cached_table(cache_path)
+    digest = None
+    if cached is not None:
+        if (cached['mtime'], cached['size']) == (stat.st_mtime_ns, stat.st_size):
+            return cached['data']
+        if cached['size'] == stat.st_size:
+            # The file was touched, check if its content changed
+            digest = _hash_file(filename)
+            if digest == cached['digest']:
+                cached.update(mtime=stat.st_mtime_ns)
+                _store_cached_table(cache_directory, cache_path, cached)
+                return cached['data']
+    data = _parse_table(filename)
+    _store_cached_table(cache_directory, cache_path,
+                        {'mtime': stat.st_mtime_ns, 'size': stat.st_size,
+                         'digest': digest or _hash_file(filename), 'data': data})
+    return data
+
+
+def _parse_table(filename):
+    data = pd.read_excel(filename, engine='openpyxl',
+                         usecols=lambda name: _column_name(name) in COLUMN_TYPES)
+    data.columns = [_column_name(name) for name in data.columns]
+    for name in data.columns:
+        column = data[name]
+        if COLUMN_TYPES[name] is str:
+            data[name] = pd.Series([_to_text(value) for value in column],
+                                   index=column.index, dtype=object)
+        elif pd.api.types.is_numeric_dtype(column):
+            data[name] = column.astype(np.float64)
+        # Columns with text in number columns are kept, so the invalid
+        # cells can be reported (see measurement.validate_dataframe)
+    return data
+
+
+def _column_name(name):
+    return str(name).strip().upper()
+
+
+def _to_text(value):
+    """ Text of a cell of a text column; numbers (e.g. grades) are converted """
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, str):
+        return value
+    return format(value, 'g')
+
+
+def _cache_name(filename):
+    """ Name of the cache file of a table, changes with the columns and the version """
+    key = '{}|{}|{}'.format(_CACHE_VERSION, os.path.abspath(filename),
+                            sorted(COLUMN_TYPES.items(), key=lambda item: item[0]))
+    return hashlib.sha1(key.encode()).hexdigest() + '.pkl'
+
+
+def _hash_file(filename, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as table:
+        for chunk in iter(lambda: table.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_cached_table(cache_path):
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            return pickle.load(cache_file)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return None
+
+
+def _store_cached_table(cache_directory, cache_path, cached):
+    """ Write the cache file atomically, so parallel readers never see a partial file """
+    try:
+        os.makedirs(cache_directory, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(suffix='.pkl', dir=cache_directory)
+        with os.fdopen(handle, 'wb') as cache_file:
+            pickle.dump(cached, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        pass
+
+
+if __name__ == '__main__':
+    print(sorted(COLUMN_TYPES))
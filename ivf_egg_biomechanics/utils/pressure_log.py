@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import io
+import os
+import tempfile
+import numpy as np
+
+CHUNK_SIZE = 1 << 20    # bytes read from the log at once
+CACHE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.ivf_egg_biomechanics',
+                               'pressure_cache')
+_CACHE_VERSION = b'pressure-trace-1'
+_VALVE = b'Valve'
+
+
+def read_pressure_trace(source, cache_directory=CACHE_DIRECTORY,
+                        chunk_size=CHUNK_SIZE):
+    """
+    Read the pressure trace after the valve was opened from a pressure log.
+
+    The log consists of lines with a time stamp and a pressure value. The
+    opening of the valve is marked by a line with 'Valve' instead of the
+    pressure. The log is read in chunks and only the lines after the valve
+    event are converted to numbers. Parsed traces are cached by the hash of
+    the file content, so a log only has to be parsed once.
+
+    Args:
+        source (str or file object):    path to the pressure log or the opened file
+        cache_directory (str):          directory of the cache, None to disable it
+        chunk_size (int):               number of bytes read at once
+    Returns:
+        trace (array):              array (size: Nx2, float32) with the time
+                                    since the valve was opened [s] and the
+                                    pressure [psi]
+        applied_pressure (float):   mean of the applied pressure [psi]
+    """
+    if hasattr(source, 'read'):
+        return _read_stream(source, cache_directory, chunk_size)
+    with open(source, 'rb') as stream:
+        return _read_stream(stream, cache_directory, chunk_size)
+
+
+def _read_stream(stream, cache_directory, chunk_size):
+    if not _is_seekable(stream):
+        stream = io.BytesIO(_to_bytes(stream.read()))
+    start = stream.tell()
+    digest = None
+    if cache_directory is not None:
+        digest = _hash_stream(stream, chunk_size)
+        cached = _load_cached_trace(cache_directory, digest)
+        if cached is not None:
+            return cached
+        stream.seek(start)
+    trace, applied_pressure = _parse_stream(stream, chunk_size)
+    if digest is not None:
+        _store_cached_trace(cache_directory, digest, trace, applied_pressure)
+    return trace, applied_pressure
+
+
+def _is_seekable(stream):
+    seekable = getattr(stream, 'seekable', None)
+    return seekable is not None and seekable()
+
+
+def _to_bytes(data):
+    if isinstance(data, str):
+        return data.encode()
+    return data
+
+
+def _hash_stream(stream, chunk_size):
+    digest = hashlib.sha1(_CACHE_VERSION)
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(_to_bytes(chunk))
+    return digest.hexdigest()
+
+
+def _cache_path(cache_directory, digest):
+    return os.path.join(cache_directory, digest + '.npz')
+
+
+def _load_cached_trace(cache_directory, digest):
+    try:
+        with np.load(_cache_path(cache_directory, digest)) as cached:
+            return cached['trace'], float(cached['applied_pressure'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _store_cached_trace(cache_directory, digest, trace, applied_pressure):
+    """ Write the cache file atomically, so parallel readers never see a partial file """
+    try:
+        os.makedirs(cache_directory, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(suffix='.npz', dir=cache_directory)
+        with os.fdopen(handle, 'wb') as cache_file:
+            np.savez(cache_file, trace=trace, applied_pressure=applied_pressure)
+        os.replace(temp_path, _cache_path(cache_directory, digest))
+    except OSError:
+        pass
+
+
+def _parse_stream(stream, chunk_size):
+    """
+    Parse the lines after the valve event chunk by chunk.
+
+    Returns:
+        trace (array):              array (size: Nx2, float32) of time and pressure
+        applied_pressure (float):   mean of the applied pressure
+    """
+    leftover = b''
+    valve_time = None
+    blocks = []
+    while True:
+        chunk = _to_bytes(stream.read(chunk_size))
+        data = leftover + chunk
+        if chunk:
+            cut = data.rfind(b'\n') + 1
+            data, leftover = data[:cut], data[cut:]
+        if valve_time is None:
+            valve_time, data = _find_valve_event(data)
+        if valve_time is not None and data.strip():
+            blocks.append(_parse_block(data))
+        if not chunk:
+            break
+    if valve_time is None:
+        raise ValueError('The pressure log does not contain a valve event.')
+    if not blocks:
+        raise ValueError('The pressure log does not contain values after the valve event.')
+    values = np.concatenate(blocks)
+    if not np.isnan(valve_time):
+        values[:, 0] -= valve_time
+    applied_pressure = float(np.mean(values[:, 1]))
+    return values.astype(np.float32), applied_pressure
+
+
+def _find_valve_event(data):
+    """
+    Find the line of the valve event in a chunk of complete lines.
+
+    Returns:
+        valve_time (float): time stamp of the valve event (nan if it is no
+                            number), None if the chunk has no valve event
+        data (bytes):       the part of the chunk after the valve event
+    """
+    position = data.find(_VALVE)
+    while position >= 0:
+        line_start = data.rfind(b'\n', 0, position) + 1
+        line_end = data.find(b'\n', position)
+        line_end = len(data) if line_end < 0 else line_end + 1
+        tokens = data[line_start:line_end].split()
+        if len(tokens) > 1 and tokens[1] == _VALVE:
+            return _parse_time_stamp(tokens[0]), data[line_end:]
+        position = data.find(_VALVE, line_end)
+    return None, data
+
+
+def _parse_time_stamp(token):
+    """ Convert a time stamp (seconds or hh:mm:ss.f) to seconds """
+    if isinstance(token, bytes):
+        token = token.decode()
+    try:
+        return float(token)
+    except ValueError:
+        pass
+    try:
+        seconds = 0.0
+        for part in token.split(':'):
+            seconds = seconds * 60.0 + float(part)
+        return seconds
+    except ValueError:
+        return np.nan
+
+
+def _parse_block(data):
+    """ Convert complete lines of time stamps and pressure values to numbers """
+    try:
+        return np.loadtxt(io.BytesIO(data), usecols=(0, 1), ndmin=2)
+    except ValueError:
+        return np.loadtxt(io.BytesIO(data), usecols=(0, 1), ndmin=2,
+                          converters={0: _parse_time_stamp})
+
+
+if __name__ == '__main__':
+    trace, pressure = read_pressure_trace(io.StringIO('0.0 1.0\n0.1 Valve\n0.2 2.0\n0.3 4.0\n'))
+    print(trace, pressure)
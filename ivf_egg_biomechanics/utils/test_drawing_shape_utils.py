@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import cv2
+import numpy as np
+import unittest
+from unittest.mock import patch
+from utils.drawing_shape_utils import (AnnotationCancelled, AnnotationSession,
+                                       DrawingShapeUtils, Shape)
+
+
+class TestAnnotationSession(unittest.TestCase):
+    """ Test the AnnotationSession class """
+    def setUp(self):
+        self.pic = np.ones((50, 60), dtype=np.uint8)*255
+
+    def test_invalid_shape(self):
+        """ Test that a ValueError is raised for an unknown shape """
+        with self.assertRaises(ValueError):
+            AnnotationSession(self.pic, 1.0, 'Test', 5, [])
+
+    def test_arrow_points(self):
+        """ Test that the points of an arrow are stored in the session """
+        session = AnnotationSession(self.pic, 2.0, 'Test', Shape.arrow, [])
+        self.assertEqual(session.source_img.shape, (100, 120))
+        session.on_mouse(cv2.EVENT_LBUTTONDOWN, 10, 20, 0, [])
+        session.on_mouse(cv2.EVENT_MOUSEMOVE, 30, 20, 0, [])
+        session.on_mouse(cv2.EVENT_LBUTTONUP, 50, 20, 0, [])
+        self.assertEqual(session.p1, (10, 20))
+        self.assertEqual(session.p2, (50, 20))
+        self.assertFalse(session.state)
+        self.assertTrue((session.source_img == 255).all())
+        self.assertFalse((session.img == 255).all())
+
+    def test_redraw_only_on_change(self):
+        """ Test that mouse moves without a pressed button do not redraw """
+        session = AnnotationSession(self.pic, 1.0, 'Test', Shape.offset, [10, 10])
+        session._dirty = False
+        session.on_mouse(cv2.EVENT_MOUSEMOVE, 10, 20, 0, [10, 10])
+        self.assertFalse(session._dirty)
+        session.on_mouse(cv2.EVENT_LBUTTONDOWN, 10, 20, 0, [10, 10])
+        self.assertTrue(session._dirty)
+
+    def test_independent_sessions(self):
+        """ Test that two sessions do not share their state """
+        session_1 = AnnotationSession(self.pic, 1.0, 'Test 1', Shape.line, [])
+        session_2 = AnnotationSession(self.pic, 1.0, 'Test 2', Shape.line, [])
+        session_1.on_mouse(cv2.EVENT_LBUTTONDOWN, 5, 5, 0, [])
+        session_1.on_mouse(cv2.EVENT_LBUTTONUP, 7, 5, 0, [])
+        self.assertEqual(session_1.p2, (7, 5))
+        self.assertIsNone(session_2.p1)
+        self.assertIsNone(session_2.p2)
+
+    def _run(self, keys, shape=Shape.line):
+        """ Draw with the window replaced by a list of key presses and mouse events """
+        callbacks = []
+
+        def wait_key(delay):
+            key = keys.pop(0)
+            if isinstance(key, tuple):
+                callbacks[0](*key, 0, [])
+                return -1
+            return key
+
+        with patch.object(cv2, 'namedWindow'), patch.object(cv2, 'moveWindow'), \
+                patch.object(cv2, 'imshow'), patch.object(cv2, 'destroyWindow'), \
+                patch.object(cv2, 'setMouseCallback',
+                             lambda name, callback, params: callbacks.append(callback)), \
+                patch.object(cv2, 'waitKey', wait_key):
+            return DrawingShapeUtils.draw(self.pic, 1.0, 'Test', shape, [])
+
+    def test_draw(self):
+        """ Test that enter only accepts a drawn shape """
+        keys = [13, (cv2.EVENT_LBUTTONDOWN, 5, 6), (cv2.EVENT_LBUTTONUP, 7, 6), 13]
+        self.assertEqual(self._run(keys), ((5, 6), (7, 6)))
+
+    def test_draw_cancelled(self):
+        """ Test that an AnnotationCancelled is raised if escape is pressed """
+        with self.assertRaises(AnnotationCancelled):
+            self._run([(cv2.EVENT_LBUTTONDOWN, 5, 6), 27])
+
+
+if __name__ == '__main__':
+    unittest.main()
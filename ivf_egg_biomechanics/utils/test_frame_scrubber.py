@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import unittest
+from utils.frame_scrubber import FrameScrubber
+
+
+class TestFrameScrubber(unittest.TestCase):
+    """ Test the FrameScrubber class """
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.frames = [(100 + rng.randint(0, 3, size=(120, 640))).astype(np.uint8)
+                       for i in range(300)]
+        for i, frame in enumerate(self.frames[150:]):
+            frame[40:80, 100 + i:200 + i] = 200
+        self.originals = [frame.copy() for frame in self.frames]
+
+    def test_empty_frames(self):
+        """ Test that a ValueError is raised if there are no frames """
+        with self.assertRaises(ValueError):
+            FrameScrubber([])
+
+    def test_thumbnails(self):
+        """ Test that the thumbnails are downscaled to the maximum width """
+        scrubber = FrameScrubber(self.frames)
+        self.assertEqual(scrubber.thumbnails.shape, (300, 60, 320))
+        scrubber = FrameScrubber(self.frames, thumbnail_width=1000)
+        self.assertEqual(scrubber.thumbnails.shape, (300, 120, 640))
+
+    def test_motion_onset(self):
+        """ Test that the onset of the motion is detected """
+        scrubber = FrameScrubber(self.frames)
+        self.assertEqual(scrubber.onset, 149)
+        self.assertEqual(scrubber.position, 149)
+
+    def test_handle_key(self):
+        """ Test that the keys move to the right frames """
+        scrubber = FrameScrubber(self.frames)
+        self.assertFalse(scrubber.handle_key(ord('L')))
+        self.assertEqual(scrubber.position, 249)
+        scrubber.handle_key(ord('L'))
+        self.assertEqual(scrubber.position, 299)
+        scrubber.handle_key(ord('j'))
+        scrubber.handle_key(ord(','))
+        self.assertEqual(scrubber.position, 288)
+        scrubber.handle_key(ord('o'))
+        self.assertEqual(scrubber.position, 149)
+        self.assertTrue(scrubber.handle_key(13))
+
+    def test_render_does_not_modify_frames(self):
+        """ Test that the overlays are not drawn into the frames """
+        scrubber = FrameScrubber(self.frames)
+        thumbnail = scrubber.thumbnails[scrubber.position].copy()
+        display = scrubber.render()
+        self.assertEqual(display.shape, (60, 320, 3))
+        np.testing.assert_array_equal(scrubber.thumbnails[scrubber.position], thumbnail)
+        for frame, original in zip(self.frames, self.originals):
+            np.testing.assert_array_equal(frame, original)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import cv2
+import numpy as np
+import unittest
+from utils.frame_transform import FrameTransform
+
+
+class TestFrameTransform(unittest.TestCase):
+    """ Test the FrameTransform class """
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.frame = rng.randint(0, 256, size=(120, 160, 3)).astype(np.uint8)
+        self.gray = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
+
+    def test_invalid_input(self):
+        """ Test that a ValueError is raised for an invalid downsampling """
+        with self.assertRaises(ValueError):
+            FrameTransform(downsample=0)
+
+    def test_rotation(self):
+        """ Test that the rotations are exact clockwise quarter turns """
+        for rotation in (0, 90, 180, 270, -90):
+            result = FrameTransform(rotation)(self.frame)
+            np.testing.assert_array_equal(result, np.rot90(self.gray, -rotation // 90))
+            self.assertTrue(result.flags['C_CONTIGUOUS'])
+
+    def test_crop_before_rotation(self):
+        """ Test that cropping the decoded frame gives the crop of the rotated frame """
+        for rotation in (0, 90, 180, 270):
+            rotated = np.rot90(self.gray, -rotation // 90)
+            for center, size, downsample in (((50, 40), (30, 20), 1), ((70, 60), (200, 200), 1),
+                                             ((55, 45), (31, 21), 3)):
+                transform = FrameTransform(rotation, center, size, downsample)
+                x, y = center
+                rows = slice(max(int(y - size[1] / 2), 0), int(y + size[1] / 2))
+                columns = slice(max(int(x - size[0] / 2), 0), int(x + size[0] / 2))
+                expected = rotated[rows, columns][::downsample, ::downsample]
+                result = transform(self.frame)
+                np.testing.assert_array_equal(result, expected)
+                self.assertEqual(transform.output_shape(self.frame.shape), expected.shape)
+
+    def test_other_angles(self):
+        """ Test that other angles are rotated like imutils.rotate_bound """
+        import imutils
+        result = FrameTransform(45, downsample=2)(self.frame)
+        np.testing.assert_array_equal(result, imutils.rotate_bound(self.gray, 45)[::2, ::2])
+        self.assertIsNone(FrameTransform(45).output_shape(self.frame.shape))
+
+    def test_gray_frames(self):
+        """ Test that grayscale frames are not converted """
+        np.testing.assert_array_equal(FrameTransform(90)(self.gray), np.rot90(self.gray, -1))
+
+
+if __name__ == '__main__':
+    unittest.main()
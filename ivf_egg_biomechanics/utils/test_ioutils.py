@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 
 import utils.ioutils as ioutils
+import io
+import os
+import tempfile
+import cv2
 import numpy as np
 import pandas as pd
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock
 
 
@@ -66,6 +71,45 @@ class TestIoutils(unittest.TestCase):
         time_correct = time_correct[:, 0].tolist()
         self.assertCountEqual(time, time_correct)
 
+    def test_decode_video_file(self):
+        """ Test that video frames are decoded without changing the working directory """
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            full_path = os.path.join(directory, 'video.avi')
+            writer = cv2.VideoWriter(full_path, cv2.VideoWriter_fourcc(*'MJPG'),
+                                     70, (64, 48))
+            for i in range(10):
+                writer.write(np.full((48, 64, 3), 10 * i, dtype=np.uint8))
+            writer.release()
+            frames, frame_rate = ioutils.decode_video_file(full_path, 90)
+            self.assertEqual(len(frames), 10)
+            self.assertEqual(frames[0].shape, (64, 48))
+            self.assertAlmostEqual(frame_rate, 70.0)
+            with open(full_path, 'rb') as video_file:
+                frames, frame_rate = ioutils.decode_video_file(video_file)
+            self.assertEqual(frames[0].shape, (48, 64))
+        self.assertEqual(os.getcwd(), cwd)
+        with self.assertRaises(TypeError):
+            ioutils.decode_video_file(io.BytesIO(b''))
+
+    def test_parse_pressure_file(self):
+        """ Test that the pressure is parsed from paths and file objects """
+        log = '0.0 1.0\n0.1 Valve\n0.2 2.0\n0.3 4.0\n'
+        self.assertAlmostEqual(ioutils.parse_pressure_file(io.StringIO(log), None), 3.0)
+        self.assertAlmostEqual(ioutils.parse_pressure_file(io.BytesIO(log.encode()), None), 3.0)
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for i in range(8):
+                paths.append(os.path.join(directory, 'pressure{}.txt'.format(i)))
+                with open(paths[-1], 'w') as pressure_file:
+                    pressure_file.write(log.replace('4.0', str(float(i))))
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                pressures = list(executor.map(ioutils.parse_pressure_file, paths,
+                                              [directory] * len(paths)))
+        self.assertEqual(pressures, [(2.0 + i) / 2.0 for i in range(8)])
+        self.assertEqual(os.getcwd(), cwd)
+
 
 if __name__ == '__main__':
     unittest.main()
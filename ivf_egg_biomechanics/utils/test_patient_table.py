@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+from utils import patient_table
+
+
+class TestPatientTable(unittest.TestCase):
+    """ Test the reading of the patient table """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_directory = os.path.join(self.directory, 'cache')
+        self.filename = os.path.join(self.directory, 'patients.xlsx')
+        self.data = pd.DataFrame({'Number': [1, 1, 2], 'oocyte': [1, 2, 1],
+                                  'Measured': [1, 0, 1], 'FERTILIZED': [1, np.nan, 0],
+                                  'D3GRADE': ['8A', 6, None], 'COMMENT': ['a', 'b', 'c']})
+        self.data.to_excel(self.filename, index=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_read_patient_table(self):
+        """ Test that only known columns are read with their types """
+        data = patient_table.read_patient_table(self.filename, None)
+        self.assertEqual(list(data.columns),
+                         ['NUMBER', 'OOCYTE', 'MEASURED', 'FERTILIZED', 'D3GRADE'])
+        self.assertEqual(data['FERTILIZED'].dtype, np.float64)
+        self.assertTrue(np.isnan(data['FERTILIZED'][1]))
+        self.assertEqual(data['FERTILIZED'][2], 0)
+        self.assertEqual(data['D3GRADE'].tolist(), ['8A', '6', None])
+
+    def test_cache(self):
+        """ Test that the table is parsed again only after the file changed """
+        parse = patient_table._parse_table
+        with patch.object(patient_table, '_parse_table', side_effect=parse) as parse_table:
+            first = patient_table.read_patient_table(self.filename, self.cache_directory)
+            second = patient_table.read_patient_table(self.filename, self.cache_directory)
+            pd.testing.assert_frame_equal(first, second)
+            self.assertEqual(parse_table.call_count, 1)
+            stat = os.stat(self.filename)
+            os.utime(self.filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            patient_table.read_patient_table(self.filename, self.cache_directory)
+            self.assertEqual(parse_table.call_count, 1)
+            self.data.assign(Number=[3, 3, 4]).to_excel(self.filename, index=False)
+            data = patient_table.read_patient_table(self.filename, self.cache_directory)
+            self.assertEqual(parse_table.call_count, 2)
+        self.assertEqual(data['NUMBER'].tolist(), [3, 3, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
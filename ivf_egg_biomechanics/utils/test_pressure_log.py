@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import tempfile
+import numpy as np
+import unittest
+from unittest.mock import patch
+import utils.pressure_log as pressure_log
+
+
+class TestPressureLog(unittest.TestCase):
+    """ Test the pressure log parser """
+    def setUp(self):
+        lines = ['{:.3f} {:.2f}'.format(0.01 * i, 0.5) for i in range(300)]
+        lines.append('3.000 Valve')
+        lines += ['{:.3f} {:.2f}'.format(3.0 + 0.01 * (i + 1), 1.0 + i % 3)
+                  for i in range(600)]
+        self.log = '\n'.join(lines) + '\n'
+
+    def test_read_pressure_trace(self):
+        """ Test that the trace after the valve event is parsed """
+        trace, pressure = pressure_log.read_pressure_trace(
+            io.StringIO(self.log), cache_directory=None)
+        self.assertEqual(trace.dtype, np.float32)
+        self.assertEqual(trace.shape, (600, 2))
+        self.assertAlmostEqual(float(trace[0, 0]), 0.01, places=5)
+        self.assertAlmostEqual(float(trace[-1, 0]), 6.0, places=4)
+        self.assertAlmostEqual(pressure, 2.0)
+
+    def test_small_chunks(self):
+        """ Test that lines split between chunks are parsed correctly """
+        expected = pressure_log.read_pressure_trace(
+            io.BytesIO(self.log.encode()), cache_directory=None)
+        for chunk_size in [7, 64, 1000]:
+            trace, pressure = pressure_log.read_pressure_trace(
+                io.BytesIO(self.log.encode()), cache_directory=None,
+                chunk_size=chunk_size)
+            np.testing.assert_array_equal(trace, expected[0])
+            self.assertEqual(pressure, expected[1])
+
+    def test_clock_time_stamps(self):
+        """ Test that time stamps in hh:mm:ss format are converted to seconds """
+        log = '10:00:00.0 1.0\n10:00:01.5 Valve\n10:00:01.6 2.0\n10:00:01.7 4.0\n'
+        trace, pressure = pressure_log.read_pressure_trace(io.StringIO(log), None)
+        np.testing.assert_allclose(trace[:, 0], [0.1, 0.2], rtol=1e-4)
+        self.assertAlmostEqual(pressure, 3.0)
+
+    def test_missing_valve_event(self):
+        """ Test that a ValueError is raised if there is no valve event """
+        with self.assertRaises(ValueError):
+            pressure_log.read_pressure_trace(io.StringIO('0.0 1.0\n0.1 2.0\n'), None)
+
+    def test_cache(self):
+        """ Test that a log is parsed only once """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'pressure.txt')
+            with open(path, 'w') as log_file:
+                log_file.write(self.log)
+            trace, pressure = pressure_log.read_pressure_trace(path, directory)
+            with patch.object(pressure_log, '_parse_stream') as parse:
+                cached_trace, cached_pressure = pressure_log.read_pressure_trace(
+                    path, directory)
+                parse.assert_not_called()
+            np.testing.assert_array_equal(trace, cached_trace)
+            self.assertEqual(pressure, cached_pressure)
+
+
+if __name__ == '__main__':
+    unittest.main()